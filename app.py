@@ -5,6 +5,8 @@ import socket
 import secrets
 import os
 from werkzeug.utils import secure_filename
+from backend.generations import generations, etag_cached
+from backend.layout import get_layout
 
 
 def get_local_ip() -> str:
@@ -26,6 +28,7 @@ SESSION_TOKEN = None
 QR_DATA_URL = None
 UPLOAD_ROOT = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_ROOT, exist_ok=True)
+upload_layout = get_layout(UPLOAD_ROOT)
 
 
 @app.route("/")
@@ -51,10 +54,11 @@ def upload_file(token: str):
     if f.filename == '':
         return jsonify({'error': 'no selected file'}), 400
     fname = secure_filename(f.filename)
-    dest_dir = os.path.join(UPLOAD_ROOT, token)
+    dest_dir = upload_layout.place(token)
     os.makedirs(dest_dir, exist_ok=True)
     dest_path = os.path.join(dest_dir, fname)
     f.save(dest_path)
+    generations.bump_token(token)
     return jsonify({'ok': True, 'filename': fname})
 
 
@@ -62,14 +66,15 @@ def upload_file(token: str):
 def serve_upload(token: str, filename: str):
     if token != SESSION_TOKEN:
         abort(404)
-    return send_from_directory(os.path.join(UPLOAD_ROOT, token), filename)
+    return send_from_directory(upload_layout.token_dir(token), filename)
 
 
 @app.route('/poll/<token>')
+@etag_cached('token:{token}')
 def poll_files(token: str):
     if token != SESSION_TOKEN:
         return jsonify({'files': []})
-    d = os.path.join(UPLOAD_ROOT, token)
+    d = upload_layout.token_dir(token)
     files = []
     if os.path.isdir(d):
         for name in sorted(os.listdir(d)):
@@ -1,30 +1,63 @@
 """REST API endpoints for storage, permissions, and QR functionality."""
 
-from flask import Blueprint, jsonify, request, send_from_directory, abort, url_for
-from werkzeug.utils import secure_filename
+from flask import Blueprint, jsonify, request, abort, url_for
 import os
+import time
 
-from ..storage import StorageSimulator
+from ..storage import StorageSimulator, sanitize_relative_path
 from ..permissions_manager import PermissionsManager
+from ..quotas import QuotaManager
+from ..generations import generations, etag_cached
+from ..streaming import stream_mode, stream_listing
+from ..media_variants import VariantCache, parse_variant_request
+from ..object_cache import object_cache
+from ..purge import UploadPurger
+from ..retention import RetentionEngine, access_tracker
+from ..bandwidth import IngestScheduler
+from ..event_log import event_log, elapsed_ms
+from ..upload_writer import upload_writer
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 storage = StorageSimulator()
+quota_manager = QuotaManager(storage.layout)
+variant_cache = VariantCache(os.path.join(os.path.dirname(storage.layout.root), 'cache', 'variants'))
+upload_purger = UploadPurger(storage, quota_manager)
+retention = RetentionEngine(storage, upload_purger)
+ingest = IngestScheduler()
 
 
 @api_bp.route('/storage/list/<token>', methods=['GET'])
+@etag_cached('token:{token}')
 def list_storage(token):
-    """List files in storage for a session."""
+    """List files in storage for a session (?stream=ndjson|json to stream)."""
+    mode = stream_mode()
+    if mode:
+        return stream_listing(storage.iter_files(session_token=token), mode, 'files')
     files = storage.get_file_list(session_token=token)
     return jsonify({'files': files})
 
 
 @api_bp.route('/storage/structure/<token>', methods=['GET'])
+@etag_cached('token:{token}')
 def get_storage_structure(token):
-    """Get complete directory structure for a session."""
-    struct = storage.get_directory_structure(session_token=token)
+    """Get one level of the directory structure for a session (?path=folder)."""
+    struct = storage.get_directory_structure(path=request.args.get('path'), session_token=token)
     return jsonify(struct)
 
 
+@api_bp.route('/storage/children/<token>', methods=['GET'])
+@etag_cached('token:{token}')
+def get_storage_children(token):
+    """
+    Lazily list the folders and files directly under ?path= (default: root).
+    Folders include file_count/total_size of their whole subtree.
+    """
+    children = storage.get_children(token, request.args.get('path', ''))
+    if children is None:
+        return jsonify({'error': 'folder not found'}), 404
+    return jsonify(children)
+
+
 @api_bp.route('/storage/stats/<token>', methods=['GET'])
 def get_storage_stats(token):
     """Get storage usage statistics for a session."""
@@ -32,26 +65,87 @@ def get_storage_stats(token):
     return jsonify(stats)
 
 
+@api_bp.route('/storage/upload-settings', methods=['GET'])
+def get_upload_settings():
+    """Concurrency, retry and client-side downscale settings for the upload pages."""
+    return jsonify(ingest.client_settings())
+
+
 @api_bp.route('/storage/upload/<token>', methods=['POST'])
 def upload_file(token):
     """Upload a file to a session."""
-    if 'file' not in request.files:
-        return jsonify({'error': 'no file part'}), 400
-    f = request.files['file']
-    if f.filename == '':
-        return jsonify({'error': 'no selected file'}), 400
-
-    fname = secure_filename(f.filename)
-    dest_dir = os.path.join(storage.base_path, token)
-    os.makedirs(dest_dir, exist_ok=True)
-    dest_path = os.path.join(dest_dir, fname)
-    f.save(dest_path)
+    # Admission check runs before request.files is touched, i.e. before the
+    # multipart body is streamed anywhere. Content-Length is an upper bound on
+    # the file size; the reservation is trimmed to the real size on commit.
+    started = time.perf_counter()
+    declared = request.content_length
+    if declared is None:
+        event_log.emit('upload_rejected', token=token, status=411, reason='no content length',
+                       client=request.remote_addr)
+        return jsonify({'error': 'Content-Length required for uploads'}), 411
+    rejected = quota_manager.reserve(token, declared)
+    if rejected:
+        status, payload = rejected
+        event_log.emit('upload_rejected', token=token, status=status, reason=payload.get('error'),
+                       declared_bytes=declared, client=request.remote_addr)
+        return jsonify(payload), status
+
+    def reject(reason):
+        quota_manager.release(token, declared)
+        event_log.emit('upload_rejected', token=token, status=400, reason=reason, declared_bytes=declared,
+                       duration_ms=elapsed_ms(started), client=request.remote_addr)
+        return jsonify({'error': reason}), 400
+
+    # The body is read through the bandwidth scheduler (per-device limits, fair queue)
+    ingest_stream = ingest.attach(request.environ, token, declared)
+    try:
+        if 'file' not in request.files:
+            return reject('no file part')
+        f = request.files['file']
+        if f.filename == '':
+            return reject('no selected file')
+
+        # Folder structure is kept when the client sends a relative path
+        # (e.g. "DCIM/Camera/IMG_1.jpg"); each segment is sanitized.
+        fname = sanitize_relative_path(request.form.get('relative_path') or f.filename)
+        if not fname:
+            return reject('invalid file name')
+        dest_path = storage.resolve_path(token, fname)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Written to a hidden temp file and renamed into place by commit(),
+        # so a failed upload never leaves a truncated file under its name
+        pending = upload_writer.open(dest_path, declared)
+        try:
+            f.save(pending.file)
+        except BaseException:
+            upload_writer.abort(pending)
+            raise
+    except Exception as e:
+        quota_manager.release(token, declared)
+        event_log.emit('upload_failed', token=token, declared_bytes=declared, error=str(e),
+                       received_bytes=ingest_stream.received, duration_ms=elapsed_ms(started),
+                       client=request.remote_addr)
+        raise
+    finally:
+        ingest.detach(ingest_stream)
+    try:
+        upload_writer.commit(pending)
+    except OSError as e:
+        quota_manager.release(token, declared)
+        event_log.emit('upload_failed', token=token, path=fname, declared_bytes=declared, error=str(e),
+                       stage='commit', duration_ms=elapsed_ms(started), client=request.remote_addr)
+        return jsonify({'error': 'Failed to store file'}), 500
+    stored_size, replaced = pending.size, pending.replaced
+    quota_manager.commit(token, declared, stored_size - replaced)
+    storage.record_file(token, fname, stored_size)
+    object_cache.invalidate(dest_path)
+    generations.bump_token(token)
     
     # Track file in SESSIONS
     from ..app import SESSIONS
     if token not in SESSIONS:
         SESSIONS[token] = {'granted': False, 'created_at': '', 'files': []}
-    SESSIONS[token]['files'].append({'name': fname, 'size': os.path.getsize(dest_path)})
+    SESSIONS[token]['files'].append({'name': fname, 'size': stored_size})
     
     # Update device activity if this is a pairing token
     try:
@@ -59,17 +153,84 @@ def upload_file(token):
         pairing_manager.update_device_activity(token)
     except Exception:
         pass  # Not a pairing token or error updating activity
-    
+
+    event_log.emit('upload', token=token, path=fname, bytes=stored_size, declared_bytes=declared,
+                   replaced_bytes=replaced, content_type=f.mimetype, duration_ms=elapsed_ms(started),
+                   durability=upload_writer.settings['mode'], client=request.remote_addr)
     return jsonify({'ok': True, 'filename': fname})
 
 
-@api_bp.route('/storage/download/<token>/<filename>', methods=['GET'])
+@api_bp.route('/search', methods=['GET'])
+def search_files():
+    """
+    Find files by name across all uploads, newest first.
+    ?q= name substring, ?type=image|video|other, ?token=, ?min_size= / ?max_size= bytes,
+    ?page= (from 1), ?per_page= (default 50, at most 200).
+    """
+    try:
+        page = max(1, int(request.args.get('page') or 1))
+        per_page = min(200, max(1, int(request.args.get('per_page') or 50)))
+        min_size = int(request.args['min_size']) if request.args.get('min_size') else None
+        max_size = int(request.args['max_size']) if request.args.get('max_size') else None
+        found = storage.search.search(
+            request.args.get('q', ''), kind=request.args.get('type') or None,
+            token=request.args.get('token') or None, min_size=min_size, max_size=max_size,
+            offset=(page - 1) * per_page, limit=per_page
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    for item in found['results']:
+        item['url'] = url_for('serve_upload', token=item['token'], filename=item['path'])
+    found.update({'page': page, 'per_page': per_page})
+    return jsonify(found)
+
+
+@api_bp.route('/storage/download/<token>/<path:filename>', methods=['GET'])
 def download_file(token, filename):
-    """Download a file from a session."""
-    session_path = os.path.join(storage.base_path, token)
+    """Download a file (optionally inside folders) from a session."""
+    session_path = storage.resolve_path(token)
     if not os.path.isdir(session_path):
         abort(404)
-    return send_from_directory(session_path, secure_filename(filename))
+    rel_path = sanitize_relative_path(filename)
+    file_path = storage.resolve_path(token, rel_path)
+    if not rel_path or not os.path.isfile(file_path):
+        abort(404)
+    access_tracker.touch(file_path)
+    return object_cache.serve(file_path)
+
+
+@api_bp.route('/media/<token>/<path:filename>', methods=['GET'])
+def get_media_variant(token, filename):
+    """
+    Serve a resized/transcoded image variant, e.g. ?w=640&fmt=webp&q=80.
+    Widths snap up to fixed buckets and are never upscaled.
+    """
+    rel_path = sanitize_relative_path(filename)
+    source = storage.resolve_path(token, rel_path)
+    if not rel_path or not os.path.isfile(source):
+        abort(404)
+    params = parse_variant_request(rel_path, request.args)
+    if params is None:
+        return jsonify({'error': 'unsupported image or variant parameters'}), 415
+
+    # Viewing a thumbnail counts as using the original for retention
+    access_tracker.touch(source)
+    width, fmt, quality = params
+    for _attempt in range(2):
+        try:
+            path, mimetype = variant_cache.get_variant(source, width, fmt, quality)
+        except ValueError:
+            return jsonify({'error': 'file is not a readable image'}), 415
+        try:
+            response = object_cache.serve(path, mimetype)
+            break
+        except FileNotFoundError:
+            continue  # evicted between rendering and serving; render it again
+    else:
+        # Evicted twice in a row (cache far too small): serve the original
+        response = object_cache.serve(source)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @api_bp.route('/permissions/all', methods=['GET'])
@@ -1,13 +1,16 @@
 """Phone Storage Educator - Flask Backend with Local Network Sync."""
 
-from flask import Flask, render_template, request, jsonify
+import time
+_imports_started = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, jsonify, abort, g
 import base64
-import socket
 import secrets
 import os
 import sys
 import logging
 import json
+import threading
 
 # Suppress Flask startup messages
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
@@ -22,9 +25,9 @@ from qr_generator import generate_qr_png_bytes
 
 # Import API blueprint (use absolute import for direct script execution)
 try:
-    from backend.api import api_bp
+    from backend.api import api_bp, ingest, quota_manager, retention, storage, upload_purger, variant_cache
 except ImportError:
-    from api import api_bp
+    from api import api_bp, ingest, quota_manager, retention, storage, upload_purger, variant_cache
 
 # Import pairing manager for device pairing and local network sync
 try:
@@ -32,6 +35,60 @@ try:
 except ImportError:
     from pairing import pairing_manager
 
+try:
+    from backend.gallery_utils import PhotoGalleryManager
+except ImportError:
+    from gallery_utils import PhotoGalleryManager
+
+try:
+    from backend.generations import etag_cached
+except ImportError:
+    from generations import etag_cached
+
+try:
+    from backend.streaming import stream_mode, stream_listing
+except ImportError:
+    from streaming import stream_mode, stream_listing
+
+try:
+    from backend.catalog import catalog_cache
+    from backend.event_log import event_log
+    from backend.object_cache import object_cache
+    from backend.retention import access_tracker
+    from backend.storage import sanitize_relative_path
+except ImportError:
+    from catalog import catalog_cache
+    from event_log import event_log
+    from object_cache import object_cache
+    from retention import access_tracker
+    from storage import sanitize_relative_path
+
+try:
+    from backend.request_profiler import request_profiler
+    from backend.startup_profile import startup_profiler
+    from backend.upload_writer import upload_writer
+except ImportError:
+    from request_profiler import request_profiler
+    from startup_profile import startup_profiler
+    from upload_writer import upload_writer
+
+try:
+    from backend.duplicates import DuplicateFinder
+    from backend.netaddr import local_address
+    from backend.pairing_pool import PairingQRPool
+    from backend.ratelimit import KeyedRateLimiter, too_many_requests
+    from backend.scrubber import StorageScrubber, walk_files
+except ImportError:
+    from duplicates import DuplicateFinder
+    from netaddr import local_address
+    from pairing_pool import PairingQRPool
+    from ratelimit import KeyedRateLimiter, too_many_requests
+    from scrubber import StorageScrubber, walk_files
+
+# qrcode/PIL and cryptography are imported on first use, not here
+startup_profiler.set_origin(_imports_started)
+startup_profiler.record('imports', time.perf_counter() - _imports_started)
+
 app = Flask(
     __name__,
     static_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static'),
@@ -41,26 +98,79 @@ app = Flask(
 # Register API blueprint
 app.register_blueprint(api_bp)
 
+
+# Every request other than an upload counts as interactive: while any is in
+# flight, bulk uploads leave part of the shared ingest budget unused
+@app.before_request
+def mark_interactive():
+    if request.endpoint != 'api.upload_file':
+        g.interactive = True
+        ingest.begin_interactive()
+
+
+@app.teardown_request
+def unmark_interactive(exc):
+    if g.pop('interactive', False):
+        ingest.end_interactive()
+
+
+# Admin-toggled profiling; app-level hooks also cover every api_bp route
+@app.before_request
+def start_profiling():
+    profiled = request_profiler.begin()
+    if profiled is not None:
+        g.profiled = profiled
+
+
+@app.after_request
+def note_response(response):
+    if 'profiled' in g:
+        g.response_status = response.status_code
+        g.response_bytes = response.calculate_content_length()
+    return response
+
+
+@app.teardown_request
+def finish_profiling(exc):
+    profiled = g.pop('profiled', None)
+    if profiled is not None:
+        request_profiler.finish(profiled, {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'token': (request.view_args or {}).get('token'),
+            'request_bytes': request.content_length,
+            'status': g.get('response_status', 500 if exc else None),
+            'response_bytes': g.get('response_bytes')
+        })
+
 # runtime session token and qr data
 SESSION_TOKEN = None
 QR_DATA_URL = None
-UPLOAD_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-os.makedirs(UPLOAD_ROOT, exist_ok=True)
+UPLOAD_ROOT = storage.layout.root
 
 # Track all sessions
 SESSIONS = {}  # {token: {granted: bool, created_at: timestamp, files: [...]}
 
+# Pending pairings with pre-rendered QR codes, refilled in the background
+pairing_pool = PairingQRPool(pairing_manager, generate_qr_png_bytes, local_address, port=5000)
+
+# Per-client limits: an operator can hand out ~10 QR codes back to back;
+# confirmations are rare, so token guessing is slowed to a crawl
+pairing_generate_limiter = KeyedRateLimiter(rate=1.0, burst=10)
+pairing_confirm_limiter = KeyedRateLimiter(rate=0.2, burst=5)
+
+# Reconciles upload directories with SESSIONS, pairings and the folder index
+scrubber = StorageScrubber(storage, pairing_manager, SESSIONS, upload_purger)
+
+# Hashes photos in the background and groups near-duplicates across tokens
+duplicates = DuplicateFinder(storage.search, storage.layout)
+
 
 def get_local_ip() -> str:
-    """Return a likely local IP address; fallback to '0.0.0.0' on error."""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return "0.0.0.0"
+    """Return a likely local IP address (cached; refreshed on interface changes)."""
+    return local_address.get()
 
 
 @app.route("/")
@@ -113,6 +223,17 @@ def admin_page():
     return render_template('admin.html')
 
 
+@app.route('/uploads/<token>/<path:filename>')
+def serve_upload(token: str, filename: str):
+    """Serve an uploaded file; small files come from the in-memory hot cache."""
+    rel_path = sanitize_relative_path(filename)
+    file_path = storage.resolve_path(token, rel_path)
+    if not rel_path or not os.path.isfile(file_path):
+        abort(404)
+    access_tracker.touch(file_path)
+    return object_cache.serve(file_path)
+
+
 @app.route('/generate', methods=['POST'])
 def generate_qr():
     """Generate QR code endpoint (legacy, for main page QR maker)."""
@@ -146,34 +267,171 @@ def grant_permission(token: str):
     return jsonify({'ok': True})
 
 
+SESSION_SORTS = ('created_at', 'token', 'file_count', 'total_size')
+MAX_PAGE_SIZE = 200
+
+
+def session_summary(token: str, session: dict) -> dict:
+    """Session metadata with file count and bytes from the cached folder index."""
+    file_count, total_size = storage.index.summary(token)
+    return {
+        'token': token,
+        'granted': session.get('granted', False),
+        'created_at': session.get('created_at', ''),
+        'file_count': file_count,
+        'total_size': total_size
+    }
+
+
+def int_arg(name: str, default=None):
+    """Integer query parameter; raises ValueError when malformed."""
+    value = request.args.get(name, '')
+    return int(value) if value != '' else default
+
+
 @app.route('/api/admin/sessions', methods=['GET'])
 def admin_sessions():
-    """Get all sessions with their file data."""
-    sessions_data = []
-    for token, session in SESSIONS.items():
-        files = []
-        session_path = os.path.join(UPLOAD_ROOT, token)
-        if os.path.isdir(session_path):
-            for fname in os.listdir(session_path):
-                fpath = os.path.join(session_path, fname)
-                if os.path.isfile(fpath):
-                    files.append({
-                        'name': fname,
-                        'size': os.path.getsize(fpath)
-                    })
-        
-        sessions_data.append({
-            'token': token,
-            'granted': session.get('granted', False),
-            'created_at': session.get('created_at', ''),
-            'files': files,
-            'file_count': len(files)
-        })
-    
-    return jsonify({'sessions': sessions_data})
+    """
+    One page of session summaries (no file lists; see /api/admin/sessions/<token>/files).
+
+    ?q= token prefix, ?since= / ?until= date (YYYY-MM-DD, inclusive),
+    ?min_size= / ?max_size= bytes, ?sort=created_at|token|file_count|total_size,
+    ?order=desc|asc, ?page= (from 1), ?per_page= (default 50, at most 200).
+    """
+    try:
+        page = max(1, int_arg('page', 1))
+        per_page = min(MAX_PAGE_SIZE, max(1, int_arg('per_page', 50)))
+        min_size = int_arg('min_size')
+        max_size = int_arg('max_size')
+    except ValueError:
+        return jsonify({'error': 'page, per_page, min_size and max_size must be integers'}), 400
+    sort = request.args.get('sort', 'created_at')
+    if sort not in SESSION_SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(SESSION_SORTS)}"}), 400
+    descending = request.args.get('order', 'desc') != 'asc'
+    prefix = request.args.get('q', '').strip()
+    since = request.args.get('since', '')
+    until = request.args.get('until', '')
+
+    # Metadata filters first: they cost nothing
+    rows = [
+        (token, session) for token, session in list(SESSIONS.items())
+        if token.startswith(prefix)
+        and (not since or session.get('created_at', '') >= since)
+        and (not until or session.get('created_at', '')[:len(until)] <= until)
+    ]
+    start = (page - 1) * per_page
+    if sort in ('file_count', 'total_size') or min_size is not None or max_size is not None:
+        # Size filters and sorts need every candidate's aggregates (cached after first use)
+        items = [session_summary(token, session) for token, session in rows]
+        items = [
+            item for item in items
+            if (min_size is None or item['total_size'] >= min_size)
+            and (max_size is None or item['total_size'] <= max_size)
+        ]
+        items.sort(key=lambda item: item[sort], reverse=descending)
+        total = len(items)
+        sessions = items[start:start + per_page]
+    else:
+        rows.sort(key=lambda row: row[0] if sort == 'token' else row[1].get('created_at', ''),
+                  reverse=descending)
+        total = len(rows)
+        sessions = [session_summary(token, session) for token, session in rows[start:start + per_page]]
+
+    return jsonify({
+        'sessions': sessions,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    })
+
+
+@app.route('/api/admin/sessions/<token>/files', methods=['GET'])
+def admin_session_files(token: str):
+    """Files of one session, on demand (?offset=, ?limit= default 500)."""
+    if token not in SESSIONS:
+        return jsonify({'error': 'session not found'}), 404
+    try:
+        offset = max(0, int_arg('offset', 0))
+        limit = min(5000, max(1, int_arg('limit', 500)))
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    file_count, total_size = storage.index.summary(token)
+    return jsonify({
+        'token': token,
+        'file_count': file_count,
+        'total_size': total_size,
+        'offset': offset,
+        'files': storage.index.list_files(token, offset, limit)
+    })
+
+
+@app.route('/api/admin/quotas', methods=['GET'])
+def admin_get_quotas():
+    """Get upload quota limits and current usage counters."""
+    return jsonify(quota_manager.get_status())
+
+
+@app.route('/api/admin/quotas', methods=['POST'])
+def admin_update_quotas():
+    """
+    Adjust upload quota limits live.
+    Body may set token_limit, global_limit, min_free (bytes, null = unlimited)
+    and overrides: {token: bytes | null | "default"}.
+    """
+    data = request.get_json() or {}
+    try:
+        status = quota_manager.update_limits(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limits must be integers or null'}), 400
+    return jsonify({'ok': True, **status})
+
+
+@app.route('/api/admin/bandwidth', methods=['GET'])
+def admin_get_bandwidth():
+    """Upload bandwidth limits and the uploads currently being received."""
+    return jsonify(ingest.get_status())
+
+
+@app.route('/api/admin/bandwidth', methods=['POST'])
+def admin_update_bandwidth():
+    """
+    Adjust upload bandwidth limits live.
+    Body may set total_rate, token_rate, small_upload (bytes, null = unlimited),
+    interactive_reserve (0..1) and overrides: {token: bytes per second | null | "default"}.
+    """
+    data = request.get_json() or {}
+    try:
+        status = ingest.update_limits(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'ok': True, **status})
+
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def admin_cache_stats():
+    """Hit rates and usage of the caches, pairing QR pool and purge backlog."""
+    return jsonify({
+        'object_cache': object_cache.get_stats(),
+        'variant_cache': variant_cache.get_stats(),
+        'pairing_pool': pairing_pool.get_stats(),
+        'upload_purge': upload_purger.get_stats(),
+        'search_index': storage.search.get_stats(),
+        'event_log': event_log.get_stats()
+    })
+
+
+@app.route('/api/admin/search-index/rebuild', methods=['POST'])
+def admin_rebuild_search_index():
+    """Re-index every upload from disk in the background."""
+    threading.Thread(target=storage.search.rebuild, name='search-rebuild', daemon=True).start()
+    return jsonify({'ok': True, 'message': 'Search index rebuild started'})
 
 
 @app.route('/api/admin/paired-devices', methods=['GET'])
+# Device "active" flags expire with time, so the active count is part of the key
+@etag_cached('pairing', 'uploads', lambda: pairing_manager.count_active_devices())
 def admin_paired_devices():
     """Get all paired devices with real-time statistics."""
     devices = pairing_manager.get_all_devices_with_stats()
@@ -198,33 +456,73 @@ def admin_paired_devices():
 
 
 @app.route('/api/gallery/<token>', methods=['GET'])
+@etag_cached('token:{token}')
 def get_gallery(token: str):
-    """Get gallery files for a session."""
-    session_path = os.path.join(UPLOAD_ROOT, token)
-    gallery_files = []
-    
-    if os.path.isdir(session_path):
-        for fname in os.listdir(session_path):
-            fpath = os.path.join(session_path, fname)
-            if os.path.isfile(fpath):
-                # Check if it's an image or video
-                ext = os.path.splitext(fname)[1].lower()
-                if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']:
-                    gallery_files.append({
-                        'name': fname,
-                        'type': 'image',
-                        'path': f'/uploads/{token}/{fname}',
-                        'size': os.path.getsize(fpath)
-                    })
-                elif ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm']:
-                    gallery_files.append({
-                        'name': fname,
-                        'type': 'video',
-                        'path': f'/uploads/{token}/{fname}',
-                        'size': os.path.getsize(fpath)
-                    })
-    
-    return jsonify({'gallery': gallery_files})
+    """Get gallery files for a session (?stream=ndjson|json to stream)."""
+    mode = stream_mode()
+    if mode:
+        return stream_listing(iter_gallery(token), mode, 'gallery')
+    return jsonify({'gallery': list(iter_gallery(token))})
+
+
+@app.route('/api/gallery/<token>/stats', methods=['GET'])
+@etag_cached('token:{token}')
+def get_gallery_stats(token: str):
+    """Photo/video counts, bytes by type and a per-month histogram for a session."""
+    catalog = catalog_cache.get(token, storage.resolve_path(token), PhotoGalleryManager.get_media_type)
+    return jsonify({
+        **PhotoGalleryManager.get_stats(catalog),
+        'bytes_by_type': catalog.bytes_by_type(),
+        'months': catalog.month_histogram()
+    })
+
+
+def with_urls(groups: list) -> list:
+    """Duplicate groups with a serving URL on every file."""
+    return [
+        {**group, 'files': [{**f, 'url': f"/uploads/{f['token']}/{f['path']}"} for f in group['files']]}
+        for group in groups
+    ]
+
+
+@app.route('/api/gallery/<token>/duplicates', methods=['GET'])
+def get_gallery_duplicates(token: str):
+    """Groups of near-duplicate photos within one session, largest savings first."""
+    groups = duplicates.groups(token)
+    return jsonify({
+        'groups': with_urls(groups),
+        'reclaimable_bytes': sum(g['reclaimable'] for g in groups),
+        'status': duplicates.get_stats()
+    })
+
+
+def iter_gallery(token: str):
+    """Lazily yield image and video entries for a session directory and its subfolders."""
+    for rel_path, entry in walk_files(storage.resolve_path(token)):
+        fname = entry.name
+        # Check if it's an image or video
+        ext = os.path.splitext(fname)[1].lower()
+        try:
+            if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']:
+                yield {
+                    'name': fname,
+                    'type': 'image',
+                    'path': f'/uploads/{token}/{rel_path}',
+                    'size': entry.stat().st_size
+                }
+            elif ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm']:
+                fstat = entry.stat()
+                video = {
+                    'name': fname,
+                    'type': 'video',
+                    'path': f'/uploads/{token}/{rel_path}',
+                    'size': fstat.st_size
+                }
+                # Header-only probe (cached); never reads the media payload
+                video.update(PhotoGalleryManager.get_video_metadata(entry.path, fstat))
+                yield video
+        except OSError:
+            continue  # deleted while listing
 
 
 # ===== Local Network Sync & Device Pairing Routes =====
@@ -248,24 +546,22 @@ def generate_pairing_qr():
     Phone scans this QR to pair with the PC.
     QR contains a URL that auto-redirects to pair-confirm page.
     """
-    local_ip = get_local_ip()
-    port = 5000  # Assuming Flask runs on 5000
-    device_name = request.json.get('device_name', 'My PC') if request.json else 'My PC'
+    retry_after = pairing_generate_limiter.check(request.remote_addr)
+    if retry_after:
+        return too_many_requests(retry_after, 'too many pairing requests')
     
-    # Generate pairing URL and data
-    pairing_url, pairing_data = pairing_manager.get_pairing_qr_url(local_ip, port, device_name)
+    device_name = request.json.get('device_name', 'My PC') if request.json else 'My PC'
     
-    # Generate QR code from the URL (not JSON)
-    # When scanned on phone, this URL opens directly in browser
-    img_bytes = generate_qr_png_bytes(pairing_url)
-    qr_data_url = "data:image/png;base64," + base64.b64encode(img_bytes).decode("ascii")
+    # Pairings are registered and their QR codes (which encode the URL, not
+    # JSON, so scanning opens the browser directly) rendered ahead of time
+    prepared = pairing_pool.take(device_name)
     
     return jsonify({
-        'qr_data_url': qr_data_url,
-        'pairing_url': pairing_url,
-        'pairing_token': pairing_data['pairing_token'],
-        'device_id': pairing_data['device_id'],
-        'pairing_data': pairing_data
+        'qr_data_url': prepared.qr_data_url,
+        'pairing_url': prepared.pairing_url,
+        'pairing_token': prepared.pairing_data['pairing_token'],
+        'device_id': prepared.pairing_data['device_id'],
+        'pairing_data': prepared.pairing_data
     })
 
 
@@ -275,6 +571,10 @@ def confirm_pairing():
     Confirm device pairing from phone side.
     Phone sends pairing token, its device ID and name.
     """
+    retry_after = pairing_confirm_limiter.check(request.remote_addr)
+    if retry_after:
+        return too_many_requests(retry_after, 'too many pairing attempts')
+    
     data = request.get_json()
     pairing_token = data.get('pairing_token')
     phone_device_id = data.get('phone_device_id')
@@ -296,6 +596,7 @@ def confirm_pairing():
 
 
 @app.route('/api/pairing/devices', methods=['GET'])
+@etag_cached('pairing')
 def get_paired_devices():
     """Get list of all paired devices on local network."""
     devices = pairing_manager.get_paired_devices()
@@ -325,6 +626,9 @@ def sync_files(token: str):
     
     # Update sync info
     pairing_manager.update_sync_info(token, files)
+    event_log.emit('sync', token=token, files=len(files),
+                   bytes=sum(f.get('size') or 0 for f in files if isinstance(f, dict)),
+                   client=request.remote_addr)
     
     return jsonify({
         'ok': True,
@@ -333,6 +637,275 @@ def sync_files(token: str):
     })
 
 
+@app.route('/api/admin/bulk', methods=['POST'])
+def admin_bulk_action():
+    """
+    Apply one action to many pairings/sessions at once.
+    
+    Body:
+        action:  'revoke' | 'expire' | 'purge' (delete uploads only)
+        tokens:  explicit list of tokens, or
+        filter:  {"status": "pending|expired|inactive|confirmed|all", "inactive_days": 30}
+        purge_uploads: also delete uploads when revoking (default false)
+        dry_run: only report what would be affected (default false)
+    
+    Registry changes are committed with a single write; uploads are
+    detached immediately and deleted in the background.
+    """
+    data = request.get_json() or {}
+    action = data.get('action')
+    if action not in ('revoke', 'expire', 'purge'):
+        return jsonify({'error': "action must be 'revoke', 'expire' or 'purge'"}), 400
+    
+    if 'tokens' in data:
+        tokens = data['tokens']
+        if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+            return jsonify({'error': 'tokens must be a list of strings'}), 400
+    else:
+        selector = data.get('filter') or {}
+        try:
+            tokens = pairing_manager.select_tokens(selector.get('status', 'all'), selector.get('inactive_days'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    tokens = list(dict.fromkeys(tokens))
+    purge_uploads = action == 'purge' or bool(data.get('purge_uploads'))
+    
+    if data.get('dry_run'):
+        preview = pairing_manager.describe_tokens(tokens)
+        if purge_uploads:
+            for item in preview:
+                exists = os.path.isdir(storage.layout.token_dir(item['token']))
+                usage = (storage.get_children(item['token']) if exists else None) or {}
+                item['file_count'] = usage.get('file_count', 0)
+                item['total_size'] = usage.get('total_size', 0)
+        return jsonify({'ok': True, 'dry_run': True, 'action': action, 'count': len(tokens), 'tokens': preview})
+    
+    if action == 'revoke':
+        affected = pairing_manager.bulk_revoke(tokens)
+    elif action == 'expire':
+        affected = pairing_manager.bulk_expire(tokens)
+    else:
+        affected = []
+    
+    purged = []
+    if purge_uploads:
+        for token in tokens:
+            if upload_purger.purge(token):
+                purged.append(token)
+                if token in SESSIONS:
+                    SESSIONS[token]['files'] = []
+    
+    return jsonify({
+        'ok': True,
+        'dry_run': False,
+        'action': action,
+        'count': len(affected) if action != 'purge' else len(purged),
+        'tokens': affected if action != 'purge' else purged,
+        'purged': purged
+    })
+
+
+@app.route('/api/admin/scrub', methods=['GET'])
+def admin_scrub_status():
+    """Progress, last pass summary and findings of the storage scrubber."""
+    return jsonify(scrubber.get_status())
+
+
+@app.route('/api/admin/scrub', methods=['POST'])
+def admin_scrub_action():
+    """
+    Start a scrub pass now, or repair findings from the last pass.
+    
+    Body:
+        {"action": "start"}
+        {"action": "repair", "kinds": ["partial", ...], "dry_run": true}
+    Without "kinds", only the safe kinds are repaired; "truncated" and
+    "orphan_dir" change data only when listed explicitly.
+    """
+    data = request.get_json() or {}
+    action = data.get('action')
+    if action == 'start':
+        scrubber.run_now()
+        return jsonify({'ok': True, 'message': 'Scrub pass scheduled'})
+    if action == 'repair':
+        try:
+            result = scrubber.repair(data.get('kinds'), bool(data.get('dry_run')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'ok': True, **result})
+    return jsonify({'error': "action must be 'start' or 'repair'"}), 400
+
+
+@app.route('/api/admin/retention', methods=['GET'])
+def admin_retention_status():
+    """Retention policy, schedule, current progress and last run."""
+    return jsonify(retention.get_status())
+
+
+@app.route('/api/admin/retention', methods=['POST'])
+def admin_update_retention():
+    """
+    Update the retention policy live, e.g.:
+    {"enabled": true, "max_age_days": 14, "token_budget": 2147483648, "high_water": 0.9}
+    """
+    data = request.get_json() or {}
+    try:
+        status = retention.update_policy(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'ok': True, **status})
+
+
+@app.route('/api/admin/retention/run', methods=['POST'])
+def admin_run_retention():
+    """Run retention now in the background ({"dry_run": true} only plans)."""
+    data = request.get_json() or {}
+    retention.run_now(dry_run=bool(data.get('dry_run')))
+    return jsonify({'ok': True, 'message': 'Retention run scheduled'})
+
+
+@app.route('/api/admin/duplicates', methods=['GET'])
+def admin_duplicates():
+    """Near-duplicate photo groups across all sessions (?token=, ?page=, ?per_page=)."""
+    try:
+        page = max(1, int_arg('page', 1))
+        per_page = min(MAX_PAGE_SIZE, max(1, int_arg('per_page', 50)))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    groups = duplicates.groups(request.args.get('token') or None)
+    start = (page - 1) * per_page
+    return jsonify({
+        'groups': with_urls(groups[start:start + per_page]),
+        'total': len(groups),
+        'page': page,
+        'per_page': per_page,
+        'pages': (len(groups) + per_page - 1) // per_page,
+        'reclaimable_bytes': sum(g['reclaimable'] for g in groups),
+        'status': duplicates.get_stats()
+    })
+
+
+@app.route('/api/admin/duplicates', methods=['POST'])
+def admin_duplicates_action():
+    """
+    Rescan now, or delete duplicates to reclaim space.
+
+    Body:
+        {"action": "scan"}
+        {"action": "reclaim", "files": [{"token": "...", "path": "..."}], "dry_run": true}
+    Reclaim only ever deletes the files listed: groups are approximate
+    (members may be up to twice the threshold apart), so what goes is
+    chosen by whoever reviewed them.
+    """
+    data = request.get_json() or {}
+    action = data.get('action')
+    if action == 'scan':
+        duplicates.run_now()
+        return jsonify({'ok': True, 'message': 'Duplicate scan scheduled'})
+    if action != 'reclaim':
+        return jsonify({'error': "action must be 'scan' or 'reclaim'"}), 400
+
+    files = data.get('files')
+    if not files or not isinstance(files, list) or not all(isinstance(f, dict) and f.get('token') and f.get('path')
+                                                           for f in files):
+        return jsonify({'error': 'files must be a non-empty list of {"token", "path"} objects'}), 400
+
+    selected = [{'token': f['token'], 'path': f['path'], 'size': f.get('size')} for f in files]
+    if data.get('dry_run'):
+        return jsonify({'ok': True, 'dry_run': True, 'count': len(selected), 'files': selected})
+
+    deleted, failed, freed = [], [], 0
+    for f in selected:
+        try:
+            freed += upload_purger.remove_file(f['token'], f['path'])
+            deleted.append(f)
+        except Exception as e:
+            failed.append({**f, 'error': str(e)})
+    event_log.emit('cleanup', kind='duplicates', deleted=len(deleted), failed=len(failed), freed_bytes=freed)
+    duplicates.run_now()  # regroup without the deleted copies
+    return jsonify({'ok': True, 'dry_run': False, 'count': len(deleted), 'freed_bytes': freed,
+                    'files': deleted, 'failed': failed})
+
+
+@app.route('/api/admin/profiling', methods=['GET'])
+def admin_profiling_status():
+    """Profiling settings, counters and captured slow requests."""
+    return jsonify(request_profiler.get_status())
+
+
+@app.route('/api/admin/profiling', methods=['POST'])
+def admin_update_profiling():
+    """
+    Change profiling settings live, e.g.:
+    {"enabled": true, "sample_rate": 0.1, "mode": "cprofile", "slow_ms": 500}
+    or {"action": "reset"} to clear captures and aggregates.
+    """
+    data = request.get_json() or {}
+    if data.get('action') == 'reset':
+        request_profiler.reset()
+        return jsonify({'ok': True, **request_profiler.get_status()})
+    try:
+        status = request_profiler.update_settings(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'ok': True, **status})
+
+
+def profile_download(render, filename: str, mimetype: str):
+    """Serve one profile report (?capture=<id> for a slow request, else the aggregate)."""
+    try:
+        capture = int_arg('capture')
+        body = render(capture)
+    except ValueError:
+        return jsonify({'error': 'capture must be an integer'}), 400
+    except KeyError:
+        return jsonify({'error': 'capture not found (it may have been rotated out)'}), 404
+    if body is None:
+        return jsonify({'error': 'no profile data of this kind recorded yet'}), 404
+    if capture is not None:
+        filename = f'request-{capture}-{filename}'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/api/admin/profiling/pstats', methods=['GET'])
+def admin_profiling_pstats():
+    """cProfile data loadable with pstats.Stats(path), snakeviz or gprof2dot."""
+    return profile_download(request_profiler.pstats_dump, 'profile.pstats', 'application/octet-stream')
+
+
+@app.route('/api/admin/profiling/collapsed', methods=['GET'])
+def admin_profiling_collapsed():
+    """Sampled stacks in collapsed format, for flamegraph.pl or speedscope."""
+    return profile_download(request_profiler.collapsed, 'stacks.collapsed', 'text/plain')
+
+
+@app.route('/api/admin/profiling/top', methods=['GET'])
+def admin_profiling_top():
+    """Readable top-functions report of the cProfile data."""
+    return profile_download(request_profiler.top_functions, 'profile-top.txt', 'text/plain')
+
+
+@app.route('/api/admin/durability', methods=['GET'])
+def admin_durability_status():
+    """Upload durability settings and commit counters."""
+    return jsonify(upload_writer.get_status())
+
+
+@app.route('/api/admin/durability', methods=['POST'])
+def admin_update_durability():
+    """
+    Change how uploads are made durable, e.g.:
+    {"mode": "grouped", "group_window_ms": 20} or {"mode": "none"}
+    """
+    data = request.get_json() or {}
+    try:
+        status = upload_writer.update_settings(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'ok': True, **status})
+
+
 @app.route('/api/admin/cleanup-inactive', methods=['POST'])
 def cleanup_inactive_devices():
     """Remove devices inactive for more than specified days (default: 30)."""
@@ -340,6 +913,7 @@ def cleanup_inactive_devices():
     days = data.get('days', 30)  # Default 30 days
     
     removed_count = pairing_manager.cleanup_inactive_devices(days)
+    event_log.emit('cleanup', kind='inactive_devices', days=days, removed=removed_count)
     
     return jsonify({
         'ok': True,
@@ -349,8 +923,15 @@ def cleanup_inactive_devices():
 
 
 if __name__ == "__main__":
+    # --profile-startup prints per-phase timings (imports, registry load,
+    # cert check, QR render) once the pairing registry has finished loading
+    profile_startup = '--profile-startup' in sys.argv
+    # --ecdsa serves a P-256 certificate (cheaper handshakes than RSA-2048)
+    cert_type = 'ecdsa' if '--ecdsa' in sys.argv else 'rsa'
+
     # create a per-run session token and generate a QR that points to the session URL
-    local_ip = get_local_ip()
+    with startup_profiler.phase('local ip lookup'):
+        local_ip = get_local_ip()
     host = local_ip if local_ip != "0.0.0.0" else "0.0.0.0"
     SESSION_TOKEN = secrets.token_urlsafe(16)
     
@@ -365,8 +946,9 @@ if __name__ == "__main__":
     # build a URL that the phone should open when scanning
     session_url = f"http://{local_ip}:5000/session/{SESSION_TOKEN}"
     # generate QR data url for embedding in the desktop page
-    img_bytes = generate_qr_png_bytes(session_url)
-    QR_DATA_URL = "data:image/png;base64," + base64.b64encode(img_bytes).decode("ascii")
+    with startup_profiler.phase('QR render'):
+        img_bytes = generate_qr_png_bytes(session_url)
+        QR_DATA_URL = "data:image/png;base64," + base64.b64encode(img_bytes).decode("ascii")
 
     # write values into app global namespace so routes see them
     globals()['SESSION_TOKEN'] = SESSION_TOKEN
@@ -380,14 +962,15 @@ if __name__ == "__main__":
     # Try to enable TLS
     cert_file, key_file = None, None
     try:
-        from backend.tls_setup import generate_self_signed_cert
+        from backend.tls_setup import build_ssl_context, generate_self_signed_cert
     except ImportError:
-        from tls_setup import generate_self_signed_cert
+        from tls_setup import build_ssl_context, generate_self_signed_cert
     
     try:
-        cert_file, key_file = generate_self_signed_cert("certs", common_name=local_ip)
-        print(f"\n✓ HTTPS enabled for local network access at https://{local_ip}:5000")
-        ssl_context = (cert_file, key_file)
+        with startup_profiler.phase('cert check'):
+            cert_file, key_file = generate_self_signed_cert("certs", common_name=local_ip, key_type=cert_type)
+            ssl_context = build_ssl_context(cert_file, key_file)
+        print(f"\n✓ HTTPS enabled for local network access at https://{local_ip}:5000 ({cert_type.upper()} certificate)")
     except Exception as e:
         print(f"⚠ TLS setup failed: {e}")
         print(f"Falling back to HTTP on http://{local_ip}:5000")
@@ -400,5 +983,22 @@ if __name__ == "__main__":
     print(f"\n🐛 Debug mode: ENABLED")
     print(f"🔄 Auto-reload: ENABLED\n")
     
+    # Warm the pairing QR pool in the serving process only (not the reloader
+    # parent), so the first "Generate" click is already instant
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        pairing_pool.start()
+        # Finish deleting uploads purged before the last shutdown
+        upload_purger.start()
+        scrubber.start()
+        retention.start()
+        storage.search.start()
+        duplicates.start()
+    
+    if profile_startup:
+        def print_startup_report():
+            pairing_manager.loaded.wait()
+            print(f"\n⏱ Startup profile (pid {os.getpid()}):\n{startup_profiler.report()}\n")
+        threading.Thread(target=print_startup_report, daemon=True).start()
+    
     # Run with debug mode enabled for better development experience
     app.run(host=host, port=5000, debug=True, use_reloader=True, ssl_context=ssl_context)
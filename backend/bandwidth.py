@@ -0,0 +1,302 @@
+"""Per-device upload bandwidth limits and fair sharing between concurrent uploads."""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    from backend.ratelimit import TokenBucket
+except ImportError:
+    from ratelimit import TokenBucket
+
+MB = 1024 * 1024
+
+# Bytes read from the client per scheduling decision
+CHUNK = 64 * 1024
+
+
+class IngestStream:
+    """One upload body being read."""
+
+    __slots__ = ('token', 'length', 'received', 'bulk', 'started')
+
+    def __init__(self, token: str, length: int, bulk: bool):
+        self.token = token
+        self.length = length
+        self.received = 0
+        self.bulk = bulk
+        self.started = time.monotonic()
+
+
+class ThrottledInput:
+    """wsgi.input wrapper that paces every read through the scheduler."""
+
+    def __init__(self, raw, scheduler, stream: IngestStream):
+        self._raw = raw
+        self._scheduler = scheduler
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                data = self.read(CHUNK)
+                if not data:
+                    return b''.join(chunks)
+                chunks.append(data)
+        data = self._raw.read(min(size, CHUNK))
+        if data:
+            self._scheduler.pace(self._stream, len(data))
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        data = self._raw.readline(size if size is not None and size >= 0 else CHUNK)
+        if data:
+            self._scheduler.pace(self._stream, len(data))
+        return data
+
+
+class IngestScheduler:
+    """
+    Decides how fast each upload body is read off the network.
+
+    Reading slower lets TCP push back on the sending phone, so a big video
+    from one device no longer crowds out everyone else on the Wi-Fi.
+
+    Limits (bytes per second, None = unlimited; persisted in bandwidth_settings.json):
+        total_rate:          ingest budget shared by all uploads
+        token_rate:          default per-device limit
+        overrides:           {token: rate} per-device limits
+        small_upload:        uploads up to this many bytes skip the fair queue
+        interactive_reserve: share of total_rate left unused by bulk uploads
+                             while other (interactive) requests are in flight
+        client:              upload settings advertised to the phone pages
+                             (see CLIENT_DEFAULTS and client_settings)
+
+    Bulk uploads take turns on the shared budget in fair-queue order: the
+    waiting device that has received the fewest bytes since it started
+    uploading goes next, however many parallel uploads it runs. Small
+    uploads are charged to the budget without queueing, so they finish
+    promptly and the bulk streams pay the difference afterwards.
+    """
+
+    DEFAULT_LIMITS = {
+        'total_rate': None,
+        'token_rate': None,
+        'small_upload': 2 * MB,
+        'interactive_reserve': 0.5,
+        'overrides': {},
+        'client': {},
+    }
+
+    # Upload engine settings for static/js/uploader.js. Photos picked from
+    # the phone are only re-encoded when `downscale` is on; camera captures
+    # are always encoded at `quality`, capped at `max_dimension` pixels.
+    CLIENT_DEFAULTS = {
+        'concurrency': 3,
+        'max_retries': 4,
+        'downscale': False,
+        'max_dimension': 2048,
+        'quality': 0.85,
+    }
+
+    def __init__(self, settings_file: str = "bandwidth_settings.json"):
+        self.settings_file = settings_file
+        self.limits = json.loads(json.dumps(self.DEFAULT_LIMITS))
+        self._cond = threading.Condition()
+        self._streams = set()
+        self._waiting = []  # bulk streams queued for the shared budget, in arrival order
+        self._served = {}  # {token: virtual bytes received} of devices with open streams
+        self._clock = 0  # virtual time: service level of the last device granted
+        self._buckets = {}  # {token: TokenBucket} of devices with open streams
+        self._link = None
+        self.interactive = 0
+        self.bytes_received = 0
+        self.throttled_seconds = 0.0
+        self.load_settings()
+        self._apply()
+
+    def load_settings(self):
+        """Load bandwidth limits from persistent storage."""
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    self.limits.update(json.load(f))
+            except Exception:
+                pass
+
+    def save_settings(self):
+        """Save bandwidth limits to persistent storage."""
+        try:
+            with open(self.settings_file, 'w') as f:
+                json.dump(self.limits, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save bandwidth settings: {e}")
+
+    @staticmethod
+    def _bucket(rate: Optional[float]) -> Optional[TokenBucket]:
+        # A quarter second of burst, but always room for one full chunk
+        return TokenBucket(rate, max(CHUNK, rate / 4)) if rate else None
+
+    def _apply(self):
+        """Rebuild buckets after a limit change (caller holds the lock or is __init__)."""
+        self._link = self._bucket(self.limits.get('total_rate'))
+        self._buckets = {token: self._bucket(self.token_rate(token)) for token in self._served}
+
+    def token_rate(self, token: str) -> Optional[float]:
+        """Effective per-device limit in bytes per second."""
+        overrides = self.limits.get('overrides') or {}
+        if token in overrides:
+            return overrides[token]
+        return self.limits.get('token_rate')
+
+    def attach(self, environ: Dict, token: str, length: int) -> IngestStream:
+        """Pace the request body in `environ`; call `detach` once the upload is done."""
+        small = self.limits.get('small_upload') or 0
+        stream = IngestStream(token, length, bulk=length > small)
+        with self._cond:
+            if token not in self._served:
+                # Newcomers start level with the device served last, so a
+                # device that uploaded a lot earlier is not owed anything
+                self._served[token] = self._clock
+                self._buckets[token] = self._bucket(self.token_rate(token))
+            self._streams.add(stream)
+        environ['wsgi.input'] = ThrottledInput(environ['wsgi.input'], self, stream)
+        return stream
+
+    def detach(self, stream: IngestStream):
+        with self._cond:
+            self._streams.discard(stream)
+            if not any(s.token == stream.token for s in self._streams):
+                self._served.pop(stream.token, None)
+                self._buckets.pop(stream.token, None)
+            self._cond.notify_all()
+
+    def begin_interactive(self):
+        with self._cond:
+            self.interactive += 1
+
+    def end_interactive(self):
+        with self._cond:
+            self.interactive = max(0, self.interactive - 1)
+
+    def pace(self, stream: IngestStream, nbytes: int):
+        """Block the reading thread until `nbytes` more may be received on `stream`."""
+        stream.received += nbytes
+        began = time.monotonic()
+        # The device's own limit first, so a capped device never holds the shared queue
+        while True:
+            with self._cond:
+                bucket = self._buckets.get(stream.token)
+                wait = bucket.consume(nbytes) if bucket is not None else 0
+            if not wait:
+                break
+            time.sleep(wait)
+
+        with self._cond:
+            self.bytes_received += nbytes
+            if self._link is None or not stream.bulk:
+                if self._link is not None:
+                    self._link.charge(nbytes)
+                self.throttled_seconds += time.monotonic() - began
+                return
+            self._waiting.append(stream)
+            try:
+                while True:
+                    head = min(self._waiting, key=lambda s: self._served.get(s.token, 0))
+                    if head is stream:
+                        wait = self._link.consume(nbytes)
+                        if not wait:
+                            reserve = self.limits.get('interactive_reserve') or 0
+                            if self.interactive and reserve:
+                                # Leave headroom: the next bulk grant waits longer
+                                self._link.charge(nbytes * reserve / (1 - reserve))
+                            break
+                    else:
+                        wait = 1.0  # re-checked when the head is served
+                    self._cond.wait(timeout=wait)
+                    if self._link is None:
+                        break  # limit removed while waiting
+            finally:
+                self._waiting.remove(stream)
+                self._cond.notify_all()
+                self.throttled_seconds += time.monotonic() - began
+            self._clock = self._served.get(stream.token, self._clock)
+            self._served[stream.token] = self._clock + nbytes
+
+    def update_limits(self, changes: Dict) -> Dict:
+        """Apply admin changes to limits live and persist them."""
+        with self._cond:
+            limits = json.loads(json.dumps(self.limits))
+            for key in ('total_rate', 'token_rate', 'small_upload'):
+                if key in changes:
+                    value = changes[key]
+                    limits[key] = int(value) if value is not None else None
+                    if limits[key] is not None and limits[key] <= 0:
+                        raise ValueError(f'{key} must be positive or null')
+            if 'interactive_reserve' in changes:
+                reserve = float(changes['interactive_reserve'] or 0)
+                if not 0 <= reserve < 1:
+                    raise ValueError('interactive_reserve must be at least 0 and below 1')
+                limits['interactive_reserve'] = reserve
+            client = dict(limits.get('client') or {})
+            for key, value in (changes.get('client') or {}).items():
+                if key not in self.CLIENT_DEFAULTS:
+                    raise ValueError(f'unknown client setting: {key}')
+                if key == 'downscale':
+                    value = bool(value)
+                elif key == 'quality':
+                    value = float(value)
+                    if not 0 < value <= 1:
+                        raise ValueError('quality must be between 0 and 1')
+                else:
+                    value = int(value)
+                    if value < (0 if key == 'max_retries' else 1):
+                        raise ValueError(f'{key} is out of range')
+                client[key] = value
+            limits['client'] = client
+            for token, value in (changes.get('overrides') or {}).items():
+                overrides = limits.setdefault('overrides', {})
+                if value == 'default':
+                    overrides.pop(token, None)
+                elif value is not None and int(value) <= 0:
+                    raise ValueError('per-device rates must be positive or null')
+                else:
+                    overrides[token] = int(value) if value is not None else None
+            self.limits = limits
+            self._apply()
+            self._cond.notify_all()
+        self.save_settings()
+        return self.get_status()
+
+    def client_settings(self) -> Dict:
+        """Settings the upload pages fetch before sending files."""
+        with self._cond:
+            return {**self.CLIENT_DEFAULTS, **(self.limits.get('client') or {}),
+                    'small_upload': self.limits.get('small_upload')}
+
+    def get_status(self) -> Dict:
+        """Limits and open upload streams for the admin panel."""
+        with self._cond:
+            now = time.monotonic()
+            streams = [
+                {
+                    'token': s.token,
+                    'received': s.received,
+                    'length': s.length,
+                    'bulk': s.bulk,
+                    'rate': round(s.received / max(now - s.started, 0.001)),
+                    'limit': self.token_rate(s.token)
+                }
+                for s in self._streams
+            ]
+            return {
+                'limits': json.loads(json.dumps(self.limits)),
+                'streams': streams,
+                'queued': len(self._waiting),
+                'interactive': self.interactive,
+                'bytes_received': self.bytes_received,
+                'throttled_seconds': round(self.throttled_seconds, 1)
+            }
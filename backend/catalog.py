@@ -0,0 +1,197 @@
+"""Compact column-oriented file metadata for fast gallery and device aggregates."""
+
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+try:
+    from backend.generations import generations
+    from backend.scrubber import walk_files
+except ImportError:
+    from generations import generations
+    from scrubber import walk_files
+
+# Stored per file as one byte
+TYPES = ('other', 'image', 'video')
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+
+
+def month_of(name: str) -> int:
+    """
+    YYYYMM taken from a camera-style file name (e.g. IMG_20250122_143022.jpg),
+    or 0 when the name carries no date.
+    """
+    parts = name.split('_', 2)
+    if len(parts) < 2 or not parts[1][:8].isdigit() or len(parts[1]) < 8:
+        return 0
+    month = int(parts[1][:6])
+    return month if 1 <= month % 100 <= 12 else 0
+
+
+def month_label(month: int) -> str:
+    """'2025-01' for 202501; 'Other' for undated files."""
+    return f'{month // 100:04d}-{month % 100:02d}' if month else 'Other'
+
+
+class FileCatalog:
+    """
+    File metadata held as parallel columns instead of one dict per file.
+
+    A file costs a list slot for its interned name plus 21 bytes of arrays
+    (size, mtime, month, type code) rather than a few hundred bytes of dict.
+    Per-type and per-month totals are kept up to date on `add`, so counts,
+    bytes by type and month histograms cost O(types + months) however many
+    files there are; only queries that return files walk the columns.
+    """
+
+    __slots__ = ('names', 'sizes', 'mtimes', 'months', 'types',
+                 '_type_counts', '_type_bytes', '_month_totals')
+
+    def __init__(self):
+        self.names = []  # interned
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.months = array('I')  # YYYYMM from the name, 0 if undated
+        self.types = bytearray()  # index into TYPES
+        self._type_counts = [0] * len(TYPES)
+        self._type_bytes = [0] * len(TYPES)
+        self._month_totals = {}  # {YYYYMM: [count, bytes]}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, size: int, mtime: float = 0.0, media_type: Optional[str] = None):
+        code = TYPE_CODES.get(media_type, 0)
+        month = month_of(name)
+        self.names.append(sys.intern(name))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.months.append(month)
+        self.types.append(code)
+        self._type_counts[code] += 1
+        self._type_bytes[code] += size
+        totals = self._month_totals.get(month)
+        if totals is None:
+            self._month_totals[month] = [1, size]
+        else:
+            totals[0] += 1
+            totals[1] += size
+
+    @classmethod
+    def from_entries(cls, entries: List[Dict]) -> 'FileCatalog':
+        """Catalog of gallery entries ({'name', 'size', 'type', 'modified'} dicts)."""
+        catalog = cls()
+        for entry in entries:
+            catalog.add(entry['name'], entry.get('size', 0), entry.get('modified', 0.0), entry.get('type'))
+        return catalog
+
+    @classmethod
+    def scan(cls, directory: str, classify: Callable[[str], Optional[str]],
+             media_only: bool = True) -> 'FileCatalog':
+        """
+        Catalog of the files in `directory` and its subfolders (names are the
+        file names); `classify` maps a name to 'image'/'video'/None.
+        """
+        catalog = cls()
+        for _rel_path, entry in walk_files(directory):
+            media_type = classify(entry.name)
+            if media_only and media_type is None:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            catalog.add(entry.name, st.st_size, st.st_mtime, media_type)
+        return catalog
+
+    # ---- aggregates ----------------------------------------------------
+
+    def count(self, media_type: Optional[str] = None) -> int:
+        if media_type is None:
+            return len(self.names)
+        return self._type_counts[TYPE_CODES[media_type]]
+
+    def total_size(self) -> int:
+        return sum(self._type_bytes)
+
+    def bytes_by_type(self) -> Dict[str, int]:
+        return dict(zip(TYPES, self._type_bytes))
+
+    def month_histogram(self) -> Dict[str, Dict[str, int]]:
+        """{'2025-01': {'count', 'size'}} newest month first, undated files last."""
+        return {
+            month_label(month): {'count': count, 'size': size}
+            for month, (count, size) in sorted(self._month_totals.items(),
+                                               key=lambda item: item[0] or -1, reverse=True)
+        }
+
+    def stats(self) -> Dict:
+        """Counts and sizes in the shape of PhotoGalleryManager.get_stats."""
+        total_size = self.total_size()
+        return {
+            'total_files': len(self.names),
+            'image_count': self.count('image'),
+            'video_count': self.count('video'),
+            'total_size': total_size,
+            'total_size_mb': round(total_size / (1024 * 1024), 2)
+        }
+
+    # ---- rows ------------------------------------------------------------
+
+    def record(self, i: int) -> Dict:
+        return {
+            'name': self.names[i],
+            'type': TYPES[self.types[i]],
+            'size': self.sizes[i],
+            'modified': self.mtimes[i]
+        }
+
+    def indices_by_month(self) -> Dict[str, List[int]]:
+        """Row numbers grouped by month label, in first-seen order."""
+        groups = {}
+        for i, month in enumerate(self.months):
+            groups.setdefault(month, []).append(i)
+        return {month_label(month): rows for month, rows in groups.items()}
+
+
+class CatalogCache:
+    """
+    Catalogs of token directories, reused until the token's files change.
+
+    An entry is valid while the token's generation (bumped by uploads and
+    deletes anywhere in the tree) and the top directory's mtime (which also
+    catches top-level changes made outside the app) are unchanged, so
+    repeated device summaries cost one stat per token instead of one per file.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {(directory, classify): (generation, mtime_ns, catalog)}
+        self._lock = threading.Lock()
+
+    def get(self, token: str, directory: str, classify: Callable[[str], Optional[str]]) -> FileCatalog:
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return FileCatalog()
+        generation = generations.get(f'token:{token}')
+        key = (directory, classify)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and entry[1] == mtime_ns:
+                self._entries.move_to_end(key)
+                return entry[2]
+        catalog = FileCatalog.scan(directory, classify)
+        with self._lock:
+            self._entries[key] = (generation, mtime_ns, catalog)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return catalog
+
+
+# Global instance shared by gallery stats and device summaries
+catalog_cache = CatalogCache()
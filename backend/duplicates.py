@@ -0,0 +1,252 @@
+"""Perceptual near-duplicate photo detection over every upload."""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from backend.event_log import event_log
+    from backend.ratelimit import TokenBucket
+except ImportError:
+    from event_log import event_log
+    from ratelimit import TokenBucket
+
+# Default Hamming distance (out of 64 bits) at which two photos count as the same shot
+DEFAULT_THRESHOLD = 6
+
+
+def dhash(path: str) -> int:
+    """
+    64-bit difference hash: each bit says whether a pixel of a 9x8 grey
+    thumbnail is brighter than its right neighbour. Re-encoded, resized or
+    slightly edited copies of a photo land within a few bits of each other.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        # Let the JPEG decoder skip most of the pixels of a large photo
+        img.draft('L', (64, 64))
+        img = ImageOps.exif_transpose(img)
+        pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under Hamming distance.
+
+    Every child edge is labelled with its distance from the parent, so by
+    the triangle inequality a radius-r query only descends into children
+    whose label is within r of the query's distance to the node. Finding
+    all neighbours of every photo costs far fewer comparisons than checking
+    all pairs.
+    """
+
+    __slots__ = ('_root', 'size')
+
+    def __init__(self):
+        self._root = None  # [hash, keys, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, key: str):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [key], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(key)  # identical hash
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [key], {}]
+                return
+            node = child
+
+    def query(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """(distance, key) of every entry within `radius` bits of `value`."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, key) for key in node[1])
+            for label, child in node[2].items():
+                if distance - radius <= label <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class DuplicateFinder:
+    """
+    Finds near-duplicate photos across all tokens in the background.
+
+    A worker takes images that have no perceptual hash yet from the search
+    index (which persists the hashes with its snapshot), hashes them at no
+    more than `ops_per_second` files per second, and whenever the index
+    changed regroups every hashed photo: each photo not yet in a group
+    queries a BK-tree for everything within `threshold` bits and takes
+    those photos into its group. Groups are sorted by the space deleting
+    all but the largest copy would reclaim.
+    """
+
+    def __init__(self, search_index, layout, threshold: int = DEFAULT_THRESHOLD,
+                 ops_per_second: float = 20.0, idle_interval: float = 30.0):
+        self.search = search_index
+        self.layout = layout
+        self.threshold = threshold
+        self.budget = TokenBucket(ops_per_second, ops_per_second)
+        self.idle_interval = idle_interval
+        self.hashed = 0
+        self.failed = 0
+        self.computed_at = None
+        self._groups = []  # type: List[Dict]
+        self._grouped_at = None  # search index `changes` the groups were built from
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start hashing and grouping in the background (idempotent)."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._loop, name='duplicate-finder', daemon=True)
+        self._worker.start()
+
+    def run_now(self):
+        """Skip the idle wait, e.g. after a batch of uploads."""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            try:
+                if self.search.building:
+                    time.sleep(1)
+                    continue
+                if self._hash_batch():
+                    continue
+                if self._grouped_at != self.search.changes:
+                    self.regroup()
+            except ImportError:
+                event_log.emit('cleanup', "Pillow is not installed; duplicate detection is disabled",
+                               logging.WARNING, kind='duplicates', error='Pillow is not installed')
+                return
+            except Exception as e:
+                event_log.emit('cleanup', f"Duplicate detection failed: {e}", logging.WARNING,
+                               kind='duplicates', error=str(e))
+            self._wake.wait(timeout=self.idle_interval)
+            self._wake.clear()
+
+    def _hash_batch(self, limit: int = 50) -> int:
+        """Hash up to `limit` pending images; returns how many were taken."""
+        batch = self.search.take_unhashed(limit)
+        for token, rel_path in batch:
+            while True:
+                wait = self.budget.consume()
+                if not wait:
+                    break
+                time.sleep(wait)
+            path = os.path.join(self.layout.token_dir(token), *rel_path.split('/'))
+            try:
+                value = dhash(path)
+            except ImportError:
+                raise
+            except Exception:
+                value = None  # unreadable or not really an image
+            self.search.set_hash(token, rel_path, value)
+            with self._lock:
+                if value is None:
+                    self.failed += 1
+                else:
+                    self.hashed += 1
+        return len(batch)
+
+    def regroup(self) -> List[Dict]:
+        """Rebuild the duplicate groups from the hashes currently in the index."""
+        changes = self.search.changes
+        hashed = self.search.hashed_files()
+        tree = BKTree()
+        for value, key in hashed:
+            tree.add(value, key)
+
+        groups = []
+        assigned = set()
+        for value, key in hashed:
+            if key in assigned:
+                continue
+            members = [(d, k) for d, k in tree.query(value, self.threshold) if k not in assigned]
+            if len(members) < 2:
+                continue
+            files = []
+            for distance, member in sorted(members):
+                meta = self.search.lookup(member)
+                if meta is not None:
+                    assigned.add(member)
+                    files.append({'token': meta['token'], 'path': meta['path'], 'name': meta['name'],
+                                  'size': meta['size'], 'distance': distance})
+            if len(files) >= 2:
+                groups.append(self._group(files))
+        groups.sort(key=lambda group: group['reclaimable'], reverse=True)
+
+        with self._lock:
+            self._groups = groups
+            self._grouped_at = changes
+            self.computed_at = datetime.now().isoformat()
+        return groups
+
+    @staticmethod
+    def _group(files: List[Dict]) -> Dict:
+        total = sum(f['size'] for f in files)
+        return {
+            'files': files,
+            'count': len(files),
+            'total_size': total,
+            'reclaimable': total - max(f['size'] for f in files)
+        }
+
+    def groups(self, token: Optional[str] = None) -> List[Dict]:
+        """Current groups, optionally only the photos of one token (groups of 2+ kept)."""
+        with self._lock:
+            groups = list(self._groups)
+        if token is None:
+            return groups
+        own = []
+        for group in groups:
+            files = [f for f in group['files'] if f['token'] == token]
+            if len(files) >= 2:
+                own.append(self._group(files))
+        own.sort(key=lambda group: group['reclaimable'], reverse=True)
+        return own
+
+    def get_stats(self) -> Dict:
+        """Progress counters for the admin panel."""
+        pending = self.search.get_stats().get('unhashed_images', 0)
+        with self._lock:
+            groups = self._groups
+            return {
+                'threshold': self.threshold,
+                'hashed': self.hashed,
+                'failed': self.failed,
+                'pending': pending,
+                'groups': len(groups),
+                'duplicate_files': sum(g['count'] - 1 for g in groups),
+                'reclaimable_bytes': sum(g['reclaimable'] for g in groups),
+                'computed_at': self.computed_at,
+                'running': self._worker is not None
+            }
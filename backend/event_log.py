@@ -0,0 +1,136 @@
+"""Structured JSON-lines event log, written off the request threads."""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'events.jsonl')
+
+# Events waiting for the writer thread; beyond this they are dropped, never waited on
+MAX_QUEUED = 10000
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line: time, level, event name and the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            't': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'event': getattr(record, 'event', record.name),
+        }
+        line.update(getattr(record, 'fields', {}))
+        if getattr(record, 'console', False) or record.exc_info or record.exc_text:
+            line['message'] = record.getMessage()
+        return json.dumps(line, default=str, separators=(',', ':'))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full instead of blocking."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class EventLog:
+    """
+    Append-only log of operational events (uploads, pairings, syncs, cleanups).
+
+    `emit` only formats a record and puts it on a bounded queue; a
+    QueueListener thread writes the JSON lines to `path`, rotating it at
+    `max_bytes` and keeping `backups` old files (events.jsonl.1, ...). Each
+    line carries a wall-clock `ts`, a unix time `t` and the event's fields,
+    so the log can be fed to capacity analysis or replayed as traffic.
+
+    Events with a `message` are operator-facing and are also printed to the
+    console by the same thread, replacing the print() calls they used to be.
+    The writer starts with the first event and is flushed at exit.
+    """
+
+    def __init__(self, path: str = DEFAULT_LOG_PATH, max_bytes: int = 20 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.logger = logging.getLogger('phone_storage.events')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self._queue = queue.Queue(MAX_QUEUED)
+        self._handler = DroppingQueueHandler(self._queue)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            handlers = []
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8'
+                )
+                file_handler.setFormatter(JsonLineFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                print(f"Event log disabled, cannot open {self.path}: {e}")
+            console = logging.StreamHandler(sys.stdout)
+            console.addFilter(lambda record: getattr(record, 'console', False))
+            handlers.append(console)
+            self._listener = logging.handlers.QueueListener(self._queue, *handlers, respect_handler_level=True)
+            self._listener.start()
+            self.logger.addHandler(self._handler)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out queued events and stop the writer thread."""
+        with self._lock:
+            listener, self._listener = self._listener, None
+            if listener is None:
+                return
+            self.logger.removeHandler(self._handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+    def emit(self, event: str, message: Optional[str] = None, level: int = logging.INFO, **fields):
+        """
+        Record one event, e.g. emit('upload', token=..., bytes=..., duration_ms=...).
+        A `message` is also shown on the console.
+        """
+        if self._listener is None:
+            self._start()
+        self.logger.log(level, message or event,
+                        extra={'event': event, 'fields': fields, 'console': message is not None})
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'queued': self._queue.qsize(),
+            'dropped': self._handler.dropped,
+            'running': self._listener is not None
+        }
+
+
+def elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() reading, for event durations."""
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+# Global instance shared by the whole app
+event_log = EventLog()
@@ -1,10 +1,70 @@
 """Photo and gallery management utilities."""
 
 import os
+import logging
 import mimetypes
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Union
 from pathlib import Path
 
+try:
+    from backend.media_probe import probe_video, PROBE_EXTENSIONS
+except ImportError:
+    from media_probe import probe_video, PROBE_EXTENSIONS
+
+try:
+    from backend.catalog import FileCatalog, month_label, month_of
+    from backend.event_log import event_log
+    from backend.layout import get_layout
+    from backend.scrubber import is_partial_name
+except ImportError:
+    from catalog import FileCatalog, month_label, month_of
+    from event_log import event_log
+    from layout import get_layout
+    from scrubber import is_partial_name
+
+
+class MetadataCache:
+    """
+    Bounded cache of derived per-file metadata (e.g. video headers).
+
+    Entries are keyed by path and validated against (size, mtime_ns), so a
+    rewritten file is re-probed while unchanged files never touch the disk
+    beyond the stat the caller already did.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {path: (size, mtime_ns, metadata)}
+        self._lock = threading.Lock()
+
+    def get(self, filepath: str, stat: os.stat_result) -> Optional[Dict]:
+        """Return cached metadata if the file is unchanged, else None."""
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                return None
+            self._entries.move_to_end(filepath)
+            return entry[2]
+
+    def put(self, filepath: str, stat: os.stat_result, metadata: Dict):
+        """Store metadata for a file version, evicting the oldest entries."""
+        with self._lock:
+            self._entries[filepath] = (stat.st_size, stat.st_mtime_ns, metadata)
+            self._entries.move_to_end(filepath)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, filepath: str):
+        """Drop any cached metadata for a path."""
+        with self._lock:
+            self._entries.pop(filepath, None)
+
+
+# Global instance shared by gallery listings
+metadata_cache = MetadataCache()
+
 
 class PhotoGalleryManager:
     """Manage photo uploads, gallery display, and metadata."""
@@ -31,6 +91,27 @@ class PhotoGalleryManager:
             return 'video'
         return None
     
+    @staticmethod
+    def get_video_metadata(filepath: str, stat: os.stat_result = None) -> Dict:
+        """
+        Get duration/resolution/creation time for a video from its header.
+
+        Results are cached in `metadata_cache`; formats the header probe does
+        not understand yield an empty dict.
+        """
+        if os.path.splitext(filepath)[1].lower() not in PROBE_EXTENSIONS:
+            return {}
+        try:
+            stat = stat or os.stat(filepath)
+        except OSError:
+            return {}
+
+        metadata = metadata_cache.get(filepath, stat)
+        if metadata is None:
+            metadata = probe_video(filepath) or {}
+            metadata_cache.put(filepath, stat, metadata)
+        return metadata
+    
     @staticmethod
     def get_file_info(filepath: str, rel_path: str = None) -> Optional[Dict]:
         """Get file metadata for gallery display."""
@@ -44,19 +125,22 @@ class PhotoGalleryManager:
             return None
         
         try:
-            file_size = os.path.getsize(filepath)
             file_stat = os.stat(filepath)
             
-            return {
+            info = {
                 'name': filename,
                 'type': media_type,
-                'size': file_size,
+                'size': file_stat.st_size,
                 'path': rel_path or f'/uploads/{filename}',
                 'modified': file_stat.st_mtime,
                 'mime_type': mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
             }
+            if media_type == 'video':
+                info.update(PhotoGalleryManager.get_video_metadata(filepath, file_stat))
+            return info
         except Exception as e:
-            print(f"Error getting file info for {filepath}: {e}")
+            event_log.emit('storage_error', f"Error getting file info for {filepath}: {e}", logging.WARNING,
+                           path=filepath, error=str(e))
             return None
     
     @staticmethod
@@ -80,53 +164,47 @@ class PhotoGalleryManager:
             for filename in sorted(os.listdir(directory)):
                 filepath = os.path.join(directory, filename)
                 
-                if not os.path.isfile(filepath):
+                if not os.path.isfile(filepath) or is_partial_name(filename):
                     continue
                 
                 media_type = PhotoGalleryManager.get_media_type(filename)
                 if not media_type:
                     continue
                 
-                file_size = os.path.getsize(filepath)
+                file_stat = os.stat(filepath)
                 rel_path = f'/uploads/{token}/{filename}' if token else f'/uploads/{filename}'
                 
-                gallery.append({
+                entry = {
                     'name': filename,
                     'type': media_type,
-                    'size': file_size,
+                    'size': file_stat.st_size,
                     'path': rel_path
-                })
+                }
+                if media_type == 'video':
+                    entry.update(PhotoGalleryManager.get_video_metadata(filepath, file_stat))
+                gallery.append(entry)
         
         except Exception as e:
-            print(f"Error scanning directory {directory}: {e}")
+            event_log.emit('storage_error', f"Error scanning directory {directory}: {e}", logging.WARNING,
+                           path=directory, error=str(e))
         
         return gallery
     
     @staticmethod
-    def organize_by_date(files: List[Dict]) -> Dict[str, List[Dict]]:
-        """Organize files by month for better gallery display."""
+    def organize_by_date(files: Union[List[Dict], FileCatalog]) -> Dict[str, List[Dict]]:
+        """
+        Organize files by month for better gallery display.
+
+        The month comes from the file name (e.g. IMG_20250122_143022.jpg ->
+        2025-01); undated names go under "Other".
+        """
+        if isinstance(files, FileCatalog):
+            return {month: [files.record(i) for i in rows]
+                    for month, rows in files.indices_by_month().items()}
+
         organized = {}
-        
         for file in files:
-            # Extract date from filename if possible (e.g., IMG_20250122_143022.jpg)
-            name = file['name']
-            
-            # Try to parse date from common formats
-            date_str = None
-            if '_' in name and len(name.split('_')[1]) >= 8:
-                date_str = name.split('_')[1][:8]  # YYYYMMDD
-            
-            if date_str:
-                # Format as YYYY-MM
-                month_key = f"{date_str[:4]}-{date_str[4:6]}"
-            else:
-                month_key = "Other"
-            
-            if month_key not in organized:
-                organized[month_key] = []
-            
-            organized[month_key].append(file)
-        
+            organized.setdefault(month_label(month_of(file['name'])), []).append(file)
         return organized
     
     @staticmethod
@@ -149,17 +227,16 @@ class PhotoGalleryManager:
         return [f for f in files if f['type'] == media_type]
     
     @staticmethod
-    def get_stats(files: List[Dict]) -> Dict:
-        """Get gallery statistics."""
-        images = PhotoGalleryManager.filter_by_type(files, 'image')
-        videos = PhotoGalleryManager.filter_by_type(files, 'video')
-        
+    def get_stats(files: Union[List[Dict], FileCatalog]) -> Dict:
+        """Get gallery statistics (constant time for a catalog)."""
+        if isinstance(files, FileCatalog):
+            return files.stats()
+        types = [f['type'] for f in files]
         total_size = sum(f['size'] for f in files)
-        
         return {
             'total_files': len(files),
-            'image_count': len(images),
-            'video_count': len(videos),
+            'image_count': types.count('image'),
+            'video_count': types.count('video'),
             'total_size': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2)
         }
@@ -183,8 +260,8 @@ class UploadManager:
     
     @staticmethod
     def get_upload_dir(token: str, base_dir: str = "uploads") -> str:
-        """Get or create upload directory for token."""
-        upload_dir = os.path.join(base_dir, token)
+        """Get or create upload directory for token (flat or sharded layout, any volume)."""
+        upload_dir = get_layout(base_dir).place(token)
         os.makedirs(upload_dir, exist_ok=True)
         return upload_dir
     
@@ -210,12 +287,7 @@ class UploadManager:
             return 0
         
         try:
-            for token_dir in os.listdir(base_dir):
-                dir_path = os.path.join(base_dir, token_dir)
-                
-                if not os.path.isdir(dir_path):
-                    continue
-                
+            for _token, dir_path in list(get_layout(base_dir).iter_token_dirs()):
                 dir_mtime = os.path.getmtime(dir_path)
                 
                 if dir_mtime < cutoff_time:
@@ -224,11 +296,14 @@ class UploadManager:
                         shutil.rmtree(dir_path)
                         cleaned += 1
                     except Exception as e:
-                        print(f"Could not remove {dir_path}: {e}")
+                        event_log.emit('storage_error', f"Could not remove {dir_path}: {e}", logging.WARNING,
+                                       path=dir_path, error=str(e))
         
         except Exception as e:
-            print(f"Error cleaning up old uploads: {e}")
+            event_log.emit('storage_error', f"Error cleaning up old uploads: {e}", logging.WARNING,
+                           path=base_dir, error=str(e))
         
+        event_log.emit('cleanup', kind='old_uploads', base_dir=base_dir, days=days, removed=cleaned)
         return cleaned
     
     @staticmethod
@@ -0,0 +1,80 @@
+"""Generation counters and ETag/304 handling for polled listing endpoints."""
+
+import functools
+import secrets
+import threading
+from typing import Callable, Union
+
+from flask import Response, make_response, request
+
+
+class GenerationCounter:
+    """
+    Monotonic per-key counters bumped whenever the data behind a key changes.
+
+    An ETag is just the generations of the keys a response depends on, so
+    revalidating a poll costs a few dict lookups: no filesystem access and no
+    JSON serialization. The per-process epoch makes ETags from a previous run
+    (when counters restart at zero) never match.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *keys: str):
+        """Mark the data behind each key as changed."""
+        with self._lock:
+            for key in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def bump_token(self, token: str):
+        """Mark a token's stored files as changed."""
+        self.bump(f'token:{token}', 'uploads')
+
+    def get(self, key: str) -> int:
+        """Current generation for a key (0 if never bumped)."""
+        return self._counters.get(key, 0)
+
+    def etag(self, *keys: str) -> str:
+        """Build an ETag value from the generations of the given keys."""
+        return '-'.join([self.epoch] + [str(self.get(key)) for key in keys])
+
+
+# Global instance
+generations = GenerationCounter()
+
+
+def etag_cached(*keys: Union[str, Callable[..., object]]):
+    """
+    Decorate a GET view so unchanged data is answered with 304 Not Modified.
+
+    Each key is either a counter key template formatted with the view's URL
+    arguments (e.g. 'token:{token}'), contributing that key's generation, or
+    a callable receiving them as keyword arguments, whose return value is put
+    into the ETag as is (for state that has no counter, e.g. a count).
+    The ETag is computed before the view runs, so a mutation racing with the
+    view only ever causes one extra full response, never a stale 304.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            etag = '-'.join([generations.epoch] + [
+                str(key(**kwargs)) if callable(key) else str(generations.get(key.format(**kwargs)))
+                for key in keys
+            ])
+            # Weak comparison: compressed and identity bodies share a generation
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=bool(response.headers.get('Content-Encoding')))
+                # Let browsers keep the body but revalidate every poll
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
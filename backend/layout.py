@@ -0,0 +1,324 @@
+"""On-disk layout of upload directories: flat or hash-prefix sharded, on one or more volumes."""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_UPLOAD_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+
+# Marker file in the upload root describing the active scheme
+LAYOUT_FILE = '.layout.json'
+
+HEX_DIGITS = set('0123456789abcdef')
+
+PLACEMENTS = ('free_space', 'round_robin')
+
+# free_space placement treats each token placed on a volume in the last
+# PLACEMENT_WINDOW seconds as PLACEMENT_HOLD bytes already used there, so a
+# burst of new sessions spreads over the disks instead of all landing on
+# whichever one had the most free space a moment ago
+PLACEMENT_HOLD = 1024 * 1024 * 1024
+PLACEMENT_WINDOW = 60.0
+
+
+class StorageLayout:
+    """
+    Resolves session tokens to directories under an upload root.
+
+    flat:    <volume>/<token>/
+    sharded: <volume>/<sha1(token)[:fanout]>/<token>/
+
+    The scheme is recorded in <root>/.layout.json by the migration tool, so
+    every component (storage simulator, upload manager, serving routes,
+    cleanup) resolves paths the same way. During or after an interrupted
+    migration a token is also looked up in the other scheme's location,
+    which keeps resolution transparent while directories are being moved.
+
+    The marker may also list extra volumes (upload roots on other disks).
+    Each token lives entirely on one volume, chosen by `place` when its
+    first upload arrives (most free space, or round-robin); lookups search
+    every volume, so readers never need to know where a token was placed.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.scheme = 'flat'
+        self.fanout = 2
+        self.volumes = [self.root]  # primary root first
+        self.placement = 'free_space'
+        self._placed = {}  # {token: token_dir} for tokens placed or found
+        self._recent = {}  # {volume: [monotonic time of each recent placement]}
+        self._next_volume = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Read the layout marker, defaulting to the historical flat layout."""
+        marker = os.path.join(self.root, LAYOUT_FILE)
+        if os.path.exists(marker):
+            try:
+                with open(marker, 'r') as f:
+                    config = json.load(f)
+                self.scheme = config.get('scheme', 'flat')
+                self.fanout = int(config.get('fanout', 2))
+                self.placement = config.get('placement', 'free_space')
+                for volume in config.get('volumes', []):
+                    volume = os.path.abspath(volume)
+                    if volume not in self.volumes:
+                        self.volumes.append(volume)
+            except Exception as e:
+                print(f"Invalid layout marker {marker}: {e}")
+
+    def _save(self):
+        """Persist the layout marker."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, LAYOUT_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({
+                'scheme': self.scheme,
+                'fanout': self.fanout,
+                'volumes': self.volumes[1:],
+                'placement': self.placement
+            }, f)
+        os.replace(tmp, os.path.join(self.root, LAYOUT_FILE))
+
+    def shard_of(self, token: str) -> str:
+        """Hash-prefix fan-out directory name for a token."""
+        return hashlib.sha1(token.encode()).hexdigest()[:self.fanout]
+
+    def _flat_dir(self, token: str, volume: Optional[str] = None) -> str:
+        return os.path.join(volume or self.root, token)
+
+    def _sharded_dir(self, token: str, volume: Optional[str] = None) -> str:
+        return os.path.join(volume or self.root, self.shard_of(token), token)
+
+    def _scheme_dir(self, token: str, volume: Optional[str] = None) -> str:
+        """Where the active scheme puts a token on a volume."""
+        if self.scheme == 'sharded':
+            return self._sharded_dir(token, volume)
+        return self._flat_dir(token, volume)
+
+    def _find(self, token: str) -> Optional[str]:
+        """Existing directory of a token on any volume, in either scheme."""
+        known = self._placed.get(token)
+        if known is not None and os.path.isdir(known):
+            return known
+        for volume in self.volumes:
+            primary = self._scheme_dir(token, volume)
+            if self.scheme == 'sharded':
+                fallback = self._flat_dir(token, volume)
+            else:
+                fallback = self._sharded_dir(token, volume)
+            for candidate in (primary, fallback):
+                if os.path.isdir(candidate):
+                    self._placed[token] = candidate
+                    return candidate
+        return None
+
+    def token_dir(self, token: str) -> str:
+        """Directory for a token's files (may not exist yet)."""
+        found = self._find(token)
+        if found is not None:
+            return found
+        # Placed for an upload that has not created the directory yet
+        return self._placed.get(token) or self._scheme_dir(token)
+
+    def place(self, token: str) -> str:
+        """
+        Directory to write a token's uploads to: its existing one, or a new
+        one on the volume picked by the placement policy. The choice is
+        remembered, so the upload that triggered it lands there.
+        """
+        found = self._find(token)
+        if found is not None:
+            return found
+        with self._lock:
+            if token in self._placed:
+                return self._placed[token]
+            volume = self._choose_volume()
+            self._placed[token] = self._scheme_dir(token, volume)
+            return self._placed[token]
+
+    def _choose_volume(self) -> str:
+        if len(self.volumes) == 1:
+            return self.root
+        now = time.monotonic()
+        if self.placement == 'round_robin':
+            volume = self.volumes[self._next_volume % len(self.volumes)]
+            self._next_volume += 1
+            return volume
+        best, best_score = self.root, None
+        for volume in self.volumes:
+            try:
+                free = shutil.disk_usage(volume).free
+            except OSError:
+                continue  # not mounted
+            recent = [t for t in self._recent.get(volume, []) if now - t < PLACEMENT_WINDOW]
+            self._recent[volume] = recent
+            score = free - len(recent) * PLACEMENT_HOLD
+            if best_score is None or score > best_score:
+                best, best_score = volume, score
+        self._recent.setdefault(best, []).append(now)
+        return best
+
+    def volume_of(self, path: str) -> str:
+        """The volume root a path lives on (the primary root if none matches)."""
+        path = os.path.abspath(path)
+        for volume in sorted(self.volumes, key=len, reverse=True):
+            if path == volume or path.startswith(volume + os.sep):
+                return volume
+        return self.root
+
+    def _is_shard_name(self, name: str) -> bool:
+        return len(name) == self.fanout and set(name) <= HEX_DIGITS
+
+    def iter_token_dirs(self) -> Iterator[Tuple[str, str]]:
+        """Yield (token, directory) for every token on disk, on every volume, in either scheme."""
+        for volume in self.volumes:
+            if not os.path.isdir(volume):
+                continue
+            with os.scandir(volume) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.') or not entry.is_dir():
+                        continue
+                    if self._is_shard_name(entry.name):
+                        with os.scandir(entry.path) as shard:
+                            for token_entry in shard:
+                                if token_entry.is_dir():
+                                    yield token_entry.name, token_entry.path
+                    else:
+                        yield entry.name, entry.path
+
+    def add_volume(self, path: str):
+        """Register another upload root; new tokens may be placed on it."""
+        path = os.path.abspath(path)
+        os.makedirs(path, exist_ok=True)
+        if path not in self.volumes:
+            self.volumes.append(path)
+            self._save()
+
+    def remove_volume(self, path: str):
+        """Stop using an extra volume; refused while it still holds tokens."""
+        path = os.path.abspath(path)
+        if path == self.root:
+            raise ValueError('the primary upload root cannot be removed')
+        if path not in self.volumes:
+            raise ValueError(f'not a configured volume: {path}')
+        if any(self.volume_of(d) == path for _token, d in self.iter_token_dirs()):
+            raise ValueError(f'{path} still holds uploads; move them first')
+        self.volumes.remove(path)
+        self._save()
+
+    def set_placement(self, placement: str):
+        """Choose how new tokens are spread over volumes."""
+        if placement not in PLACEMENTS:
+            raise ValueError(f'unknown placement policy: {placement}')
+        self.placement = placement
+        self._save()
+
+    def get_volume_status(self) -> List[Dict]:
+        """Capacity of each volume, primary first."""
+        status = []
+        for volume in self.volumes:
+            try:
+                disk = shutil.disk_usage(volume)
+                status.append({'root': volume, 'total': disk.total, 'free': disk.free})
+            except OSError:
+                status.append({'root': volume, 'total': None, 'free': None})
+        return status
+
+    def migrate(self, scheme: str, fanout: int = 2) -> Dict:
+        """
+        Move every token directory into `scheme` and record it.
+
+        The marker is switched first so new uploads land in the target layout;
+        existing tokens stay reachable through the fallback lookup until moved.
+        Safe to re-run after an interruption.
+        """
+        if scheme not in ('flat', 'sharded'):
+            raise ValueError(f'unknown layout scheme: {scheme}')
+        # Old-layout shard names must be recognised while scanning
+        tokens = list(self.iter_token_dirs())
+        old_fanout = self.fanout
+        self.scheme, self.fanout = scheme, fanout
+        self._save()
+
+        self._placed.clear()
+
+        moved = skipped = 0
+        for token, current in tokens:
+            # Tokens stay on their volume; only the scheme changes
+            target = self._scheme_dir(token, self.volume_of(current))
+            if os.path.abspath(current) == target:
+                continue
+            if os.path.exists(target):
+                print(f"Skipping {token}: {target} already exists")
+                skipped += 1
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(current, target)
+            moved += 1
+
+        # Remove shard directories left empty by a sharded -> flat migration
+        for volume in self.volumes:
+            if not os.path.isdir(volume):
+                continue
+            with os.scandir(volume) as entries:
+                for entry in entries:
+                    if entry.is_dir() and len(entry.name) == old_fanout and set(entry.name) <= HEX_DIGITS:
+                        try:
+                            os.rmdir(entry.path)
+                        except OSError:
+                            pass  # not empty: still holds tokens
+        return {'scheme': scheme, 'moved': moved, 'skipped': skipped}
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def get_layout(root: str = DEFAULT_UPLOAD_ROOT) -> StorageLayout:
+    """Shared StorageLayout for an upload root (one instance per directory)."""
+    key = os.path.abspath(root)
+    with _layouts_lock:
+        if key not in _layouts:
+            _layouts[key] = StorageLayout(key)
+        return _layouts[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or change the upload directory layout.")
+    parser.add_argument('command', choices=['status', 'migrate', 'add-volume', 'remove-volume', 'placement'])
+    parser.add_argument('value', nargs='?', help='volume path, or placement policy (free_space|round_robin)')
+    parser.add_argument('--root', default=DEFAULT_UPLOAD_ROOT, help='upload root (default: uploads/)')
+    parser.add_argument('--to', choices=['flat', 'sharded'], default='sharded', help='target scheme for migrate')
+    parser.add_argument('--fanout', type=int, default=2, help='hex characters per shard directory')
+    args = parser.parse_args()
+
+    layout = get_layout(args.root)
+    if args.command == 'status':
+        count = sum(1 for _ in layout.iter_token_dirs())
+        print(f"Layout: {layout.scheme} (fanout {layout.fanout}), {count} token directories, "
+              f"placement {layout.placement}")
+        for volume in layout.get_volume_status():
+            free = f"{volume['free'] / 1024 ** 3:.1f} GB free" if volume['free'] is not None else 'unavailable'
+            print(f"  {volume['root']}: {free}")
+    elif args.command == 'migrate':
+        result = layout.migrate(args.to, args.fanout)
+        print(f"Migrated to {result['scheme']}: {result['moved']} moved, {result['skipped']} skipped")
+    elif not args.value:
+        parser.error(f'{args.command} needs a value')
+    elif args.command == 'add-volume':
+        layout.add_volume(args.value)
+        print(f"Added volume {os.path.abspath(args.value)}")
+    elif args.command == 'remove-volume':
+        layout.remove_volume(args.value)
+        print(f"Removed volume {os.path.abspath(args.value)}")
+    else:
+        layout.set_placement(args.value)
+        print(f"Placement policy: {layout.placement}")
@@ -0,0 +1,153 @@
+"""Small load and latency tool for the local server.
+
+Usage:
+    python -m backend.load_tool handshake
+        Compare full and resumed TLS handshakes for RSA-2048 and ECDSA P-256
+        certificates against local throwaway servers using the app's SSLContext.
+
+    python -m backend.load_tool handshake --target 192.168.1.10:5000
+        Measure handshakes against a running server instead.
+"""
+
+import argparse
+import socket
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    from backend.tls_setup import KEY_TYPES, build_ssl_context, generate_self_signed_cert
+except ImportError:
+    from tls_setup import KEY_TYPES, build_ssl_context, generate_self_signed_cert
+
+
+def _client_context() -> ssl.SSLContext:
+    """Client context that accepts self-signed certificates (local testing only)."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def _handshake(host: str, port: int, context: ssl.SSLContext,
+               session: Optional[ssl.SSLSession]) -> Tuple[float, ssl.SSLSession, bool]:
+    """
+    One connection: returns (handshake seconds, session, resumed).
+
+    Only the TLS handshake is timed, not the TCP connect. A minimal HTTP
+    request is sent afterwards so TLS 1.3 session tickets (which arrive
+    after the handshake) are received before the session is read.
+    """
+    with socket.create_connection((host, port), timeout=10) as raw:
+        start = time.perf_counter()
+        with context.wrap_socket(raw, server_hostname=host, session=session) as tls:
+            elapsed = time.perf_counter() - start
+            tls.sendall(f"HEAD / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            try:
+                tls.recv(1024)
+            except (OSError, ssl.SSLError):
+                pass
+            return elapsed, tls.session, tls.session_reused
+
+
+def measure_handshakes(host: str, port: int, count: int) -> Dict:
+    """Time `count` full handshakes, then `count` handshakes resuming a session."""
+    context = _client_context()
+    full = []
+    session = None
+    for _ in range(count):
+        elapsed, session, _ = _handshake(host, port, context, None)
+        full.append(elapsed)
+
+    resumed, reused = [], 0
+    for _ in range(count):
+        elapsed, new_session, was_reused = _handshake(host, port, context, session)
+        resumed.append(elapsed)
+        if was_reused:
+            reused += 1
+        session = new_session or session
+
+    def summary(samples):
+        ordered = sorted(samples)
+        return {
+            'median_ms': round(statistics.median(ordered) * 1000, 2),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2)
+        }
+
+    return {'full': summary(full), 'resumed': summary(resumed), 'resumed_count': reused, 'count': count}
+
+
+class _TLSEchoServer:
+    """Throwaway local TLS server using the app's SSLContext."""
+
+    def __init__(self, context: ssl.SSLContext):
+        self.context = context
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        self._stopped = False
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while not self._stopped:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    tls.recv(1024)
+                    tls.sendall(b"HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n")
+            except (OSError, ssl.SSLError):
+                conn.close()
+
+    def close(self):
+        self._stopped = True
+        self.sock.close()
+
+
+def benchmark_key_types(count: int) -> Dict:
+    """Compare RSA and ECDSA certificates, full vs resumed, on loopback."""
+    results = {}
+    with tempfile.TemporaryDirectory() as cert_dir:
+        for key_type in KEY_TYPES:
+            cert_file, key_file = generate_self_signed_cert(cert_dir, common_name="127.0.0.1", key_type=key_type)
+            if not cert_file:
+                print(f"Skipping {key_type}: certificate generation failed")
+                continue
+            server = _TLSEchoServer(build_ssl_context(cert_file, key_file))
+            try:
+                results[key_type] = measure_handshakes('127.0.0.1', server.port, count)
+            finally:
+                server.close()
+    return results
+
+
+def _print_results(results: Dict):
+    print(f"\n{'certificate':<14}{'full median':>14}{'full p95':>12}{'resumed median':>17}{'resumed p95':>14}  resumed")
+    for name, r in results.items():
+        print(
+            f"{name:<14}{r['full']['median_ms']:>12.2f}ms{r['full']['p95_ms']:>10.2f}ms"
+            f"{r['resumed']['median_ms']:>15.2f}ms{r['resumed']['p95_ms']:>12.2f}ms"
+            f"  {r['resumed_count']}/{r['count']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load and latency checks for the local server.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    hs = sub.add_parser('handshake', help='benchmark full vs resumed TLS handshakes')
+    hs.add_argument('--count', type=int, default=50, help='handshakes per measurement')
+    hs.add_argument('--target', help='host:port of a running HTTPS server (default: local RSA/ECDSA comparison)')
+    args = parser.parse_args()
+
+    if args.command == 'handshake':
+        if args.target:
+            host, _, port = args.target.rpartition(':')
+            _print_results({args.target: measure_handshakes(host, int(port), args.count)})
+        else:
+            _print_results(benchmark_key_types(args.count))
@@ -0,0 +1,198 @@
+"""Header-only metadata probe for MP4/MOV (ISO base media) video files."""
+
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# ISO-BMFF timestamps count seconds since midnight 1904-01-01 UTC
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+# Container formats the probe understands
+PROBE_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.3gp', '.3g2'}
+
+# Boxes we descend into on the way to mvhd/tkhd; everything else is skipped
+CONTAINER_BOXES = {b'moov', b'trak'}
+
+# Header boxes are tiny; anything larger is corrupt or hostile
+MAX_HEADER_BOX = 4096
+# Upper bound on sibling boxes walked per level (guards against crafted files)
+MAX_BOXES_PER_LEVEL = 4096
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Yield (type, payload_offset, payload_size) for boxes in [start, end).
+
+    Only the 8/16-byte box headers are read; payloads are skipped with seeks,
+    so the cost is independent of how large `mdat` is.
+    """
+    offset = start
+    for _ in range(MAX_BOXES_PER_LEVEL):
+        if offset + 8 > end:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_len = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_len = 16
+        elif size == 0:
+            size = end - offset  # box extends to end of enclosing space
+        if size < header_len or offset + size > end:
+            return
+        yield box_type, offset + header_len, size - header_len
+        offset += size
+
+
+def _read_payload(f: BinaryIO, offset: int, size: int) -> Optional[bytes]:
+    """Read a small box payload, refusing anything that isn't a header box."""
+    if size > MAX_HEADER_BOX:
+        return None
+    f.seek(offset)
+    data = f.read(size)
+    return data if len(data) == size else None
+
+
+def _mp4_time(seconds: int) -> Optional[str]:
+    """Convert an ISO-BMFF timestamp to ISO 8601, or None when unset."""
+    if not seconds:
+        return None
+    try:
+        return (MP4_EPOCH + timedelta(seconds=seconds)).isoformat()
+    except OverflowError:
+        return None
+
+
+def _parse_mvhd(data: bytes) -> Optional[Dict]:
+    """Parse a movie header box: creation time, timescale and duration."""
+    if len(data) < 20:
+        return None
+    version = data[0]
+    if version == 1:
+        if len(data) < 32:
+            return None
+        created, _modified, timescale, duration = struct.unpack('>QQIQ', data[4:32])
+    else:
+        created, _modified, timescale, duration = struct.unpack('>IIII', data[4:20])
+    return {
+        'created': created,
+        'duration': round(duration / timescale, 3) if timescale else None,
+    }
+
+
+def _parse_tkhd(data: bytes) -> Optional[Dict]:
+    """Parse a track header box: display width/height and rotation."""
+    version = data[0] if data else 0
+    # creation/modification/track_ID/reserved/duration are wider in version 1
+    matrix_at = 4 + (32 if version == 1 else 20) + 16
+    if len(data) < matrix_at + 44:
+        return None
+    a, b = struct.unpack('>ii', data[matrix_at:matrix_at + 8])
+    width, height = struct.unpack('>II', data[matrix_at + 36:matrix_at + 44])
+    # Phones record portrait video as landscape plus a rotation matrix
+    rotation = 0
+    if a == 0 and b > 0:
+        rotation = 90
+    elif a == 0 and b < 0:
+        rotation = 270
+    elif a < 0:
+        rotation = 180
+    return {'width': width >> 16, 'height': height >> 16, 'rotation': rotation}
+
+
+def probe_video(filepath: str) -> Optional[Dict]:
+    """
+    Extract duration, resolution and creation time from an MP4/MOV header.
+
+    Walks the top-level boxes with seeks, descends into `moov`/`trak` and reads
+    only `mvhd` and `tkhd`. The media payload is never read, so multi-GB files
+    cost a handful of small reads. Returns None for non ISO-BMFF files.
+    """
+    try:
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            movie = None
+            tracks = []
+            for box_type, offset, size in _iter_boxes(f, 0, file_size):
+                if box_type != b'moov':
+                    continue
+                for child, c_offset, c_size in _iter_boxes(f, offset, offset + size):
+                    if child == b'mvhd':
+                        data = _read_payload(f, c_offset, c_size)
+                        movie = _parse_mvhd(data) if data else None
+                    elif child in CONTAINER_BOXES:
+                        for leaf, l_offset, l_size in _iter_boxes(f, c_offset, c_offset + c_size):
+                            if leaf == b'tkhd':
+                                data = _read_payload(f, l_offset, l_size)
+                                track = _parse_tkhd(data) if data else None
+                                if track:
+                                    tracks.append(track)
+                                break
+                break
+    except OSError:
+        return None
+
+    if movie is None:
+        return None
+
+    # Audio tracks report 0x0; the largest visual track is the video
+    video = max(tracks, key=lambda t: t['width'] * t['height'], default=None)
+    width = height = None
+    rotation = 0
+    if video and video['width'] and video['height']:
+        width, height, rotation = video['width'], video['height'], video['rotation']
+        if rotation in (90, 270):
+            width, height = height, width
+
+    return {
+        'duration': movie['duration'],
+        'width': width,
+        'height': height,
+        'rotation': rotation,
+        'created': _mp4_time(movie['created']),
+    }
+
+
+def is_complete(filepath: str) -> Optional[bool]:
+    """
+    Check that the top-level boxes of an MP4/MOV file fit inside it.
+
+    A crashed or cut-off upload leaves a box (usually mdat or moov) whose
+    declared size runs past the end of the file. Returns False in that case,
+    True when the boxes account for the whole file, and None when the file
+    does not look like ISO base media at all. Only box headers are read.
+    """
+    try:
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            offset = 0
+            for index in range(MAX_BOXES_PER_LEVEL):
+                if offset == file_size:
+                    return True
+                f.seek(offset)
+                header = f.read(8)
+                if len(header) < 8:
+                    return False if index else None
+                size, box_type = struct.unpack('>I4s', header)
+                if index == 0 and box_type != b'ftyp':
+                    return None
+                if size == 1:
+                    large = f.read(8)
+                    if len(large) < 8:
+                        return False
+                    size = struct.unpack('>Q', large)[0]
+                elif size == 0:
+                    return True  # last box, extends to end of file
+                if size < 8 or offset + size > file_size:
+                    return False
+                offset += size
+    except OSError:
+        return None
+    return None
@@ -0,0 +1,186 @@
+"""Resized/transcoded image variants with a byte-budgeted LRU disk cache."""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    from backend.gallery_utils import PhotoGalleryManager
+except ImportError:
+    from gallery_utils import PhotoGalleryManager
+
+# Requested widths are snapped up to one of these so the cache stays small
+WIDTH_BUCKETS = (64, 128, 256, 320, 480, 640, 960, 1280, 1920, 2560)
+
+# Output formats: {fmt: (Pillow format, mimetype, file extension)}
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', '.webp'),
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'jpg': ('JPEG', 'image/jpeg', '.jpg'),
+    'png': ('PNG', 'image/png', '.png'),
+}
+
+# Pillow cannot rasterize vector images
+UNSUPPORTED_EXTENSIONS = {'.svg'}
+
+
+def snap_width(width: int) -> int:
+    """Round a requested width up to the nearest cached bucket."""
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+class VariantCache:
+    """
+    On-disk cache of rendered image variants under a total byte budget.
+
+    Variant names hash the source identity (path, size, mtime) together with
+    the render parameters, so re-uploading a file makes old variants
+    unreachable; they then age out through LRU eviction. Concurrent requests
+    for the same variant wait for a single render instead of repeating it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # {variant filename: size}, oldest first
+        self._total = 0
+        self._inflight = {}  # {variant filename: threading.Event}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Seed the LRU from variants left by a previous run (oldest first)."""
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _mtime, name, size in sorted(found):
+            self._entries[name] = size
+            self._total += size
+        self._evict()
+
+    def _evict(self):
+        """Delete least recently used variants until under budget (lock held)."""
+        while self._total > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    @staticmethod
+    def variant_name(source: str, stat: os.stat_result, width: int, fmt: str, quality: int) -> str:
+        """Stable cache filename for a source version and render parameters."""
+        ident = f'{source}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{fmt}|{quality}'
+        return hashlib.sha1(ident.encode()).hexdigest() + FORMATS[fmt][2]
+
+    def get_variant(self, source: str, width: int, fmt: str, quality: int = 80) -> Tuple[str, str]:
+        """
+        Return (variant path, mimetype), rendering it at most once.
+
+        Raises OSError if the source cannot be read and ValueError if it is
+        not a decodable image.
+        """
+        stat = os.stat(source)
+        name = self.variant_name(source, stat, width, fmt, quality)
+        path = os.path.join(self.cache_dir, name)
+        mimetype = FORMATS[fmt][1]
+
+        while True:
+            with self._lock:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return path, mimetype
+                event = self._inflight.get(name)
+                if event is None:
+                    event = self._inflight[name] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another request is rendering this variant; wait and re-check
+            event.wait()
+
+        try:
+            size = self._render(source, path, width, fmt, quality)
+            with self._lock:
+                self._entries[name] = size
+                self._total += size
+                self._evict()
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+            event.set()
+        return path, mimetype
+
+    @staticmethod
+    def _render(source: str, dest: str, width: int, fmt: str, quality: int) -> int:
+        """Resize (never upscale) and transcode `source` into `dest`."""
+        from PIL import Image, ImageOps
+
+        pil_format = FORMATS[fmt][0]
+        try:
+            with Image.open(source) as img:
+                img.load()
+                img = ImageOps.exif_transpose(img)
+                if img.width > width:
+                    img.thumbnail((width, img.height), Image.LANCZOS)
+                if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                    img = img.convert('RGBA')
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            # Unidentified, truncated or corrupt file, or too many pixels to decode safely
+            raise ValueError(str(e))
+
+        tmp = f'{dest}.{threading.get_ident()}.tmp'
+        try:
+            img.save(tmp, format=pil_format, quality=quality, optimize=True)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, dest)
+        return os.path.getsize(dest)
+
+    def get_stats(self) -> Dict:
+        """Cache usage and hit statistics."""
+        with self._lock:
+            return {
+                'variants': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def parse_variant_request(filename: str, args) -> Optional[Tuple[int, str, int]]:
+    """
+    Validate ?w=&fmt=&q= for an image file.
+
+    Returns (width, fmt, quality) or None when the file is not an image
+    Pillow can render.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if PhotoGalleryManager.get_media_type(filename) != 'image' or ext in UNSUPPORTED_EXTENSIONS:
+        return None
+    try:
+        width = snap_width(max(1, int(args.get('w', WIDTH_BUCKETS[-1]))))
+        quality = max(30, min(95, int(args.get('q', 80))))
+    except ValueError:
+        return None
+    fmt = args.get('fmt', 'webp').lower()
+    if fmt not in FORMATS:
+        return None
+    return width, fmt, quality
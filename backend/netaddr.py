@@ -0,0 +1,107 @@
+"""Cached local network address, refreshed when network interfaces change."""
+
+import logging
+import socket
+import threading
+import time
+from typing import Callable, List, Tuple
+
+try:
+    from backend.event_log import event_log
+except ImportError:
+    from event_log import event_log
+
+
+def probe_local_ip() -> str:
+    """Return a likely local IP address; fallback to '0.0.0.0' on error."""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        return "0.0.0.0"
+
+
+def _interface_names() -> Tuple[str, ...]:
+    """Snapshot of the network interfaces currently present."""
+    try:
+        return tuple(sorted(name for _, name in socket.if_nameindex()))
+    except (OSError, AttributeError):
+        return ()
+
+
+class LocalAddress:
+    """
+    The LAN address the server advertises, resolved once and then cached.
+
+    A watcher thread compares the interface list every `interval` seconds
+    (a cheap snapshot, no routing lookup) and re-probes the address when it
+    changes, or at the latest every `max_age` seconds to catch DHCP moves on
+    the same interface. Listeners registered with `on_change` are called
+    with (old_ip, new_ip), e.g. to drop QR codes that embed the old address.
+    """
+
+    def __init__(self, interval: float = 1.0, max_age: float = 30.0):
+        self.interval = interval
+        self.max_age = max_age
+        self._ip = None
+        self._interfaces = None
+        self._probed_at = 0.0
+        self._listeners = []  # type: List[Callable[[str, str], None]]
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def get(self) -> str:
+        """Cached local IP; the first call resolves it and starts the watcher."""
+        if self._ip is None:
+            self.refresh()
+        self.start()
+        return self._ip
+
+    def refresh(self) -> bool:
+        """Re-probe the address now; returns True when it changed."""
+        interfaces = _interface_names()
+        ip = probe_local_ip()
+        with self._lock:
+            old = self._ip
+            self._ip = ip
+            self._interfaces = interfaces
+            self._probed_at = time.monotonic()
+            listeners = list(self._listeners)
+        if old is not None and old != ip:
+            event_log.emit('pairing', f"Local address changed: {old} -> {ip}",
+                           state='address_changed', old_ip=old, new_ip=ip)
+            for callback in listeners:
+                try:
+                    callback(old, ip)
+                except Exception as e:
+                    event_log.emit('pairing', f"Address change listener failed: {e}", logging.WARNING,
+                                   state='address_listener_failed', error=str(e))
+            return True
+        return False
+
+    def on_change(self, callback: Callable[[str, str], None]):
+        """Register a callback(old_ip, new_ip) for address changes."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def start(self):
+        """Start the interface watcher thread (idempotent)."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name='address-watch', daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            if (_interface_names() != self._interfaces
+                    or time.monotonic() - self._probed_at > self.max_age):
+                self.refresh()
+
+
+# Global instance shared by startup and the pairing QR pool
+local_address = LocalAddress()
@@ -0,0 +1,131 @@
+"""Byte-budgeted in-process cache for small, frequently served files."""
+
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from flask import Response, request, send_file
+
+
+class CachedObject:
+    """File bytes plus the validators needed to answer conditional requests."""
+
+    __slots__ = ('data', 'mimetype', 'etag', 'mtime')
+
+    def __init__(self, data: bytes, mimetype: str, etag: str, mtime: float):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+
+
+class HotObjectCache:
+    """
+    LRU cache of small served files (thumbnails, small photos) in memory.
+
+    Hits never touch the disk, not even for a stat: entries stay valid until
+    an upload or delete of that path calls `invalidate`. Files larger than
+    `max_object` are never cached and go through send_file, which hands the
+    open file to the WSGI server's file_wrapper (sendfile on servers that
+    support it) instead of copying it through Python.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_object: int = 512 * 1024):
+        self.max_bytes = max_bytes
+        self.max_object = max_object
+        self._entries = OrderedDict()  # {path: CachedObject}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0  # too large to cache
+        self._invalidations = 0  # guards against caching bytes read before an invalidate
+
+    def get(self, path: str) -> Optional[CachedObject]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+    def put(self, path: str, entry: CachedObject, seen_invalidations: Optional[int] = None):
+        with self._lock:
+            if seen_invalidations is not None and seen_invalidations != self._invalidations:
+                return  # the file may have changed while it was being read
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._total -= len(old.data)
+            self._entries[path] = entry
+            self._total += len(entry.data)
+            while self._total > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= len(evicted.data)
+                self.evictions += 1
+
+    def invalidate(self, path: str):
+        """Drop a file after it was overwritten or deleted."""
+        with self._lock:
+            self._invalidations += 1
+            old = self._entries.pop(os.path.abspath(path), None)
+            if old is not None:
+                self._total -= len(old.data)
+
+    def invalidate_prefix(self, directory: str):
+        """Drop every cached file under a directory (token removed)."""
+        prefix = os.path.abspath(directory) + os.sep
+        with self._lock:
+            self._invalidations += 1
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                self._total -= len(self._entries.pop(path).data)
+
+    def serve(self, path: str, mimetype: Optional[str] = None) -> Response:
+        """Serve a file from memory when small, or via send_file when large."""
+        path = os.path.abspath(path)
+        entry = self.get(path)
+        if entry is None:
+            seen = self._invalidations
+            stat = os.stat(path)
+            if stat.st_size > self.max_object:
+                with self._lock:
+                    self.bypassed += 1
+                return send_file(path, mimetype=mimetype, conditional=True)
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = CachedObject(
+                data,
+                mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                f'{stat.st_mtime_ns:x}-{stat.st_size:x}',
+                stat.st_mtime
+            )
+            self.put(path, entry, seen)
+
+        response = Response(entry.data, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.mtime
+        return response.make_conditional(request)
+
+    def get_stats(self) -> Dict:
+        """Usage and hit-rate figures for the admin panel."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'objects': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'max_object': self.max_object,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'bypassed': self.bypassed
+            }
+
+
+# Global instance shared by the serving routes
+object_cache = HotObjectCache()
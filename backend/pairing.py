@@ -1,38 +1,172 @@
 """Device pairing and local network sync management."""
 
+import functools
+import logging
 import secrets
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 
+try:
+    from backend.catalog import catalog_cache
+    from backend.event_log import event_log
+    from backend.generations import generations
+except ImportError:
+    from catalog import catalog_cache
+    from event_log import event_log
+    from generations import generations
+
+try:
+    from backend.layout import get_layout
+except ImportError:
+    from layout import get_layout
+
+try:
+    from backend.startup_profile import startup_profiler
+except ImportError:
+    from startup_profile import startup_profiler
+
 # Store paired devices: {pairing_token: {device_id, device_name, ip, port, paired_at, expires_at}}
+# Only confirmed pairings live here; pending ones are in PairingManager.pending
 PAIRED_DEVICES = {}
 
+# How long a QR code can be scanned before its pending pairing is dropped
+PENDING_TTL = timedelta(minutes=15)
+
+# What device summaries count as photos and videos (phone formats included)
+DEVICE_PHOTO_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif'}
+DEVICE_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.3gp'}
+
+
+def device_media_type(name: str) -> str:
+    """'image', 'video' or 'other'; every file counts towards a device's total size."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in DEVICE_PHOTO_EXTENSIONS:
+        return 'image'
+    if ext in DEVICE_VIDEO_EXTENSIONS:
+        return 'video'
+    return 'other'
+
+
+class PendingPairings:
+    """
+    Bounded, short-lived table of pairings waiting for a phone to scan them.
+
+    Kept in memory only: entries expire after `ttl` and the oldest are
+    evicted beyond `max_entries`, so unscanned QR codes never reach
+    paired_devices.json and cannot grow it.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: timedelta = PENDING_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl.total_seconds()
+        self._entries = OrderedDict()  # {token: (record, expires_monotonic)}
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._entries:
+            token, (_, expires) = next(iter(self._entries.items()))
+            if expires > now:
+                break
+            del self._entries[token]
+
+    def add(self, token: str, record: Dict):
+        with self._lock:
+            self._purge()
+            self._entries[token] = (record, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(token)
+            return entry[0] if entry else None
+
+    def pop(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            self._purge()
+            entry = self._entries.pop(token, None)
+            return entry[0] if entry else None
+
+    def tokens(self) -> List[str]:
+        with self._lock:
+            self._purge()
+            return list(self._entries)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge()
+            return len(self._entries)
+
+
+def _after_load(method):
+    """Block a registry method until the background load has finished."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.loaded.wait()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class PairingManager:
     """Manages device pairing, authentication tokens, and sync metadata."""
     
-    def __init__(self, pairing_file: str = "paired_devices.json"):
+    def __init__(self, pairing_file: str = "paired_devices.json", background_load: bool = True):
         self.pairing_file = pairing_file
-        self.load_pairings()
+        self.pending = PendingPairings()
+        # Serialises bulk changes with the registry write that commits them
+        self._lock = threading.RLock()
+        # Set once PAIRED_DEVICES reflects the file; registry methods wait on it
+        self.loaded = threading.Event()
+        if background_load:
+            threading.Thread(target=self.load_pairings, name='pairing-load', daemon=True).start()
+        else:
+            self.load_pairings()
     
     def load_pairings(self):
         """Load paired devices from persistent storage."""
         global PAIRED_DEVICES
-        if os.path.exists(self.pairing_file):
-            try:
-                with open(self.pairing_file, 'r') as f:
-                    PAIRED_DEVICES = json.load(f)
-            except Exception:
-                PAIRED_DEVICES = {}
+        start = time.perf_counter()
+        stale_pending = 0
+        try:
+            if os.path.exists(self.pairing_file):
+                try:
+                    with open(self.pairing_file, 'r') as f:
+                        PAIRED_DEVICES = json.load(f)
+                except Exception:
+                    PAIRED_DEVICES = {}
+            # Older versions persisted every unscanned QR as "pending"
+            for token in [t for t, dev in PAIRED_DEVICES.items() if dev.get('status') != 'confirmed']:
+                del PAIRED_DEVICES[token]
+                stale_pending += 1
+        finally:
+            startup_profiler.record('pairing registry load', time.perf_counter() - start)
+            self.loaded.set()
+        if stale_pending:
+            event_log.emit('pairing', f"Dropped {stale_pending} stale pending pairing(s) from {self.pairing_file}",
+                           state='stale_dropped', count=stale_pending)
+            self.save_pairings()
     
+    @_after_load
     def save_pairings(self):
         """Save paired devices to persistent storage."""
+        # Every registry mutation ends here; invalidate cached device listings
+        generations.bump('pairing')
         try:
-            with open(self.pairing_file, 'w') as f:
-                json.dump(PAIRED_DEVICES, f, indent=2)
+            with self._lock:
+                with open(self.pairing_file, 'w') as f:
+                    json.dump(PAIRED_DEVICES, f, indent=2)
         except Exception as e:
-            print(f"Failed to save pairings: {e}")
+            event_log.emit('pairing_registry', f"Failed to save pairings: {e}", logging.ERROR,
+                           path=self.pairing_file, error=str(e))
     
     def generate_pairing_token(self) -> str:
         """Generate a secure pairing token."""
@@ -42,6 +176,7 @@ class PairingManager:
         """Generate a unique device ID."""
         return secrets.token_hex(8)
     
+    @_after_load
     def create_pairing_qr_data(self, local_ip: str, port: int, device_name: str = "PC") -> Dict:
         """
         Create pairing QR data with device info.
@@ -63,8 +198,8 @@ class PairingManager:
             "protocol": "https"  # Force HTTPS for security
         }
         
-        # Store the pairing attempt
-        PAIRED_DEVICES[pairing_token] = {
+        # Remember the pairing attempt in memory until the phone confirms it
+        self.pending.add(pairing_token, {
             "device_id": device_id,
             "device_name": device_name,
             "ip": local_ip,
@@ -74,8 +209,8 @@ class PairingManager:
             "status": "pending",  # pending -> confirmed after phone scan
             "synced_files": [],
             "last_sync": None
-        }
-        self.save_pairings()
+        })
+        event_log.emit('pairing', state='pending', token=pairing_token, device_id=device_id, ip=local_ip)
         
         return pairing_data
     
@@ -98,10 +233,11 @@ class PairingManager:
         
         return pairing_url, pairing_data
     
+    @_after_load
     def verify_pairing_token(self, token: str) -> bool:
-        """Verify if a pairing token is valid."""
+        """Verify if a pairing token is valid (confirmed, or pending and unexpired)."""
         if token not in PAIRED_DEVICES:
-            return False
+            return self.pending.get(token) is not None
         
         device = PAIRED_DEVICES[token]
         expires_at = datetime.fromisoformat(device['expires_at'])
@@ -110,19 +246,22 @@ class PairingManager:
         if datetime.now() > expires_at:
             del PAIRED_DEVICES[token]
             self.save_pairings()
+            event_log.emit('pairing', state='expired', token=token, removed=True)
             return False
         
         return True
     
+    @_after_load
     def confirm_pairing(self, token: str, phone_device_id: str, phone_device_name: str) -> bool:
         """
         Confirm a pairing from the phone side.
         Phone sends its device ID and name when confirming pairing.
         """
-        if token not in PAIRED_DEVICES:
+        device = PAIRED_DEVICES.get(token) or self.pending.pop(token)
+        if device is None:
             return False
         
-        device = PAIRED_DEVICES[token]
+        PAIRED_DEVICES[token] = device
         device['status'] = 'confirmed'
         device['phone_device_id'] = phone_device_id
         device['phone_device_name'] = phone_device_name
@@ -130,8 +269,11 @@ class PairingManager:
         device['active'] = True
         device['last_seen'] = datetime.now().isoformat()
         self.save_pairings()
+        event_log.emit('pairing', state='confirmed', token=token, device_id=device.get('device_id'),
+                       phone_device_id=phone_device_id, phone_device_name=phone_device_name)
         return True
     
+    @_after_load
     def get_paired_devices(self) -> List[Dict]:
         """Get list of all confirmed paired devices."""
         return [
@@ -139,10 +281,12 @@ class PairingManager:
             if dev.get('status') == 'confirmed'
         ]
     
+    @_after_load
     def get_device_by_token(self, token: str) -> Optional[Dict]:
         """Get device info by pairing token."""
-        return PAIRED_DEVICES.get(token)
+        return PAIRED_DEVICES.get(token) or self.pending.get(token)
     
+    @_after_load
     def update_sync_info(self, token: str, files: List[Dict]):
         """Update sync metadata for a paired device."""
         if token in PAIRED_DEVICES:
@@ -150,14 +294,113 @@ class PairingManager:
             PAIRED_DEVICES[token]['last_sync'] = datetime.now().isoformat()
             self.save_pairings()
     
+    @_after_load
     def revoke_pairing(self, token: str) -> bool:
         """Revoke a device pairing."""
-        if token in PAIRED_DEVICES:
-            del PAIRED_DEVICES[token]
-            self.save_pairings()
-            return True
-        return False
+        return bool(self.bulk_revoke([token]))
+    
+    def _is_expired(self, device: Dict) -> bool:
+        try:
+            return datetime.now() > datetime.fromisoformat(device['expires_at'])
+        except (KeyError, ValueError):
+            return False
+    
+    def _days_inactive(self, device: Dict) -> Optional[float]:
+        """Days since the device was last seen (or confirmed, if never seen)."""
+        stamp = device.get('last_seen') or device.get('confirmed_at') or device.get('paired_at')
+        try:
+            return (datetime.now() - datetime.fromisoformat(stamp)).total_seconds() / 86400
+        except (TypeError, ValueError):
+            return None  # Invalid date format
+    
+    @_after_load
+    def select_tokens(self, status: str = 'all', inactive_days: Optional[float] = None) -> List[str]:
+        """
+        Tokens matching a bulk-operation filter.
+        
+        status: 'pending' (unscanned QR codes), 'expired' (confirmed pairings
+        past expires_at), 'inactive' (not seen for `inactive_days`, default 30),
+        'confirmed' or 'all'.
+        """
+        if status == 'pending':
+            return self.pending.tokens()
+        if status not in ('expired', 'inactive', 'confirmed', 'all'):
+            raise ValueError(f'unknown status filter: {status}')
+        days = 30 if inactive_days is None else inactive_days
+        selected = []
+        for token, device in list(PAIRED_DEVICES.items()):
+            if status == 'expired' and not self._is_expired(device):
+                continue
+            if status == 'inactive':
+                inactive = self._days_inactive(device)
+                if inactive is None or inactive <= days:
+                    continue
+            selected.append(token)
+        if status == 'all':
+            selected.extend(self.pending.tokens())
+        return selected
+    
+    @_after_load
+    def describe_tokens(self, tokens: List[str]) -> List[Dict]:
+        """Summaries for a bulk-operation preview; unknown tokens are marked as such."""
+        described = []
+        for token in tokens:
+            device = PAIRED_DEVICES.get(token)
+            if device is None:
+                status = 'pending' if self.pending.get(token) is not None else 'unknown'
+                described.append({'token': token, 'status': status})
+                continue
+            described.append({
+                'token': token,
+                'device_name': device.get('phone_device_name', device.get('device_name')),
+                'status': 'expired' if self._is_expired(device) else device.get('status', 'confirmed'),
+                'last_seen': device.get('last_seen')
+            })
+        return described
+    
+    @_after_load
+    def bulk_revoke(self, tokens: List[str]) -> List[str]:
+        """Remove many pairings with a single registry write; returns the removed tokens."""
+        removed = []
+        with self._lock:
+            persisted = False
+            for token in tokens:
+                if self.pending.pop(token) is not None:
+                    removed.append(token)
+                elif PAIRED_DEVICES.pop(token, None) is not None:
+                    removed.append(token)
+                    persisted = True
+            if persisted:
+                self.save_pairings()
+        for token in removed:
+            event_log.emit('pairing', state='revoked', token=token)
+        return removed
+    
+    @_after_load
+    def bulk_expire(self, tokens: List[str]) -> List[str]:
+        """
+        Expire many confirmed pairings now, keeping their records (and files)
+        until they are revoked. Pending tokens are simply dropped.
+        """
+        expired = []
+        now = datetime.now().isoformat()
+        with self._lock:
+            persisted = False
+            for token in tokens:
+                if self.pending.pop(token) is not None:
+                    expired.append(token)
+                elif token in PAIRED_DEVICES:
+                    PAIRED_DEVICES[token]['expires_at'] = now
+                    PAIRED_DEVICES[token]['active'] = False
+                    expired.append(token)
+                    persisted = True
+            if persisted:
+                self.save_pairings()
+        for token in expired:
+            event_log.emit('pairing', state='expired', token=token, removed=False)
+        return expired
     
+    @_after_load
     def update_device_activity(self, token: str) -> bool:
         """Update last_seen timestamp for a device."""
         if token in PAIRED_DEVICES:
@@ -167,6 +410,23 @@ class PairingManager:
             return True
         return False
     
+    def is_device_active(self, device: Dict) -> bool:
+        """Check if device is active (seen within last 5 minutes)."""
+        last_seen = device.get('last_seen')
+        if not last_seen:
+            return False
+        last_seen_dt = datetime.fromisoformat(last_seen)
+        return (datetime.now() - last_seen_dt).total_seconds() < 300  # 5 minutes
+    
+    @_after_load
+    def count_active_devices(self) -> int:
+        """Count confirmed devices currently considered active (memory only)."""
+        return sum(
+            1 for dev in PAIRED_DEVICES.values()
+            if dev.get('status') == 'confirmed' and self.is_device_active(dev)
+        )
+    
+    @_after_load
     def get_device_stats(self, token: str) -> Dict:
         """Get photo/video counts and stats for a device."""
         if token not in PAIRED_DEVICES:
@@ -174,45 +434,28 @@ class PairingManager:
         
         device = PAIRED_DEVICES[token]
         
-        # Count photos and videos from uploads directory
-        upload_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', token)
-        photo_count = 0
-        video_count = 0
-        total_size = 0
-        
-        if os.path.isdir(upload_path):
-            for fname in os.listdir(upload_path):
-                fpath = os.path.join(upload_path, fname)
-                if os.path.isfile(fpath):
-                    ext = os.path.splitext(fname)[1].lower()
-                    total_size += os.path.getsize(fpath)
-                    
-                    if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif']:
-                        photo_count += 1
-                    elif ext in ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.3gp']:
-                        video_count += 1
+        # Count photos and videos from uploads directory (catalog reused until files change)
+        catalog = catalog_cache.get(token, get_layout().token_dir(token), device_media_type)
+        photo_count = catalog.count('image')
+        video_count = catalog.count('video')
         
-        # Check if device is active (seen within last 5 minutes)
         last_seen = device.get('last_seen')
-        is_active = False
-        if last_seen:
-            last_seen_dt = datetime.fromisoformat(last_seen)
-            is_active = (datetime.now() - last_seen_dt).total_seconds() < 300  # 5 minutes
         
         return {
             'token': token,
             'device_name': device.get('phone_device_name', 'Unknown Device'),
             'status': device.get('status', 'pending'),
-            'active': is_active,
+            'active': self.is_device_active(device),
             'photo_count': photo_count,
             'video_count': video_count,
             'total_files': photo_count + video_count,
-            'total_size': total_size,
+            'total_size': catalog.total_size(),
             'last_seen': last_seen,
             'last_sync': device.get('last_sync'),
             'paired_at': device.get('confirmed_at', device.get('paired_at'))
         }
     
+    @_after_load
     def get_all_devices_with_stats(self) -> List[Dict]:
         """Get all devices with real-time stats."""
         devices_with_stats = []
@@ -222,32 +465,10 @@ class PairingManager:
                 devices_with_stats.append(stats)
         return devices_with_stats
     
+    @_after_load
     def cleanup_inactive_devices(self, inactive_days: int = 30) -> int:
         """Remove devices that haven't been active for specified days."""
-        removed_count = 0
-        tokens_to_remove = []
-        
-        for token, device in PAIRED_DEVICES.items():
-            last_seen = device.get('last_seen')
-            if last_seen:
-                try:
-                    last_seen_dt = datetime.fromisoformat(last_seen)
-                    days_inactive = (datetime.now() - last_seen_dt).total_seconds() / 86400
-                    
-                    if days_inactive > inactive_days:
-                        tokens_to_remove.append(token)
-                except Exception:
-                    pass  # Invalid date format
-        
-        # Remove inactive devices
-        for token in tokens_to_remove:
-            del PAIRED_DEVICES[token]
-            removed_count += 1
-        
-        if removed_count > 0:
-            self.save_pairings()
-        
-        return removed_count
+        return len(self.bulk_revoke(self.select_tokens('inactive', inactive_days)))
 
 
 # Global instance
@@ -0,0 +1,157 @@
+"""Background-warmed pool of pending pairings with pre-rendered QR codes."""
+
+import base64
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+try:
+    from backend.event_log import event_log
+except ImportError:
+    from event_log import event_log
+
+
+class PreparedPairing:
+    """A pending pairing whose QR image is already rendered."""
+
+    __slots__ = ('pairing_url', 'pairing_data', 'qr_data_url', 'ip', 'device_name', 'created')
+
+    def __init__(self, pairing_url: str, pairing_data: Dict, qr_data_url: str, ip: str, device_name: str):
+        self.pairing_url = pairing_url
+        self.pairing_data = pairing_data
+        self.qr_data_url = qr_data_url
+        self.ip = ip
+        self.device_name = device_name
+        self.created = time.monotonic()
+
+
+class PairingQRPool:
+    """
+    Keeps `size` pairings ready so /api/pairing/generate answers instantly.
+
+    Handing one out pops it from the pool and wakes the refill thread, which
+    registers the next pending pairing and renders its QR off the request
+    path. Entries are tied to the advertised address and PC name: an address
+    change (see LocalAddress.on_change) or a request for a different name
+    discards them, as does age, so a QR is never handed out with less than
+    `pairing lifetime - max_age` left. Discarded entries are revoked.
+    """
+
+    def __init__(self, manager, render_png: Callable[[str], bytes], address,
+                 port: int = 5000, size: int = 4, max_age: float = 300.0):
+        self.manager = manager
+        self.render_png = render_png
+        self.address = address
+        self.port = port
+        self.size = size
+        self.max_age = max_age
+        self.device_name = 'My PC'
+        self._ready = deque()
+        self._lock = threading.Lock()
+        self._wanted = threading.Event()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        address.on_change(lambda old, new: self.flush())
+
+    def start(self):
+        """Start the refill thread (idempotent)."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._refill, name='pairing-pool', daemon=True)
+        self._worker.start()
+        self._wanted.set()
+
+    def _prepare(self, device_name: str, ip: str) -> PreparedPairing:
+        """Register a pending pairing and render its QR (the slow part)."""
+        pairing_url, pairing_data = self.manager.get_pairing_qr_url(ip, self.port, device_name)
+        img_bytes = self.render_png(pairing_url)
+        qr_data_url = "data:image/png;base64," + base64.b64encode(img_bytes).decode("ascii")
+        return PreparedPairing(pairing_url, pairing_data, qr_data_url, ip, device_name)
+
+    def _usable(self, entry: PreparedPairing, device_name: str, ip: str) -> bool:
+        return (entry.device_name == device_name and entry.ip == ip
+                and time.monotonic() - entry.created < self.max_age)
+
+    def _discard(self, entries):
+        """Revoke pending pairings that will never be shown."""
+        for entry in entries:
+            self.manager.revoke_pairing(entry.pairing_data['pairing_token'])
+        with self._lock:
+            self.discarded += len(entries)
+
+    def take(self, device_name: str = 'My PC') -> PreparedPairing:
+        """Hand out a ready pairing, rendering one inline only if the pool is empty."""
+        self.start()
+        ip = self.address.get()
+        stale, found = [], None
+        with self._lock:
+            self.device_name = device_name
+            while self._ready and found is None:
+                entry = self._ready.popleft()
+                if self._usable(entry, device_name, ip):
+                    found = entry
+                else:
+                    stale.append(entry)
+            if found is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._wanted.set()
+        if stale:
+            self._discard(stale)
+        return found if found is not None else self._prepare(device_name, ip)
+
+    def flush(self):
+        """Drop every ready entry (address changed) and refill."""
+        with self._lock:
+            stale = list(self._ready)
+            self._ready.clear()
+        self._discard(stale)
+        self._wanted.set()
+
+    def _refill(self):
+        while True:
+            # Wake on demand, and periodically to replace entries that aged out
+            self._wanted.wait(timeout=self.max_age / 2)
+            self._wanted.clear()
+            try:
+                ip = self.address.get()
+                with self._lock:
+                    device_name = self.device_name
+                    stale = [e for e in self._ready if not self._usable(e, device_name, ip)]
+                    for entry in stale:
+                        self._ready.remove(entry)
+                    missing = self.size - len(self._ready)
+                self._discard(stale)
+                for _ in range(missing):
+                    entry = self._prepare(device_name, ip)
+                    current_ip = self.address.get()
+                    with self._lock:
+                        if self._usable(entry, self.device_name, current_ip):
+                            self._ready.append(entry)
+                            entry = None
+                    if entry is not None:
+                        # Name or address changed while rendering
+                        self._discard([entry])
+                        self._wanted.set()
+                        break
+            except Exception as e:
+                event_log.emit('pairing', f"Pairing pool refill failed: {e}", logging.WARNING,
+                               state='pool_refill_failed', error=str(e))
+
+    def get_stats(self) -> Dict:
+        """Pool fill level and hit counts for the admin panel."""
+        with self._lock:
+            return {
+                'ready': len(self._ready),
+                'size': self.size,
+                'device_name': self.device_name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded
+            }
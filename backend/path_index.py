@@ -0,0 +1,193 @@
+"""In-memory per-token folder trie for lazy, per-level storage browsing."""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from backend.scrubber import is_partial_name
+except ImportError:
+    from scrubber import is_partial_name
+
+
+class PathNode:
+    """A folder in the trie with aggregate counts for its whole subtree."""
+
+    __slots__ = ('folders', 'files', 'file_count', 'total_size')
+
+    def __init__(self):
+        self.folders = {}  # {name: PathNode}
+        self.files = {}  # {name: size}
+        self.file_count = 0  # files in this folder and all subfolders
+        self.total_size = 0  # bytes in this folder and all subfolders
+
+
+class PathIndex:
+    """
+    Folder trie per token, built from one directory walk on first use.
+
+    After that it is maintained incrementally by `add`/`remove`, so opening a
+    folder costs a dict lookup per path segment plus the size of that one
+    folder, regardless of how many files the session holds elsewhere.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        self._roots = {}  # {token: PathNode}
+        self._epoch = 0  # bumped by remove()/drop(); a build that raced one is redone
+        self._lock = threading.Lock()
+
+    def _build(self, token: str) -> PathNode:
+        """Build a token's trie from disk (called without the lock)."""
+        root = PathNode()
+        session_path = self.layout.token_dir(token)
+        for dirpath, _dirnames, filenames in os.walk(session_path):
+            rel_dir = os.path.relpath(dirpath, session_path)
+            for fname in filenames:
+                if is_partial_name(fname):
+                    continue
+                try:
+                    size = os.path.getsize(os.path.join(dirpath, fname))
+                except OSError:
+                    continue
+                rel = fname if rel_dir == '.' else f'{rel_dir}/{fname}'
+                self._insert(root, rel.replace(os.sep, '/'), size)
+        return root
+
+    def _lock_root(self, token: str) -> PathNode:
+        """
+        Acquire the lock and return the token's trie, building it first if
+        needed. The walk runs without the lock so other tokens are never held
+        up; it is redone if a file was removed meanwhile (it may be stale).
+        """
+        while True:
+            self._lock.acquire()
+            root = self._roots.get(token)
+            if root is not None:
+                return root
+            epoch = self._epoch
+            self._lock.release()
+            built = self._build(token)
+            with self._lock:
+                if self._epoch == epoch:
+                    self._roots.setdefault(token, built)
+
+    @staticmethod
+    def _insert(root: PathNode, rel_path: str, size: int):
+        """Insert or replace a file, keeping subtree aggregates consistent."""
+        *dirs, fname = rel_path.split('/')
+        chain = [root]
+        for name in dirs:
+            chain.append(chain[-1].folders.setdefault(name, PathNode()))
+        old = chain[-1].files.get(fname)
+        chain[-1].files[fname] = size
+        for node in chain:
+            node.total_size += size - (old or 0)
+            if old is None:
+                node.file_count += 1
+
+    def add(self, token: str, rel_path: str, size: int):
+        """Record an uploaded (or overwritten) file."""
+        root = self._lock_root(token)
+        try:
+            self._insert(root, rel_path, size)
+        finally:
+            self._lock.release()
+
+    def remove(self, token: str, rel_path: str):
+        """Forget a deleted file, pruning folders that become empty."""
+        with self._lock:
+            self._epoch += 1
+            root = self._roots.get(token)
+            if root is None:
+                return
+            *dirs, fname = rel_path.split('/')
+            chain = [root]
+            for name in dirs:
+                node = chain[-1].folders.get(name)
+                if node is None:
+                    return
+                chain.append(node)
+            size = chain[-1].files.pop(fname, None)
+            if size is None:
+                return
+            for node in chain:
+                node.total_size -= size
+                node.file_count -= 1
+            for parent, name, node in reversed(list(zip(chain, dirs, chain[1:]))):
+                if node.file_count == 0 and not node.folders:
+                    del parent.folders[name]
+
+    def drop(self, token: str):
+        """Forget a whole token (its directory was removed)."""
+        with self._lock:
+            self._epoch += 1
+            self._roots.pop(token, None)
+
+    def peek(self, token: str) -> Optional[Tuple[int, int]]:
+        """(file_count, total_size) of a token if its trie is built, without building it."""
+        with self._lock:
+            root = self._roots.get(token)
+            return (root.file_count, root.total_size) if root is not None else None
+
+    def summary(self, token: str) -> Tuple[int, int]:
+        """(file_count, total_size) of a token, building its trie on first use."""
+        root = self._lock_root(token)
+        try:
+            return root.file_count, root.total_size
+        finally:
+            self._lock.release()
+
+    def list_files(self, token: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """A slice of all files of a token (whole tree, folder by folder in name order)."""
+        files = []
+        end = offset + limit if limit is not None else None
+        root = self._lock_root(token)
+        try:
+            stack = [('', root)]
+            while stack and (end is None or len(files) < end):
+                prefix, node = stack.pop()
+                for name, size in sorted(node.files.items()):
+                    files.append({'name': prefix + name, 'size': size})
+                # Reversed so folders pop in name order; files precede subfolders
+                for name, child in sorted(node.folders.items(), reverse=True):
+                    stack.append((f'{prefix}{name}/', child))
+        finally:
+            self._lock.release()
+        return files[offset:end]
+
+    def get_children(self, token: str, path: str = '') -> Optional[Dict]:
+        """
+        Return the immediate folders and files under `path`.
+
+        Folders carry the file count and byte total of their whole subtree,
+        so a UI can show sizes without opening them. Returns None when the
+        folder does not exist.
+        """
+        node = self._lock_root(token)
+        try:
+            for name in [p for p in path.split('/') if p]:
+                node = node.folders.get(name)
+                if node is None:
+                    return None
+            prefix = f"{path.strip('/')}/" if path.strip('/') else ''
+            return {
+                'path': path.strip('/'),
+                'file_count': node.file_count,
+                'total_size': node.total_size,
+                'folders': [
+                    {
+                        'name': name,
+                        'path': prefix + name,
+                        'file_count': child.file_count,
+                        'total_size': child.total_size
+                    }
+                    for name, child in sorted(node.folders.items())
+                ],
+                'files': [
+                    {'name': name, 'size': size, 'path': prefix + name}
+                    for name, size in sorted(node.files.items())
+                ]
+            }
+        finally:
+            self._lock.release()
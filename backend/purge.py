@@ -0,0 +1,130 @@
+"""Remove token upload directories: instantly from every index, lazily from disk."""
+
+import logging
+import os
+import queue
+import secrets
+import shutil
+import threading
+from typing import Dict
+
+try:
+    from backend.event_log import event_log
+    from backend.generations import generations
+    from backend.object_cache import object_cache
+except ImportError:
+    from event_log import event_log
+    from generations import generations
+    from object_cache import object_cache
+
+# Directory under the upload root holding purged uploads until deleted;
+# dot-directories are skipped by StorageLayout.iter_token_dirs
+TRASH_DIR = '.trash'
+
+
+class UploadPurger:
+    """
+    Deletes a token's uploads without making the caller wait for the disk.
+
+    `purge` renames the token directory into .trash on its own volume (a
+    single atomic rename) and updates quotas, the folder index, the hot
+    object cache and listing generations right away, so the files disappear
+    from every API at once. A background thread then removes the trash
+    directory. Leftovers from an interrupted run are picked up by `start`.
+    """
+
+    def __init__(self, storage, quota_manager):
+        self.storage = storage
+        self.quota_manager = quota_manager
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self.queued = 0
+        self.deleted = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the delete thread and requeue trash left by a previous run."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._work, name='upload-purge', daemon=True)
+        self._worker.start()
+        for volume in self.storage.layout.volumes:
+            trash_dir = os.path.join(volume, TRASH_DIR)
+            if os.path.isdir(trash_dir):
+                for name in os.listdir(trash_dir):
+                    self._enqueue(os.path.join(trash_dir, name))
+
+    def _enqueue(self, path: str):
+        with self._lock:
+            self.queued += 1
+        self._queue.put(path)
+
+    def purge(self, token: str) -> bool:
+        """Detach a token's uploads and schedule their deletion; False if it has none."""
+        session_path = self.storage.layout.token_dir(token)
+        if not os.path.isdir(session_path):
+            return False
+        self.start()
+        trash_dir = os.path.join(self.storage.layout.volume_of(session_path), TRASH_DIR)
+        os.makedirs(trash_dir, exist_ok=True)
+        trash_path = os.path.join(trash_dir, f'{token}-{secrets.token_hex(4)}')
+        summary = self.storage.index.peek(token)
+        os.rename(session_path, trash_path)
+        event_log.emit('cleanup', kind='purge', token=token,
+                       files=summary[0] if summary else None, bytes=summary[1] if summary else None)
+
+        self.quota_manager.forget(token)
+        self.storage.index.drop(token)
+        self.storage.search.drop(token)
+        object_cache.invalidate_prefix(session_path)
+        generations.bump_token(token)
+        self._enqueue(trash_path)
+        return True
+
+    def remove_file(self, token: str, rel_path: str) -> int:
+        """
+        Delete one stored file and update every index; returns the bytes freed.
+        Single files are unlinked inline, which is cheap. `rel_path` is taken
+        verbatim (as found on disk) but must stay inside the token directory.
+        """
+        session_path = self.storage.layout.token_dir(token)
+        path = os.path.abspath(os.path.join(session_path, *rel_path.split('/')))
+        if os.path.commonpath([path, session_path]) != session_path or path == session_path:
+            raise ValueError(f'path escapes the session directory: {rel_path}')
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            size = 0
+        self.quota_manager.adjust(token, -size)
+        self.storage.index.remove(token, rel_path)
+        self.storage.search.remove(token, rel_path)
+        object_cache.invalidate(path)
+        generations.bump_token(token)
+        event_log.emit('file_deleted', token=token, path=rel_path, bytes=size)
+        return size
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            try:
+                shutil.rmtree(path)
+                with self._lock:
+                    self.deleted += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                event_log.emit('storage_error', f"Could not delete purged uploads {path}: {e}", logging.ERROR,
+                               path=path, error=str(e))
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    self.queued -= 1
+
+    def get_stats(self) -> Dict:
+        """Deletion backlog for the admin panel."""
+        with self._lock:
+            return {'pending': self.queued, 'deleted': self.deleted, 'errors': self.errors}
@@ -0,0 +1,213 @@
+"""Per-token and global upload quotas with O(1) usage accounting."""
+
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    from backend.gallery_utils import UploadManager
+except ImportError:
+    from gallery_utils import UploadManager
+
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+
+
+class QuotaManager:
+    """
+    Tracks bytes stored per token and enforces upload limits.
+
+    Usage counters are seeded with a single directory walk the first time a
+    token (or the whole upload root) is seen, then maintained incrementally
+    from upload reservations, so admission checks never walk the tree. The
+    seeding walk runs outside the lock and its result is only installed if
+    no counter was dropped meanwhile, so it never stalls other uploads.
+
+    Limits:
+        token_limit:  default per-token byte budget (None = unlimited)
+        global_limit: byte budget for all tokens combined (None = unlimited)
+        min_free:     bytes that must stay free on the volume a token is placed on
+        overrides:    {token: limit} per-token budgets (None = unlimited)
+    """
+
+    DEFAULT_LIMITS = {
+        'token_limit': 5 * GB,
+        'global_limit': None,
+        'min_free': 512 * MB,
+        'overrides': {},
+    }
+
+    def __init__(self, layout, settings_file: str = "quota_settings.json"):
+        self.layout = layout
+        self.base_path = layout.root
+        self.settings_file = settings_file
+        self.limits = json.loads(json.dumps(self.DEFAULT_LIMITS))
+        self._usage = {}  # {token: bytes stored + bytes reserved}
+        self._total = None  # seeded lazily from one walk of the token directories
+        self._epoch = 0  # bumped by forget(); a seed walk that raced one is redone
+        self._lock = threading.Lock()
+        self.load_settings()
+
+    def load_settings(self):
+        """Load quota limits from persistent storage."""
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    self.limits.update(json.load(f))
+            except Exception:
+                pass
+
+    def save_settings(self):
+        """Save quota limits to persistent storage."""
+        try:
+            with open(self.settings_file, 'w') as f:
+                json.dump(self.limits, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save quota settings: {e}")
+
+    def _seed(self, token: Optional[str] = None):
+        """Seed the counters of `token` and the total if needed, walking without the lock."""
+        while True:
+            with self._lock:
+                need_token = token is not None and token not in self._usage
+                need_total = self._total is None
+                epoch = self._epoch
+            if not (need_token or need_total):
+                return
+            used = UploadManager.get_directory_size(self.layout.token_dir(token)) if need_token else None
+            # Token directories only: skips dot-directories such as the purge trash
+            total = sum(
+                UploadManager.get_directory_size(path) for _token, path in self.layout.iter_token_dirs()
+            ) if need_total else None
+            with self._lock:
+                if self._epoch != epoch:
+                    continue  # a counter was dropped while walking; the walk may be stale
+                if need_token and token not in self._usage:
+                    self._usage[token] = used
+                if need_total and self._total is None:
+                    self._total = total
+                return
+
+    def _lock_seeded(self, token: Optional[str] = None):
+        """Acquire the lock with the counters of `token` and the total seeded."""
+        while True:
+            self._seed(token)
+            self._lock.acquire()
+            if (token is None or token in self._usage) and self._total is not None:
+                return
+            self._lock.release()  # dropped again by forget() in between
+
+    def token_limit(self, token: str) -> Optional[int]:
+        """Effective byte budget for a token."""
+        overrides = self.limits.get('overrides') or {}
+        if token in overrides:
+            return overrides[token]
+        return self.limits.get('token_limit')
+
+    def reserve(self, token: str, size: int) -> Optional[Tuple[int, Dict]]:
+        """
+        Reserve `size` bytes for an incoming upload before it is streamed.
+
+        Returns None when admitted (the caller must later `commit` or
+        `release`), or (status_code, error_payload) with 413 when the token
+        is over its budget and 507 when global or disk capacity is exhausted.
+        """
+        self._lock_seeded(token)
+        try:
+            used = self._usage[token]
+            limit = self.token_limit(token)
+            if limit is not None and used + size > limit:
+                return 413, {
+                    'error': 'Storage quota exceeded for this device',
+                    'quota': {'used': used, 'limit': limit, 'requested': size}
+                }
+
+            total = self._total
+            global_limit = self.limits.get('global_limit')
+            if global_limit is not None and total + size > global_limit:
+                return 507, {
+                    'error': 'Server storage is full',
+                    'quota': {'used': total, 'limit': global_limit, 'requested': size}
+                }
+
+            # Free space of the volume this token's uploads are placed on
+            volume = self.layout.volume_of(self.layout.place(token))
+            try:
+                free = shutil.disk_usage(volume).free
+            except OSError:
+                free = None
+            min_free = self.limits.get('min_free') or 0
+            if free is not None and free - size < min_free:
+                return 507, {
+                    'error': 'Server disk is almost full',
+                    'quota': {'free': free, 'reserve': min_free, 'requested': size}
+                }
+
+            self._usage[token] = used + size
+            self._total = total + size
+            return None
+        finally:
+            self._lock.release()
+
+    def commit(self, token: str, reserved: int, actual: int):
+        """Replace a reservation with the number of bytes actually stored."""
+        self.adjust(token, actual - reserved)
+
+    def release(self, token: str, reserved: int):
+        """Return an unused reservation (failed or rejected upload)."""
+        self.adjust(token, -reserved)
+
+    def adjust(self, token: str, delta: int):
+        """Apply a byte delta to a token's counter (uploads, deletes, overwrites)."""
+        self._lock_seeded(token)
+        try:
+            self._usage[token] = max(0, self._usage[token] + delta)
+            self._total = max(0, self._total + delta)
+        finally:
+            self._lock.release()
+
+    def forget(self, token: str):
+        """Drop a token's counter after its directory was removed."""
+        with self._lock:
+            self._epoch += 1
+            used = self._usage.pop(token, None)
+            if used is None:
+                # Never seeded: its bytes are in the total but not known here
+                self._total = None
+            elif self._total is not None:
+                self._total = max(0, self._total - used)
+
+    def update_limits(self, changes: Dict) -> Dict:
+        """Apply admin changes to limits live and persist them."""
+        with self._lock:
+            for key in ('token_limit', 'global_limit', 'min_free'):
+                if key in changes:
+                    value = changes[key]
+                    self.limits[key] = int(value) if value is not None else None
+            for token, value in (changes.get('overrides') or {}).items():
+                overrides = self.limits.setdefault('overrides', {})
+                if value == 'default':
+                    overrides.pop(token, None)
+                else:
+                    overrides[token] = int(value) if value is not None else None
+        self.save_settings()
+        return self.get_status()
+
+    def get_status(self) -> Dict:
+        """Current limits and usage for the admin panel."""
+        self._lock_seeded()
+        try:
+            total = self._total
+            usage = {
+                token: {'used': used, 'limit': self.token_limit(token)}
+                for token, used in self._usage.items()
+            }
+            limits = json.loads(json.dumps(self.limits))
+        finally:
+            self._lock.release()
+        volumes = self.layout.get_volume_status()
+        primary = volumes[0]
+        disk_info = {'total': primary['total'], 'free': primary['free']} if primary['free'] is not None else {}
+        return {'limits': limits, 'total_used': total, 'tokens': usage, 'disk': disk_info, 'volumes': volumes}
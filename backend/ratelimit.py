@@ -0,0 +1,77 @@
+"""Token-bucket rate limiting keyed by client."""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` banked."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens; returns 0 when allowed, else seconds until it would be."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def charge(self, amount: float):
+        """Take `amount` tokens unconditionally; the balance may go negative and is repaid by later consumers."""
+        self._refill()
+        self.tokens -= amount
+
+
+class KeyedRateLimiter:
+    """
+    One token bucket per key (e.g. client address), `burst` requests banked
+    and `rate` per second sustained. Buckets are kept in an LRU bounded by
+    `max_keys`, so a flood of distinct clients cannot grow memory; an evicted
+    client simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 1024):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # {key: TokenBucket}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, key: str, cost: float = 1.0) -> float:
+        """Charge one request to `key`; returns 0 if allowed, else retry-after seconds."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            retry_after = bucket.consume(cost)
+            if retry_after:
+                self.rejected += 1
+            return retry_after
+
+
+def too_many_requests(retry_after: float, message: str = 'too many requests'):
+    """429 JSON response with a Retry-After header."""
+    response = jsonify({'error': message, 'retry_after': round(retry_after, 1)})
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response, 429
@@ -0,0 +1,289 @@
+"""On-demand request profiling: sampled cProfile or stack sampling, plus slow-request capture."""
+
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, Optional
+
+MODES = ('sampler', 'cprofile')
+
+# Distinct stacks kept in the aggregate collapsed profile
+MAX_STACKS = 20000
+
+
+def collapse(frame) -> str:
+    """'outer (file:line);...;inner (file:line)' for a flamegraph's collapsed format."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class ProfiledRequest:
+    """Timing and profile of one request in flight."""
+
+    __slots__ = ('thread_id', 'started', 'mode', 'profile', 'stacks')
+
+    def __init__(self, mode: Optional[str]):
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.mode = mode  # 'cprofile', 'sampler' or None (timed only)
+        self.profile = None  # cProfile.Profile
+        self.stacks = None  # Counter of collapsed stacks
+
+
+class RequestProfiler:
+    """
+    Profiles a sample of requests and keeps the slow ones.
+
+    Settings (persisted in profiling_settings.json):
+        enabled:         nothing is timed or profiled while off
+        sample_rate:     fraction of requests profiled
+        mode:            'sampler' walks the stacks of profiled requests every
+                         `interval_ms` from one background thread (cheap, no
+                         per-call overhead); 'cprofile' traces every call of
+                         one request at a time (exact, slower) and falls back
+                         to the sampler while another request holds it
+        interval_ms:     stack sampling period
+        slow_ms:         requests slower than this are captured with their
+                         route, token, payload sizes and (if profiled) profile
+        max_captures:    slow requests kept, newest first
+
+    Profiles of all sampled requests are also merged into one aggregate,
+    downloadable as pstats (cProfile) or collapsed stacks (sampler).
+    """
+
+    DEFAULT_SETTINGS = {
+        'enabled': False,
+        'sample_rate': 0.05,
+        'mode': 'sampler',
+        'interval_ms': 5,
+        'slow_ms': 1000,
+        'max_captures': 50,
+    }
+
+    def __init__(self, settings_file: str = "profiling_settings.json"):
+        self.settings_file = settings_file
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.requests_seen = 0
+        self.requests_profiled = 0
+        self.slow_requests = 0
+        self._next_id = 1
+        self._stats = None  # pstats.Stats merged from cProfile runs
+        self._stacks = Counter()  # merged collapsed stacks from the sampler
+        self._active = {}  # {thread id: ProfiledRequest} being stack-sampled
+        self._cprofile_busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        self.load_settings()
+        self._captures = deque(maxlen=self.settings['max_captures'])
+
+    def load_settings(self):
+        """Load profiling settings from persistent storage."""
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    self.settings.update(json.load(f))
+            except Exception:
+                pass
+
+    def save_settings(self):
+        """Save profiling settings to persistent storage."""
+        try:
+            with open(self.settings_file, 'w') as f:
+                json.dump(self.settings, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save profiling settings: {e}")
+
+    def update_settings(self, changes: Dict) -> Dict:
+        """Apply admin changes live and persist them."""
+        with self._lock:
+            settings = dict(self.settings)
+            if 'enabled' in changes:
+                settings['enabled'] = bool(changes['enabled'])
+            if 'mode' in changes:
+                if changes['mode'] not in MODES:
+                    raise ValueError(f"mode must be one of {', '.join(MODES)}")
+                settings['mode'] = changes['mode']
+            if 'sample_rate' in changes:
+                settings['sample_rate'] = float(changes['sample_rate'])
+                if not 0 <= settings['sample_rate'] <= 1:
+                    raise ValueError('sample_rate must be between 0 and 1')
+            for key in ('interval_ms', 'slow_ms', 'max_captures'):
+                if key in changes:
+                    settings[key] = float(changes[key]) if key == 'interval_ms' else int(changes[key])
+                    if settings[key] <= 0:
+                        raise ValueError(f'{key} must be positive')
+            self.settings = settings
+            if settings['max_captures'] != self._captures.maxlen:
+                self._captures = deque(self._captures, maxlen=settings['max_captures'])
+        self.save_settings()
+        return self.get_status()
+
+    def reset(self):
+        """Forget captures and aggregate profiles."""
+        with self._lock:
+            self._captures.clear()
+            self._stats = None
+            self._stacks = Counter()
+            self.requests_seen = self.requests_profiled = self.slow_requests = 0
+
+    # ---- request hooks -------------------------------------------------
+
+    def begin(self) -> Optional[ProfiledRequest]:
+        """Start timing (and maybe profiling) the current request; None while disabled."""
+        settings = self.settings
+        if not settings['enabled']:
+            return None
+        mode = None
+        if random.random() < settings['sample_rate']:
+            mode = settings['mode']
+            if mode == 'cprofile' and not self._cprofile_busy.acquire(blocking=False):
+                mode = 'sampler'  # one traced request at a time
+        req = ProfiledRequest(mode)
+        if mode == 'cprofile':
+            req.profile = cProfile.Profile()
+            req.profile.enable()
+        elif mode == 'sampler':
+            req.stacks = Counter()
+            with self._lock:
+                self._active[req.thread_id] = req
+            self._ensure_sampler()
+            self._wake.set()
+        return req
+
+    def finish(self, req: ProfiledRequest, info: Dict):
+        """Stop profiling; keep the request if it was slow. `info` describes the request."""
+        duration = time.perf_counter() - req.started
+        if req.mode == 'cprofile':
+            req.profile.disable()
+            self._cprofile_busy.release()
+        elif req.mode == 'sampler':
+            with self._lock:
+                self._active.pop(req.thread_id, None)
+
+        stats = pstats.Stats(req.profile) if req.mode == 'cprofile' else None
+        with self._lock:
+            self.requests_seen += 1
+            if req.mode:
+                self.requests_profiled += 1
+            if stats is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats()
+                self._stats.add(stats)
+            elif req.stacks:
+                if len(self._stacks) < MAX_STACKS:
+                    self._stacks.update(req.stacks)
+                else:
+                    for stack, count in req.stacks.items():
+                        if stack in self._stacks:
+                            self._stacks[stack] += count
+            if duration * 1000 < self.settings['slow_ms']:
+                return
+            self.slow_requests += 1
+            self._captures.appendleft({
+                'id': self._next_id,
+                'at': datetime.now().isoformat(),
+                'duration_ms': round(duration * 1000, 1),
+                'profile': req.mode,
+                'samples': sum(req.stacks.values()) if req.stacks else None,
+                **info,
+                '_stats': stats,
+                '_stacks': req.stacks
+            })
+            self._next_id += 1
+
+    # ---- stack sampler -------------------------------------------------
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._sampler is not None:
+                return
+            self._sampler = threading.Thread(target=self._sample_loop, name='request-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for req in active:
+                frame = frames.get(req.thread_id)
+                if frame is not None:
+                    req.stacks[collapse(frame)] += 1
+            del frames
+            time.sleep(self.settings['interval_ms'] / 1000)
+
+    # ---- reports -------------------------------------------------------
+
+    def _capture(self, capture_id: int) -> Dict:
+        for capture in self._captures:
+            if capture['id'] == capture_id:
+                return capture
+        raise KeyError(capture_id)
+
+    def pstats_dump(self, capture_id: Optional[int] = None) -> Optional[bytes]:
+        """Marshalled pstats (as written by Stats.dump_stats) of the aggregate or one capture."""
+        with self._lock:
+            stats = self._stats if capture_id is None else self._capture(capture_id)['_stats']
+            if stats is None:
+                return None
+            return marshal.dumps(stats.stats)
+
+    def collapsed(self, capture_id: Optional[int] = None) -> Optional[str]:
+        """Collapsed stacks ('a;b;c count' lines) for flamegraph.pl or speedscope."""
+        with self._lock:
+            stacks = self._stacks if capture_id is None else self._capture(capture_id)['_stacks']
+            if not stacks:
+                return None
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def top_functions(self, capture_id: Optional[int] = None, limit: int = 25) -> Optional[str]:
+        """Text report of the most expensive functions (cumulative time) from pstats."""
+        with self._lock:
+            stats = self._stats if capture_id is None else self._capture(capture_id)['_stats']
+            if stats is None:
+                return None
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(limit)
+            stats.stream = sys.stdout
+            return out.getvalue()
+
+    def get_status(self) -> Dict:
+        """Settings, counters and slow-request captures (without profile data)."""
+        with self._lock:
+            return {
+                'settings': dict(self.settings),
+                'requests_seen': self.requests_seen,
+                'requests_profiled': self.requests_profiled,
+                'slow_requests': self.slow_requests,
+                'in_flight_sampled': len(self._active),
+                'aggregate': {
+                    'pstats': self._stats is not None,
+                    'stacks': len(self._stacks),
+                    'samples': sum(self._stacks.values())
+                },
+                'captures': [{key: value for key, value in capture.items() if not key.startswith('_')}
+                             for capture in self._captures]
+            }
+
+
+# Global instance used by the request hooks in app.py
+request_profiler = RequestProfiler()
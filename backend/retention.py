@@ -0,0 +1,356 @@
+"""Policy-driven retention: removes old or least-recently-used uploads in the background."""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+try:
+    from backend.event_log import event_log
+    from backend.ratelimit import TokenBucket
+    from backend.scrubber import is_partial_name
+except ImportError:
+    from event_log import event_log
+    from ratelimit import TokenBucket
+    from scrubber import is_partial_name
+
+# Planned deletions included in a run report (dry runs in particular)
+SAMPLE_SIZE = 50
+
+
+class AccessTracker:
+    """
+    Last-access times of served files.
+
+    Files answered from the in-memory object cache never touch the disk, so
+    their atime goes stale; serving routes record accesses here instead.
+    After a restart, retention falls back to the file's atime/mtime.
+    """
+
+    def __init__(self, max_entries: int = 500000):
+        self.max_entries = max_entries
+        self._times = {}  # {abspath: unix time}
+        self._lock = threading.Lock()
+
+    def touch(self, path: str):
+        with self._lock:
+            if len(self._times) >= self.max_entries and path not in self._times:
+                # Forget the oldest half; their atime is still a usable fallback
+                cutoff = sorted(self._times.values())[len(self._times) // 2]
+                self._times = {p: t for p, t in self._times.items() if t > cutoff}
+            self._times[path] = time.time()
+
+    def get(self, path: str) -> Optional[float]:
+        return self._times.get(path)
+
+
+# Global instance updated by the serving routes
+access_tracker = AccessTracker()
+
+
+class RetentionEngine:
+    """
+    Applies retention policies to every token on every volume.
+
+    Policies (all optional, persisted in retention_settings.json):
+        max_age_days: delete files not accessed for this many days
+        token_budget: bytes a token may keep; least recently used files go first
+        high_water:   when a volume is fuller than this fraction, delete the
+                      least recently used files on it until it is at low_water.
+                      Usage counts the whole disk, so a volume that deleting
+                      every eligible upload still would not bring down to
+                      low_water is skipped and reported instead of wiped
+
+    A run scans the tree under an I/O budget, plans deletions, then carries
+    them out at no more than `delete_rate` files per second through the
+    purger, so quotas, indexes and caches stay consistent and no request
+    ever waits on a large delete. Runs repeat every `interval_minutes`.
+    """
+
+    DEFAULT_POLICY = {
+        'enabled': False,
+        'interval_minutes': 30,
+        'max_age_days': None,
+        'token_budget': None,
+        'high_water': None,
+        'low_water': None,
+        'delete_rate': 20,
+        'scan_rate': 500,
+        'min_age_minutes': 10,
+    }
+
+    def __init__(self, storage, purger, settings_file: str = "retention_settings.json"):
+        self.storage = storage
+        self.purger = purger
+        self.settings_file = settings_file
+        self.policy = dict(self.DEFAULT_POLICY)
+        self.last_run = None
+        self.next_run_at = None
+        self.progress = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requested = None  # 'run' or 'dry_run' asked for by an admin
+        self._worker = None
+        self.load_settings()
+
+    def load_settings(self):
+        """Load retention policy from persistent storage."""
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    self.policy.update(json.load(f))
+            except Exception:
+                pass
+
+    def save_settings(self):
+        """Save retention policy to persistent storage."""
+        try:
+            with open(self.settings_file, 'w') as f:
+                json.dump(self.policy, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save retention settings: {e}")
+
+    def update_policy(self, changes: Dict) -> Dict:
+        """Apply admin changes to the policy live and persist them."""
+        numeric = {
+            'interval_minutes': float, 'max_age_days': float, 'token_budget': int,
+            'high_water': float, 'low_water': float, 'delete_rate': float,
+            'scan_rate': float, 'min_age_minutes': float
+        }
+        with self._lock:
+            policy = dict(self.policy)
+            if 'enabled' in changes:
+                policy['enabled'] = bool(changes['enabled'])
+            for key, cast in numeric.items():
+                if key in changes:
+                    value = changes[key]
+                    policy[key] = cast(value) if value is not None else None
+            for key in ('interval_minutes', 'delete_rate', 'scan_rate'):
+                if not policy[key] or policy[key] <= 0:
+                    raise ValueError(f'{key} must be positive')
+            for key in ('high_water', 'low_water'):
+                if policy[key] is not None and not 0 < policy[key] <= 1:
+                    raise ValueError(f'{key} must be a fraction between 0 and 1')
+            if policy['high_water'] is not None and (policy['low_water'] or 0) > policy['high_water']:
+                raise ValueError('low_water must not exceed high_water')
+            self.policy = policy
+        self.save_settings()
+        self._wake.set()  # reschedule with the new interval
+        return self.get_status()
+
+    def start(self):
+        """Start scheduled runs (idempotent)."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._loop, name='retention', daemon=True)
+        self._worker.start()
+
+    def run_now(self, dry_run: bool = False):
+        """Ask for a run as soon as possible, even when disabled; a dry run only plans."""
+        self.start()
+        with self._lock:
+            self._requested = 'dry_run' if dry_run else 'run'
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            interval = self.policy['interval_minutes'] * 60
+            with self._lock:
+                next_run = datetime.now() + timedelta(seconds=interval)
+                self.next_run_at = next_run.isoformat() if self.policy['enabled'] else None
+            woken = self._wake.wait(timeout=interval)
+            self._wake.clear()
+            with self._lock:
+                requested, self._requested = self._requested, None
+            if requested is None and (woken or not self.policy['enabled']):
+                continue  # policy changed (reschedule), or retention is disabled
+            try:
+                self.run(dry_run=requested == 'dry_run')
+            except Exception as e:
+                event_log.emit('cleanup', f"Retention run failed: {e}", logging.WARNING,
+                               kind='retention', error=str(e))
+                with self._lock:
+                    self.progress = None
+
+    def _scan(self, scan_budget: TokenBucket, min_age: float) -> List[tuple]:
+        """(last_access, size, token, rel_path, path) for every eligible file."""
+        files = []
+        now = time.time()
+        for token, session_path in list(self.storage.layout.iter_token_dirs()):
+            stack = [(session_path, '')]
+            while stack:
+                dir_path, prefix = stack.pop()
+                try:
+                    with os.scandir(dir_path) as entries:
+                        entries = list(entries)
+                except OSError:
+                    continue
+                for entry in entries:
+                    wait = scan_budget.consume()
+                    if wait:
+                        time.sleep(wait)
+                        scan_budget.consume()
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, prefix + entry.name + '/'))
+                            continue
+                        if not entry.is_file(follow_symlinks=False) or is_partial_name(entry.name):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if now - st.st_mtime < min_age:
+                        continue  # possibly still uploading
+                    tracked = access_tracker.get(os.path.abspath(entry.path))
+                    last_access = max(st.st_atime, st.st_mtime, tracked or 0)
+                    files.append((last_access, st.st_size, token, prefix + entry.name, entry.path))
+            with self._lock:
+                if self.progress is not None:
+                    self.progress['files_scanned'] = len(files)
+        return files
+
+    def plan(self, files: List[tuple], policy: Dict, skipped: Optional[List[Dict]] = None) -> Dict[str, str]:
+        """
+        Map path -> policy name for every file that should be deleted.
+        Volumes the high-water policy cannot help are appended to `skipped`.
+        """
+        planned = {}
+        now = time.time()
+
+        if policy.get('max_age_days'):
+            cutoff = now - policy['max_age_days'] * 86400
+            for last_access, _size, _token, _rel, path in files:
+                if last_access < cutoff:
+                    planned[path] = 'max_age'
+
+        files_lru = sorted(files)  # oldest access first
+
+        if policy.get('token_budget'):
+            by_token = defaultdict(list)
+            for item in files_lru:
+                by_token[item[2]].append(item)
+            for items in by_token.values():
+                excess = sum(i[1] for i in items if i[4] not in planned) - policy['token_budget']
+                for _access, size, _token, _rel, path in items:
+                    if excess <= 0:
+                        break
+                    if path not in planned:
+                        planned[path] = 'token_budget'
+                        excess -= size
+
+        if policy.get('high_water'):
+            by_volume = defaultdict(list)
+            for item in files_lru:
+                by_volume[self.storage.layout.volume_of(item[4])].append(item)
+            for volume, items in by_volume.items():
+                try:
+                    disk = shutil.disk_usage(volume)
+                except OSError:
+                    continue
+                used = disk.total - disk.free - sum(i[1] for i in items if i[4] in planned)
+                if used <= disk.total * policy['high_water']:
+                    continue
+                target = disk.total * (policy.get('low_water') or policy['high_water'])
+                eligible = sum(i[1] for i in items if i[4] not in planned)
+                if used - eligible > target:
+                    # Mostly data other than uploads: deleting them all would not help
+                    if skipped is not None:
+                        skipped.append({'volume': volume, 'used_fraction': round(used / disk.total, 3),
+                                        'target_fraction': round(target / disk.total, 3),
+                                        'eligible_bytes': eligible})
+                    continue
+                for _access, size, _token, _rel, path in items:
+                    if used <= target:
+                        break
+                    if path not in planned:
+                        planned[path] = 'high_water'
+                        used -= size
+        return planned
+
+    def run(self, dry_run: bool = False) -> Dict:
+        """Scan, plan and (unless dry_run) delete; returns the run report."""
+        policy = dict(self.policy)
+        started = datetime.now().isoformat()
+        with self._lock:
+            self.progress = {'started_at': started, 'phase': 'scanning', 'files_scanned': 0, 'deleted': 0}
+
+        files = self._scan(TokenBucket(policy['scan_rate'], policy['scan_rate']), policy['min_age_minutes'] * 60)
+        skipped = []
+        planned = self.plan(files, policy, skipped)
+        by_path = {item[4]: item for item in files}
+        # Oldest first, so an interrupted run has removed the best candidates
+        ordered = sorted(planned, key=lambda path: by_path[path][0])
+
+        report = {
+            'started_at': started,
+            'dry_run': dry_run,
+            'files_scanned': len(files),
+            'planned': len(ordered),
+            'planned_bytes': sum(by_path[p][1] for p in ordered),
+            'by_policy': {name: sum(1 for p in ordered if planned[p] == name)
+                          for name in ('max_age', 'token_budget', 'high_water')},
+            'skipped_volumes': skipped,
+            'sample': [
+                {'token': by_path[p][2], 'path': by_path[p][3], 'size': by_path[p][1],
+                 'last_access': datetime.fromtimestamp(by_path[p][0]).isoformat(), 'policy': planned[p]}
+                for p in ordered[:SAMPLE_SIZE]
+            ],
+            'deleted': 0,
+            'freed_bytes': 0,
+            'errors': 0
+        }
+
+        for volume in skipped:
+            event_log.emit('storage_error', f"Retention skipped {volume['volume']}: it is "
+                           f"{volume['used_fraction']:.0%} full and deleting every eligible upload "
+                           f"would not bring it to {volume['target_fraction']:.0%}", logging.WARNING, **volume)
+
+        if not dry_run:
+            with self._lock:
+                self.progress.update({'phase': 'deleting', 'planned': len(ordered)})
+            delete_budget = TokenBucket(policy['delete_rate'], max(1.0, policy['delete_rate']))
+            for path in ordered:
+                wait = delete_budget.consume()
+                if wait:
+                    time.sleep(wait)
+                    delete_budget.consume()
+                _access, _size, token, rel_path, _path = by_path[path]
+                try:
+                    report['freed_bytes'] += self.purger.remove_file(token, rel_path)
+                    report['deleted'] += 1
+                except Exception as e:
+                    event_log.emit('storage_error', f"Retention could not delete {path}: {e}", logging.WARNING,
+                                   path=path, error=str(e))
+                    report['errors'] += 1
+                with self._lock:
+                    self.progress['deleted'] = report['deleted']
+
+        report['finished_at'] = datetime.now().isoformat()
+        event_log.emit('cleanup', kind='retention', dry_run=dry_run, files_scanned=report['files_scanned'],
+                       planned=report['planned'], by_policy=report['by_policy'], deleted=report['deleted'],
+                       freed_bytes=report['freed_bytes'], errors=report['errors'],
+                       skipped_volumes=[v['volume'] for v in skipped])
+        with self._lock:
+            self.last_run = report
+            self.progress = None
+        return report
+
+    def get_status(self) -> Dict:
+        """Policy, schedule and last run for the admin panel."""
+        with self._lock:
+            return {
+                'policy': dict(self.policy),
+                'schedule': {
+                    'enabled': self.policy['enabled'],
+                    'interval_minutes': self.policy['interval_minutes'],
+                    'next_run_at': self.next_run_at
+                },
+                'running': dict(self.progress) if self.progress else None,
+                'last_run': self.last_run
+            }
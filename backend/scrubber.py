@@ -0,0 +1,343 @@
+"""Background integrity scrubber: reconciles upload directories with in-memory metadata."""
+
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from backend.event_log import event_log
+    from backend.media_probe import PROBE_EXTENSIONS, is_complete
+    from backend.ratelimit import TokenBucket
+except ImportError:
+    from event_log import event_log
+    from media_probe import PROBE_EXTENSIONS, is_complete
+    from ratelimit import TokenBucket
+
+# Temp files written by the server itself (UploadWriter: '.upload-<id>-<name>';
+# atomic rewrites: '<name>.<thread id>.tmp'). Only these are treated as partial:
+# every other name may be a real upload.
+TEMP_PREFIX = '.upload-'
+TEMP_SUFFIX = re.compile(r'\.\d+\.tmp$')
+
+# Names browsers and editors use for unfinished downloads. An upload may
+# legitimately be called this, so they are only reported ('suspect').
+SUSPECT_SUFFIXES = ('.part', '.partial', '.tmp', '.crdownload', '.download')
+
+# Finding kinds and whether `repair` fixes them when no kinds are given.
+# 'suspect', 'truncated' and 'orphan_dir' only ever change data on explicit request.
+FINDING_KINDS = {
+    'partial': True,         # leftover server temp file from an interrupted upload -> deleted
+    'suspect': False,        # upload named like an unfinished download, or empty media -> deleted
+    'truncated': False,      # media file cut short (e.g. crash mid-upload) -> deleted
+    'orphan_dir': False,     # token directory with no pairing or session -> purged
+    'missing_entry': True,   # session lists a file that is gone -> entry dropped
+    'unlisted': True,        # file in a live session's directory but not its list -> entry added
+    'index_drift': True,     # folder index disagrees with disk -> index rebuilt
+}
+
+MAX_FINDINGS = 5000
+
+
+def is_partial_name(name: str) -> bool:
+    """True for the server's own temp files of in-progress or interrupted writes."""
+    return name.startswith(TEMP_PREFIX) or TEMP_SUFFIX.search(name) is not None
+
+
+def walk_files(directory: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Lazily yield (rel_path, entry) for every complete regular file under
+    `directory`, subfolders included; rel_path uses '/' separators.
+    """
+    stack = [(directory, '')]
+    while stack:
+        dir_path, prefix = stack.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                entries = list(entries)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, prefix + entry.name + '/'))
+                    continue
+                if not entry.is_file(follow_symlinks=False) or is_partial_name(entry.name):
+                    continue
+            except OSError:
+                continue
+            yield prefix + entry.name, entry
+
+
+def _tail(path: str, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - size))
+        return f.read(size)
+
+
+def check_media(path: str, ext: str) -> Optional[str]:
+    """Return why a media file looks truncated, or None if it looks whole."""
+    if ext in ('.jpg', '.jpeg'):
+        # JPEG ends with an EOI marker; motion photos append a video after
+        # it, so a missing EOI is only reported when there is no MP4 trailer
+        tail = _tail(path, 64 * 1024)
+        if not tail.endswith(b'\xff\xd9') and b'\xff\xd9' not in tail and b'ftyp' not in tail:
+            return 'missing JPEG end-of-image marker'
+    elif ext == '.png':
+        if not _tail(path, 12).endswith(b'IEND\xaeB`\x82'):
+            return 'missing PNG IEND chunk'
+    elif ext in PROBE_EXTENSIONS:
+        if is_complete(path) is False:
+            return 'MP4 box runs past end of file'
+    return None
+
+
+class StorageScrubber:
+    """
+    Walks every token directory in the background under an I/O budget.
+
+    Each directory entry visited costs one budget token and each media tail
+    check a few more (`ops_per_second` sustained), so a pass over a large
+    tree is spread out instead of competing with uploads and serving. The
+    scrubber only reads shared state through short copies and never holds a
+    lock while touching the disk, so request threads are never blocked by it.
+
+    Findings are kept from the last completed pass; `repair` applies fixes
+    for chosen kinds (see FINDING_KINDS) through the same helpers the rest
+    of the app uses, so quotas, indexes and caches stay consistent.
+    """
+
+    def __init__(self, storage, pairing_manager, sessions: Dict, purger,
+                 ops_per_second: float = 200.0, interval: float = 6 * 3600, min_age: float = 600.0):
+        self.storage = storage
+        self.pairing_manager = pairing_manager
+        self.sessions = sessions
+        self.purger = purger
+        self.budget = TokenBucket(ops_per_second, ops_per_second)
+        self.interval = interval
+        self.min_age = min_age  # files younger than this may still be uploading
+        self.findings = []  # type: List[Dict]
+        self.last_pass = None
+        self.progress = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start periodic passes (idempotent)."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._loop, name='storage-scrub', daemon=True)
+        self._worker.start()
+
+    def run_now(self):
+        """Ask for a pass to start as soon as possible."""
+        self.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            try:
+                self.scrub()
+            except Exception as e:
+                event_log.emit('cleanup', f"Storage scrub failed: {e}", logging.WARNING,
+                               kind='scrub', error=str(e))
+                with self._lock:
+                    self.progress = None
+
+    def _spend(self, ops: float):
+        """Block the scrubber thread until the I/O budget allows `ops` more operations."""
+        while True:
+            wait = self.budget.consume(ops)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _known_tokens(self) -> set:
+        known = set(self.sessions.keys())
+        known.update(self.pairing_manager.select_tokens('all'))
+        return known
+
+    def scrub(self) -> Dict:
+        """Run one full pass and replace the findings; returns the pass summary."""
+        started = datetime.now().isoformat()
+        token_dirs = list(self.storage.layout.iter_token_dirs())
+        known = self._known_tokens()
+        findings = []
+        files_checked = 0
+        with self._lock:
+            self.progress = {'started_at': started, 'tokens_done': 0, 'tokens_total': len(token_dirs)}
+
+        for done, (token, session_path) in enumerate(token_dirs, 1):
+            on_disk = self._scan_token(token, session_path, findings)
+            files_checked += len(on_disk)
+            self._reconcile(token, session_path, on_disk, known, findings)
+            with self._lock:
+                self.progress['tokens_done'] = done
+
+        # Sessions whose directory is gone entirely
+        scanned = {token for token, _ in token_dirs}
+        for token, session in list(self.sessions.items()):
+            if token not in scanned:
+                for entry in list(session.get('files', [])):
+                    findings.append({'kind': 'missing_entry', 'token': token, 'path': entry.get('name'),
+                                     'detail': 'session directory does not exist'})
+
+        summary = {
+            'started_at': started,
+            'finished_at': datetime.now().isoformat(),
+            'tokens': len(token_dirs),
+            'files_checked': files_checked,
+            'counts': {kind: sum(1 for f in findings if f['kind'] == kind) for kind in FINDING_KINDS}
+        }
+        with self._lock:
+            self.findings = findings[:MAX_FINDINGS]
+            self.last_pass = summary
+            self.progress = None
+        return summary
+
+    def _scan_token(self, token: str, session_path: str, findings: List[Dict]) -> Dict[str, int]:
+        """Walk one token directory; returns {rel_path: size} of regular files."""
+        on_disk = {}
+        now = time.time()
+        stack = [(session_path, '')]
+        while stack:
+            dir_path, prefix = stack.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                self._spend(1)
+                rel = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, rel + '/'))
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                on_disk[rel] = st.st_size
+                if now - st.st_mtime < self.min_age:
+                    continue  # may still be in flight
+
+                ext = os.path.splitext(entry.name.lower())[1]
+                if is_partial_name(entry.name):
+                    findings.append({'kind': 'partial', 'token': token, 'path': rel, 'size': st.st_size,
+                                     'detail': 'leftover temp file of an interrupted upload'})
+                elif entry.name.lower().endswith(SUSPECT_SUFFIXES):
+                    findings.append({'kind': 'suspect', 'token': token, 'path': rel, 'size': st.st_size,
+                                     'detail': 'named like an unfinished download'})
+                elif st.st_size == 0 and (ext in PROBE_EXTENSIONS or ext in ('.jpg', '.jpeg', '.png')):
+                    findings.append({'kind': 'suspect', 'token': token, 'path': rel, 'size': 0,
+                                     'detail': 'empty media file'})
+                elif ext in PROBE_EXTENSIONS or ext in ('.jpg', '.jpeg', '.png'):
+                    self._spend(4)
+                    try:
+                        problem = check_media(entry.path, ext)
+                    except OSError:
+                        problem = None
+                    if problem:
+                        findings.append({'kind': 'truncated', 'token': token, 'path': rel,
+                                         'size': st.st_size, 'detail': problem})
+        return on_disk
+
+    def _reconcile(self, token: str, session_path: str, on_disk: Dict[str, int], known: set,
+                   findings: List[Dict]):
+        """Compare one token's files with sessions, pairings and the folder index."""
+        if token not in known:
+            try:
+                idle_days = (time.time() - os.path.getmtime(session_path)) / 86400
+            except OSError:
+                idle_days = None
+            findings.append({'kind': 'orphan_dir', 'token': token, 'path': '',
+                             'size': sum(on_disk.values()), 'files': len(on_disk),
+                             'detail': 'no pairing or live session',
+                             'idle_days': round(idle_days, 1) if idle_days is not None else None})
+
+        session = self.sessions.get(token)
+        if session is not None:
+            listed = {entry.get('name') for entry in list(session.get('files', []))}
+            for name in sorted(listed - set(on_disk)):
+                findings.append({'kind': 'missing_entry', 'token': token, 'path': name,
+                                 'detail': 'listed in session but not on disk'})
+            for name in sorted(set(on_disk) - listed):
+                if is_partial_name(os.path.basename(name)):
+                    continue
+                findings.append({'kind': 'unlisted', 'token': token, 'path': name, 'size': on_disk[name],
+                                 'detail': 'on disk but not listed in session'})
+
+        summary = self.storage.index.peek(token)
+        if summary is not None:
+            file_count, total_size = summary
+            if file_count != len(on_disk) or total_size != sum(on_disk.values()):
+                findings.append({'kind': 'index_drift', 'token': token, 'path': '',
+                                 'detail': f'index {file_count} files/{total_size} B, '
+                                           f'disk {len(on_disk)} files/{sum(on_disk.values())} B'})
+
+    def repair(self, kinds: Optional[List[str]] = None, dry_run: bool = False) -> Dict:
+        """
+        Fix findings of the given kinds (default: the safe ones) from the last pass.
+        Returns what was (or, with dry_run, would be) changed.
+        """
+        if kinds is None:
+            kinds = [kind for kind, safe in FINDING_KINDS.items() if safe]
+        unknown = [kind for kind in kinds if kind not in FINDING_KINDS]
+        if unknown:
+            raise ValueError(f"unknown finding kind(s): {', '.join(unknown)}")
+
+        with self._lock:
+            selected = [f for f in self.findings if f['kind'] in kinds]
+        if dry_run:
+            return {'dry_run': True, 'count': len(selected), 'findings': selected}
+
+        repaired, failed = [], []
+        for finding in selected:
+            try:
+                self._repair_one(finding)
+                repaired.append(finding)
+            except Exception as e:
+                failed.append({**finding, 'error': str(e)})
+        with self._lock:
+            done = {id(f) for f in repaired}
+            self.findings = [f for f in self.findings if id(f) not in done]
+        event_log.emit('cleanup', kind='scrub_repair', kinds=kinds, repaired=len(repaired), failed=len(failed))
+        return {'dry_run': False, 'count': len(repaired), 'findings': repaired, 'failed': failed}
+
+    def _repair_one(self, finding: Dict):
+        kind, token = finding['kind'], finding['token']
+        if kind in ('partial', 'suspect', 'truncated'):
+            self.purger.remove_file(token, finding['path'])
+        elif kind == 'orphan_dir':
+            self.purger.purge(token)
+        elif kind == 'missing_entry':
+            session = self.sessions.get(token)
+            if session is not None:
+                session['files'] = [e for e in session.get('files', []) if e.get('name') != finding['path']]
+        elif kind == 'unlisted':
+            session = self.sessions.get(token)
+            path = os.path.join(self.storage.layout.token_dir(token), *finding['path'].split('/'))
+            if session is not None and os.path.isfile(path):
+                session.setdefault('files', []).append({'name': finding['path'], 'size': finding.get('size', 0)})
+        elif kind == 'index_drift':
+            self.storage.index.drop(token)  # rebuilt from disk on next use
+
+    def get_status(self) -> Dict:
+        """Progress, last pass summary and findings for the admin endpoint."""
+        with self._lock:
+            return {
+                'running': self.progress is not None,
+                'progress': dict(self.progress) if self.progress else None,
+                'last_pass': self.last_pass,
+                'ops_per_second': self.budget.rate,
+                'findings': list(self.findings)
+            }
@@ -0,0 +1,438 @@
+"""Trigram filename search and per-file metadata over every upload, persisted between runs."""
+
+import heapq
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from backend.event_log import event_log
+    from backend.gallery_utils import PhotoGalleryManager
+    from backend.scrubber import is_partial_name
+except ImportError:
+    from event_log import event_log
+    from gallery_utils import PhotoGalleryManager
+    from scrubber import is_partial_name
+
+SNAPSHOT_VERSION = 2
+
+# Stored per file as one byte
+KINDS = ('other', 'image', 'video')
+IMAGE = KINDS.index('image')
+
+# Perceptual hash state per file
+HASH_PENDING, HASH_DONE, HASH_NONE = 0, 1, 2
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def file_kind(name: str) -> int:
+    return KINDS.index(PhotoGalleryManager.get_media_type(name) or 'other')
+
+
+class SearchIndex:
+    """
+    Finds files by name substring, media type, size and token.
+
+    Every file gets an integer id; parallel arrays hold its token, path,
+    size, mtime and kind, and each trigram of the lower-cased file name maps
+    to an ascending array of ids. A query intersects the posting lists of
+    its trigrams, starting from the shortest, and checks the few survivors,
+    so a lookup touches a handful of ids instead of every file. Queries
+    shorter than three characters scan all files. Matches are filtered and
+    sorted newest first on a copy of the columns, outside the lock, so
+    uploads are never held up by a broad query.
+
+    Images also carry a 64-bit perceptual hash, filled in by the duplicate
+    finder (see duplicates.py) and reset when the file is overwritten.
+
+    Uploads and deletes update the index in place (deleted ids are
+    tombstoned and compacted away later). A background thread snapshots it
+    to `snapshot_path` when it changed; without a snapshot the index is
+    built from one walk of the upload volumes.
+    """
+
+    def __init__(self, layout, snapshot_path: str, save_interval: float = 60.0):
+        self.layout = layout
+        self.snapshot_path = snapshot_path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._reset()
+        self.changes = 0  # bumped on every update, so readers can tell the index moved on
+        self._dirty = False
+        self._worker = None
+        self._query_view = None  # see _view
+        self.building = False
+        self.loaded_from = None  # 'snapshot' or 'scan'
+
+    def _reset(self):
+        self._tokens = []  # id -> token (interned)
+        self._paths = []  # id -> relative path, None once deleted
+        self._sizes = array('q')
+        self._mtimes = array('d')
+        self._kinds = bytearray()
+        self._hashes = array('Q')  # perceptual hash, valid when the state is HASH_DONE
+        self._hash_state = bytearray()
+        self._unhashed = set()  # ids of live images in HASH_PENDING
+        self._ids = {}  # 'token/path' -> id
+        self._grams = {}  # trigram -> array('I') of ids, ascending
+        self._dead = 0
+
+    def start(self):
+        """Load the snapshot (or scan the disk) and start periodic saving; idempotent."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name='search-index', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        if not self._load():
+            self.rebuild()
+        while True:
+            time.sleep(self.save_interval)
+            try:
+                self.save()
+            except Exception as e:
+                event_log.emit('storage_error', f"Could not save search index: {e}", logging.WARNING,
+                               path=self.snapshot_path, error=str(e))
+
+    # ---- updates -------------------------------------------------------
+
+    def _add(self, token: str, rel_path: str, size: int, mtime: float):
+        key = f'{token}/{rel_path}'
+        doc = self._ids.get(key)
+        self.changes += 1
+        if doc is not None:
+            # Overwritten file: same name, so the trigrams stay valid; the content changed
+            self._sizes[doc] = size
+            self._mtimes[doc] = mtime
+            if self._kinds[doc] == IMAGE:
+                self._hash_state[doc] = HASH_PENDING
+                self._unhashed.add(doc)
+            self._dirty = True
+            return
+        doc = len(self._paths)
+        kind = file_kind(rel_path)
+        self._tokens.append(sys.intern(token))
+        self._paths.append(rel_path)
+        self._sizes.append(size)
+        self._mtimes.append(mtime)
+        self._kinds.append(kind)
+        self._hashes.append(0)
+        self._hash_state.append(HASH_PENDING if kind == IMAGE else HASH_NONE)
+        if kind == IMAGE:
+            self._unhashed.add(doc)
+        self._ids[key] = doc
+        for gram in trigrams(rel_path.rsplit('/', 1)[-1].lower()):
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array('I')
+            postings.append(doc)
+        self._dirty = True
+
+    def add(self, token: str, rel_path: str, size: int, mtime: Optional[float] = None):
+        """Record an uploaded (or overwritten) file."""
+        with self._lock:
+            self._add(token, rel_path, size, mtime if mtime is not None else time.time())
+
+    def remove(self, token: str, rel_path: str):
+        """Forget a deleted file."""
+        with self._lock:
+            doc = self._ids.pop(f'{token}/{rel_path}', None)
+            if doc is not None:
+                self._paths[doc] = None
+                self._unhashed.discard(doc)
+                self._dead += 1
+                self._dirty = True
+                self.changes += 1
+
+    def drop(self, token: str):
+        """Forget every file of a token (its directory was removed)."""
+        with self._lock:
+            prefix = f'{token}/'
+            for key in [key for key in self._ids if key.startswith(prefix)]:
+                doc = self._ids.pop(key)
+                self._paths[doc] = None
+                self._unhashed.discard(doc)
+                self._dead += 1
+            self._dirty = True
+            self.changes += 1
+
+    def rebuild(self):
+        """Re-index every file on every volume (also used when there is no snapshot)."""
+        self.building = True
+        try:
+            with self._lock:
+                # Hashes of files that did not change since are kept, not recomputed
+                known = {key: (self._sizes[doc], self._mtimes[doc], self._hashes[doc], self._hash_state[doc])
+                         for key, doc in self._ids.items() if self._hash_state[doc] != HASH_PENDING}
+                self._reset()
+                self.changes += 1
+            for token, session_path in list(self.layout.iter_token_dirs()):
+                for dirpath, _dirnames, filenames in os.walk(session_path):
+                    rel_dir = os.path.relpath(dirpath, session_path).replace(os.sep, '/')
+                    entries = []
+                    for fname in filenames:
+                        if is_partial_name(fname):
+                            continue
+                        try:
+                            st = os.stat(os.path.join(dirpath, fname))
+                        except OSError:
+                            continue
+                        rel = fname if rel_dir == '.' else f'{rel_dir}/{fname}'
+                        entries.append((rel, st.st_size, st.st_mtime))
+                    # One lock round trip per folder keeps uploads flowing during a scan
+                    with self._lock:
+                        for rel, size, mtime in entries:
+                            self._add(token, rel, size, mtime)
+                            kept = known.get(f'{token}/{rel}')
+                            if kept is not None and kept[:2] == (size, mtime):
+                                doc = self._ids[f'{token}/{rel}']
+                                self._hashes[doc], self._hash_state[doc] = kept[2:]
+                                self._unhashed.discard(doc)
+            self.loaded_from = 'scan'
+        finally:
+            self.building = False
+
+    # ---- persistence ---------------------------------------------------
+
+    def _compact(self):
+        """Renumber live files so tombstones stop costing memory and query time."""
+        live = [doc for doc, path in enumerate(self._paths) if path is not None]
+        tokens, paths = self._tokens, self._paths
+        sizes, mtimes = self._sizes, self._mtimes
+        hashes, hash_state = self._hashes, self._hash_state
+        self._reset()
+        for doc in live:
+            new_doc = len(self._paths)
+            self._add(tokens[doc], paths[doc], sizes[doc], mtimes[doc])
+            self._hashes[new_doc] = hashes[doc]
+            self._hash_state[new_doc] = hash_state[doc]
+            if hash_state[doc] != HASH_PENDING:
+                self._unhashed.discard(new_doc)
+        self.changes += 1
+
+    def save(self):
+        """Write a snapshot if anything changed since the last one."""
+        with self._lock:
+            if not self._dirty or self.building:
+                return
+            if self._dead > max(1000, len(self._paths) // 4):
+                self._compact()
+            count = len(self._paths)
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'tokens': self._tokens[:count],
+                'paths': self._paths[:count],
+                'sizes': self._sizes[:count],
+                'mtimes': self._mtimes[:count],
+                'kinds': bytes(self._kinds[:count]),
+                'hashes': self._hashes[:count],
+                'hash_state': bytes(self._hash_state[:count]),
+                # Posting arrays are shared; ids added while pickling are trimmed on load
+                'grams': dict(self._grams),
+            }
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _load(self) -> bool:
+        """Load the snapshot written by `save`; False if there is none usable."""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            event_log.emit('storage_error', f"Ignoring unreadable search index snapshot: {e}", logging.WARNING,
+                           path=self.snapshot_path, error=str(e))
+            return False
+        if state.get('version') != SNAPSHOT_VERSION:
+            return False
+        count = len(state['paths'])
+        grams = {}
+        for gram, postings in state['grams'].items():
+            end = bisect_left(postings, count)
+            if end:
+                grams[gram] = postings[:end] if end < len(postings) else postings
+        with self._lock:
+            self._tokens = [sys.intern(token) for token in state['tokens']]
+            self._paths = state['paths']
+            self._sizes = state['sizes']
+            self._mtimes = state['mtimes']
+            self._kinds = bytearray(state['kinds'])
+            self._hashes = state['hashes']
+            self._hash_state = bytearray(state['hash_state'])
+            self._grams = grams
+            self._ids = {f'{self._tokens[doc]}/{path}': doc
+                         for doc, path in enumerate(self._paths) if path is not None}
+            self._unhashed = {doc for doc in self._ids.values() if self._hash_state[doc] == HASH_PENDING}
+            self._dead = count - len(self._ids)
+            self._dirty = False
+            self.changes += 1
+        self.loaded_from = 'snapshot'
+        return True
+
+    # ---- perceptual hashes ---------------------------------------------
+
+    def take_unhashed(self, limit: int = 64) -> List[Tuple[str, str]]:
+        """(token, path) of up to `limit` images still waiting for a perceptual hash."""
+        with self._lock:
+            docs = []
+            for doc in self._unhashed:
+                docs.append(doc)
+                if len(docs) == limit:
+                    break
+            return [(self._tokens[doc], self._paths[doc]) for doc in docs]
+
+    def set_hash(self, token: str, rel_path: str, value: Optional[int]):
+        """Store an image's perceptual hash (None: it could not be decoded)."""
+        with self._lock:
+            doc = self._ids.get(f'{token}/{rel_path}')
+            if doc is None:
+                return
+            self._hashes[doc] = value or 0
+            self._hash_state[doc] = HASH_DONE if value is not None else HASH_NONE
+            self._unhashed.discard(doc)
+            self._dirty = True
+            self.changes += 1
+
+    def hashed_files(self) -> List[Tuple[int, str]]:
+        """(hash, 'token/path') of every live file with a perceptual hash."""
+        with self._lock:
+            return [(self._hashes[doc], key) for key, doc in self._ids.items()
+                    if self._hash_state[doc] == HASH_DONE]
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Metadata of one live file by its 'token/path' key."""
+        with self._lock:
+            doc = self._ids.get(key)
+            if doc is None:
+                return None
+            path = self._paths[doc]
+            return {
+                'token': self._tokens[doc],
+                'path': path,
+                'name': path.rsplit('/', 1)[-1],
+                'size': self._sizes[doc],
+                'type': KINDS[self._kinds[doc]],
+                'modified': self._mtimes[doc]
+            }
+
+    # ---- queries -------------------------------------------------------
+
+    def _view(self) -> Tuple:
+        """
+        Copy of the columns and posting lists queries run on, so filtering and
+        sorting happen outside the lock; reused until the index changes.
+        """
+        with self._lock:
+            view = self._query_view
+            if view is None or view[0] != self.changes:
+                count = len(self._paths)
+                # Posting arrays only ever grow (compaction replaces them), so
+                # sharing them is safe: ids >= count are ignored
+                view = self._query_view = (self.changes, count, self._tokens[:count], self._paths[:count],
+                                           self._sizes[:count], self._mtimes[:count],
+                                           bytes(self._kinds[:count]), self._grams)
+            return view
+
+    @staticmethod
+    def _candidates(query: str, count: int, grams: Dict) -> Iterable[int]:
+        """Ids below `count` that may match."""
+        if len(query) < 3:
+            return range(count)
+        lists = []
+        for gram in trigrams(query):
+            postings = grams.get(gram)
+            if not postings:
+                return ()
+            lists.append(postings)
+        lists.sort(key=len)
+        shortest, others = lists[0], lists[1:]
+        shortest = shortest[:bisect_left(shortest, count)]
+
+        def contains(postings, doc):
+            i = bisect_left(postings, doc)
+            return i < len(postings) and postings[i] == doc
+
+        return (doc for doc in shortest if all(contains(p, doc) for p in others))
+
+    def search(self, query: str = '', kind: Optional[str] = None, token: Optional[str] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               offset: int = 0, limit: int = 50) -> Dict:
+        """
+        Files whose name contains `query` (case-insensitive), newest (by
+        modification time) first. Returns `limit` results after skipping
+        `offset`, and whether more exist.
+        """
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"type must be one of {', '.join(KINDS)}")
+        self.start()
+        query = query.strip().lower()
+        kind_id = KINDS.index(kind) if kind is not None else None
+        started = time.perf_counter()
+        _changes, count, tokens, paths, sizes, mtimes, kinds, grams = self._view()
+
+        def matches():
+            for doc in self._candidates(query, count, grams):
+                path = paths[doc]
+                if path is None:
+                    continue
+                if kind_id is not None and kinds[doc] != kind_id:
+                    continue
+                if token is not None and tokens[doc] != token:
+                    continue
+                size = sizes[doc]
+                if (min_size is not None and size < min_size) or (max_size is not None and size > max_size):
+                    continue
+                if query and query not in path.rsplit('/', 1)[-1].lower():
+                    continue  # trigram false positive
+                yield doc
+
+        # One extra result tells whether another page exists
+        top = heapq.nlargest(offset + limit + 1, matches(), key=lambda doc: (mtimes[doc], doc))
+        results = []
+        for doc in top[offset:offset + limit]:
+            path = paths[doc]
+            results.append({
+                'token': tokens[doc],
+                'path': path,
+                'name': path.rsplit('/', 1)[-1],
+                'size': sizes[doc],
+                'type': KINDS[kinds[doc]],
+                'modified': mtimes[doc]
+            })
+        return {
+            'results': results,
+            'offset': offset,
+            'limit': limit,
+            'has_more': len(top) > offset + limit,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2),
+            'building': self.building
+        }
+
+    def get_stats(self) -> Dict:
+        """Index size for the admin panel."""
+        with self._lock:
+            return {
+                'files': len(self._ids),
+                'tombstones': self._dead,
+                'trigrams': len(self._grams),
+                'unhashed_images': len(self._unhashed),
+                'building': self.building,
+                'loaded_from': self.loaded_from,
+                'unsaved_changes': self._dirty
+            }
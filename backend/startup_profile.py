@@ -0,0 +1,61 @@
+"""Per-phase startup timing for the --profile-startup flag."""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+class StartupProfiler:
+    """
+    Records how long each startup phase took, relative to process start.
+
+    Phases may run on background threads (e.g. the pairing registry load);
+    they are reported with the offset at which they finished so the critical
+    path to the first QR code is easy to read.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._phases = []  # [(name, duration_s, finished perf_counter, thread_name)]
+        self._lock = threading.Lock()
+
+    def set_origin(self, origin: float):
+        """Measure offsets from an earlier instant (e.g. before the first import)."""
+        self.origin = min(self.origin, origin)
+
+    def record(self, name: str, duration: float):
+        """Record a phase that just finished and took `duration` seconds."""
+        with self._lock:
+            self._phases.append((
+                name,
+                duration,
+                time.perf_counter(),
+                threading.current_thread().name
+            ))
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def phases(self) -> List[Tuple[str, float, float, str]]:
+        """Recorded phases as (name, duration, finished perf_counter, thread)."""
+        with self._lock:
+            return list(self._phases)
+
+    def report(self) -> str:
+        """Human-readable timing table."""
+        lines = [f"{'phase':<28}{'took':>10}{'done at':>10}  thread"]
+        for name, duration, finished, thread in self.phases():
+            offset = finished - self.origin
+            lines.append(f"{name:<28}{duration * 1000:>8.1f}ms{offset * 1000:>8.1f}ms  {thread}")
+        return '\n'.join(lines)
+
+
+# Global instance; created at first import, i.e. as early as possible
+startup_profiler = StartupProfiler()
@@ -2,6 +2,39 @@
 
 import os
 import json
+import logging
+
+from werkzeug.utils import secure_filename
+
+from .event_log import event_log
+from .layout import DEFAULT_UPLOAD_ROOT, get_layout
+from .path_index import PathIndex
+from .scrubber import is_partial_name, walk_files
+from .search_index import SearchIndex
+
+# Deepest folder nesting accepted from clients
+MAX_FOLDER_DEPTH = 16
+
+
+def sanitize_relative_path(raw_path: str) -> str:
+    """
+    Turn a client-supplied relative path (e.g. webkitRelativePath) into a safe
+    POSIX path inside a session.
+
+    Every segment goes through secure_filename; '.', '..', empty and absolute
+    components are dropped, so the result can never escape the session
+    directory. Returns '' if nothing usable remains.
+    """
+    parts = []
+    for segment in raw_path.replace('\\', '/').split('/'):
+        if segment in ('', '.', '..'):
+            continue
+        safe = secure_filename(segment)
+        if safe:
+            parts.append(safe)
+    if len(parts) > MAX_FOLDER_DEPTH + 1:
+        parts = parts[:MAX_FOLDER_DEPTH] + parts[-1:]
+    return '/'.join(parts)
 
 
 class StorageSimulator:
@@ -9,15 +42,38 @@ class StorageSimulator:
 
     def __init__(self, base_path=None):
         """Initialize storage simulator with optional base path."""
-        self.base_path = base_path or os.path.join(os.path.dirname(__file__), '..', 'uploads')
+        self.base_path = base_path or DEFAULT_UPLOAD_ROOT
         os.makedirs(self.base_path, exist_ok=True)
+        self.layout = get_layout(self.base_path)
+        self.index = PathIndex(self.layout)
+        # Loaded (or built) in the background by search.start()
+        self.search = SearchIndex(
+            self.layout, os.path.join(os.path.dirname(self.layout.root), 'cache', 'search_index.pickle')
+        )
+
+    def resolve_path(self, session_token, rel_path=''):
+        """Absolute path of a sanitized relative path inside a session."""
+        rel_path = sanitize_relative_path(rel_path or '')
+        session_path = self.layout.token_dir(session_token)
+        return os.path.join(session_path, *rel_path.split('/')) if rel_path else session_path
+
+    def record_file(self, session_token, rel_path, size):
+        """Update in-memory indexes after a file was stored."""
+        self.index.add(session_token, rel_path, size)
+        self.search.add(session_token, rel_path, size)
+
+    def get_children(self, session_token, path=''):
+        """List one folder level (with subtree counts/sizes) from the index."""
+        return self.index.get_children(session_token, sanitize_relative_path(path or ''))
 
     def get_directory_structure(self, path=None, session_token=None):
-        """Get directory structure for a session (simulating phone storage)."""
+        """Get one level of the directory structure for a session (simulating phone storage)."""
         if session_token:
-            session_path = os.path.join(self.base_path, session_token)
+            session_path = self.resolve_path(session_token, path)
         else:
             session_path = self.base_path
+        prefix = sanitize_relative_path(path or '')
+        prefix = f'{prefix}/' if prefix else ''
 
         if not os.path.isdir(session_path):
             return {'name': 'Storage', 'type': 'folder', 'contents': []}
@@ -26,22 +82,25 @@ class StorageSimulator:
         try:
             for name in sorted(os.listdir(session_path)):
                 full_path = os.path.join(session_path, name)
+                if is_partial_name(name):
+                    continue  # upload still being written
                 if os.path.isfile(full_path):
                     size = os.path.getsize(full_path)
                     contents.append({
                         'name': name,
                         'type': 'file',
                         'size': size,
-                        'path': name
+                        'path': prefix + name
                     })
                 elif os.path.isdir(full_path):
                     contents.append({
                         'name': name,
                         'type': 'folder',
-                        'path': name
+                        'path': prefix + name
                     })
         except Exception as e:
-            print(f'Error reading directory: {e}')
+            event_log.emit('storage_error', f'Error reading directory: {e}', logging.WARNING,
+                           path=session_path, error=str(e))
 
         return {
             'name': 'Storage',
@@ -50,37 +109,47 @@ class StorageSimulator:
         }
 
     def get_file_list(self, session_token=None):
-        """Get a flat list of files for a session."""
+        """Get a flat list of files for a session, subfolders included, sorted by path."""
+        return sorted(self.iter_files(session_token), key=lambda f: f['path'])
+
+    def iter_files(self, session_token=None):
+        """
+        Lazily yield file entries for a session in directory order,
+        subfolders included ('path' is relative to the session root).
+
+        Unlike get_file_list this never materializes or sorts the listing,
+        so it is suitable for streaming very large sessions.
+        """
         if session_token:
-            session_path = os.path.join(self.base_path, session_token)
+            session_path = self.layout.token_dir(session_token)
         else:
             session_path = self.base_path
 
-        files = []
-        if os.path.isdir(session_path):
-            for name in sorted(os.listdir(session_path)):
-                full_path = os.path.join(session_path, name)
-                if os.path.isfile(full_path):
-                    files.append({
-                        'name': name,
-                        'size': os.path.getsize(full_path),
-                        'path': name
-                    })
-        return files
+        for rel_path, entry in walk_files(session_path):
+            try:
+                yield {
+                    'name': entry.name,
+                    'size': entry.stat().st_size,
+                    'path': rel_path
+                }
+            except OSError:
+                continue
 
     def get_storage_stats(self, session_token=None):
-        """Get storage usage stats for a session."""
+        """Get storage usage stats for a session (or every token on every volume)."""
         if session_token:
-            session_path = os.path.join(self.base_path, session_token)
+            session_paths = [self.layout.token_dir(session_token)]
         else:
-            session_path = self.base_path
+            session_paths = [path for _token, path in self.layout.iter_token_dirs()]
 
         total_size = 0
         file_count = 0
 
-        if os.path.isdir(session_path):
+        for session_path in session_paths:
             for root, dirs, files in os.walk(session_path):
                 for f in files:
+                    if is_partial_name(f):
+                        continue
                     fpath = os.path.join(root, f)
                     try:
                         total_size += os.path.getsize(fpath)
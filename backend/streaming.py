@@ -0,0 +1,129 @@
+"""Opt-in streaming (NDJSON / chunked JSON array) responses for large listings."""
+
+import json
+import zlib
+from typing import Dict, Iterable, Optional
+
+from flask import Response, request
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Flush to the client once this many encoded bytes are buffered
+FLUSH_BYTES = 16 * 1024
+
+
+def stream_mode() -> Optional[str]:
+    """
+    Return the requested streaming mode: 'ndjson', 'json' or None.
+
+    Clients opt in with ?stream=ndjson|json or `Accept: application/x-ndjson`.
+    'json' keeps the regular response shape but builds it incrementally.
+    """
+    mode = request.args.get('stream', '').lower()
+    if mode in ('ndjson', 'json'):
+        return mode
+    if mode in ('1', 'true'):
+        return 'json'
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+
+def negotiate_encoding() -> Optional[str]:
+    """Pick 'br' (if brotli is installed) or 'gzip' from Accept-Encoding."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+class _GzipEncoder:
+    """Incremental gzip with a sync flush per chunk so clients can parse early."""
+
+    def __init__(self):
+        self._z = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _BrotliEncoder:
+    """Incremental brotli with a flush per chunk."""
+
+    def __init__(self):
+        self._b = brotli.Compressor(quality=5)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._b.process(data) + self._b.flush()
+
+    def finish(self) -> bytes:
+        return self._b.finish()
+
+
+class _IdentityEncoder:
+    def chunk(self, data: bytes) -> bytes:
+        return data
+
+    def finish(self) -> bytes:
+        return b''
+
+
+ENCODERS = {'gzip': _GzipEncoder, 'br': _BrotliEncoder, None: _IdentityEncoder}
+
+
+def _encode_items(items: Iterable[Dict], mode: str, key: str):
+    """Yield raw (uncompressed) byte pieces for the listing."""
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    if mode == 'ndjson':
+        for item in items:
+            yield dumps(item).encode() + b'\n'
+        return
+
+    yield b'{' + dumps(key).encode() + b':['
+    first = True
+    for item in items:
+        yield (b'' if first else b',') + dumps(item).encode()
+        first = False
+    yield b']}'
+
+
+def stream_listing(items: Iterable[Dict], mode: str, key: str) -> Response:
+    """
+    Build a streaming response from a lazy item iterator.
+
+    Memory stays bounded by FLUSH_BYTES regardless of listing size, and the
+    first bytes go out as soon as the first item is produced. In 'json' mode
+    the body is `{key: [items...]}`, matching the buffered endpoints.
+    """
+    encoding = negotiate_encoding()
+
+    def generate():
+        encoder = ENCODERS[encoding]()
+        buffered = []
+        size = 0
+        sent_first = False
+        for piece in _encode_items(items, mode, key):
+            buffered.append(piece)
+            size += len(piece)
+            if size >= FLUSH_BYTES or not sent_first:
+                out = encoder.chunk(b''.join(buffered))
+                buffered, size, sent_first = [], 0, True
+                if out:
+                    yield out
+        tail = encoder.chunk(b''.join(buffered)) if buffered else b''
+        yield tail + encoder.finish()
+
+    mimetype = 'application/x-ndjson' if mode == 'ndjson' else 'application/json'
+    response = Response(generate(), mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
@@ -1,66 +1,114 @@
 """Generate self-signed certificates for HTTPS/TLS support."""
 
+import argparse
+import ipaddress
 import os
+import ssl
+import logging
 import subprocess
 from pathlib import Path
 
-def generate_self_signed_cert(cert_dir: str = "certs", common_name: str = "localhost"):
+try:
+    from backend.event_log import event_log
+except ImportError:
+    from event_log import event_log
+
+KEY_TYPES = ('rsa', 'ecdsa')
+
+# Certificate/key file names per key type; RSA keeps the historical names
+CERT_FILES = {
+    'rsa': ("cert.pem", "key.pem"),
+    'ecdsa': ("cert-ecdsa.pem", "key-ecdsa.pem"),
+}
+
+
+def _subject_alt_names(common_name: str):
+    """SAN entries as (kind, value): the LAN address as an IP SAN plus localhost."""
+    names = [('DNS', 'localhost'), ('IP', '127.0.0.1')]
+    try:
+        ipaddress.ip_address(common_name)
+        kind = 'IP'
+    except ValueError:
+        kind = 'DNS'
+    if (kind, common_name) not in names:
+        names.insert(0, (kind, common_name))
+    return names
+
+
+def generate_self_signed_cert(cert_dir: str = "certs", common_name: str = "localhost", key_type: str = "rsa"):
     """
     Generate a self-signed certificate for local network development.
     
     Args:
         cert_dir: Directory to store certificates
-        common_name: Common name for the certificate (e.g., "192.168.1.100")
+        common_name: Common name for the certificate (e.g., "192.168.1.100");
+            an IP address is also added as an IP subjectAltName
+        key_type: "rsa" (RSA-2048) or "ecdsa" (P-256, much cheaper handshakes)
     """
+    if key_type not in KEY_TYPES:
+        raise ValueError(f"unknown key type: {key_type}")
     Path(cert_dir).mkdir(exist_ok=True)
     
-    cert_file = os.path.join(cert_dir, "cert.pem")
-    key_file = os.path.join(cert_dir, "key.pem")
+    cert_name, key_name = CERT_FILES[key_type]
+    cert_file = os.path.join(cert_dir, cert_name)
+    key_file = os.path.join(cert_dir, key_name)
+    san = _subject_alt_names(common_name)
     
     # Check if certificates already exist
     if os.path.exists(cert_file) and os.path.exists(key_file):
-        print(f"Certificates already exist in {cert_dir}")
+        event_log.emit('tls_certificate', f"Certificates already exist in {cert_dir}",
+                       action='exists', key_type=key_type, cert_file=cert_file)
         return cert_file, key_file
     
-    print(f"Generating self-signed certificate for {common_name}...")
+    event_log.emit('tls_certificate', f"Generating self-signed {key_type.upper()} certificate for {common_name}...",
+                   action='generating', key_type=key_type, common_name=common_name)
     
     try:
         # Use openssl to generate a self-signed cert
+        if key_type == "ecdsa":
+            newkey = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"]
+        else:
+            newkey = ["-newkey", "rsa:2048"]
         cmd = [
-            "openssl", "req", "-x509", "-newkey", "rsa:2048",
+            "openssl", "req", "-x509", *newkey,
             "-keyout", key_file, "-out", cert_file,
             "-days", "365", "-nodes",
-            "-subj", f"/CN={common_name}"
+            "-subj", f"/CN={common_name}",
+            "-addext", "subjectAltName=" + ",".join(f"{kind}:{value}" for kind, value in san)
         ]
         
         result = subprocess.run(cmd, capture_output=True, text=True)
         
         if result.returncode != 0:
-            print(f"OpenSSL error: {result.stderr}")
+            event_log.emit('tls_certificate', f"OpenSSL error: {result.stderr}", logging.ERROR,
+                           action='failed', key_type=key_type, error=result.stderr)
             return None, None
         
-        print(f"✓ Certificate generated: {cert_file}")
-        print(f"✓ Key generated: {key_file}")
+        event_log.emit('tls_certificate', f"✓ Certificate generated: {cert_file}\n✓ Key generated: {key_file}",
+                       action='generated', key_type=key_type, tool='openssl', cert_file=cert_file)
         return cert_file, key_file
         
     except FileNotFoundError:
-        print("OpenSSL not found. Trying alternative approach with pyopenssl...")
+        event_log.emit('tls_certificate', "OpenSSL not found. Trying alternative approach with pyopenssl...",
+                       logging.WARNING, action='openssl_missing', key_type=key_type)
         try:
             from cryptography import x509
             from cryptography.x509.oid import NameOID
             from cryptography.hazmat.primitives import hashes
             from cryptography.hazmat.backends import default_backend
-            from cryptography.hazmat.primitives.asymmetric import rsa
+            from cryptography.hazmat.primitives.asymmetric import ec, rsa
             from cryptography.hazmat.primitives import serialization
             from datetime import datetime, timedelta
-            import ipaddress
             
             # Generate private key
-            private_key = rsa.generate_private_key(
-                public_exponent=65537,
-                key_size=2048,
-                backend=default_backend()
-            )
+            if key_type == "ecdsa":
+                private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+            else:
+                private_key = rsa.generate_private_key(
+                    public_exponent=65537,
+                    key_size=2048,
+                    backend=default_backend()
+                )
             
             # Generate certificate
             subject = issuer = x509.Name([
@@ -81,8 +129,8 @@ def generate_self_signed_cert(cert_dir: str = "certs", common_name: str = "local
                 datetime.utcnow() + timedelta(days=365)
             ).add_extension(
                 x509.SubjectAlternativeName([
-                    x509.DNSName(common_name),
-                    x509.DNSName("localhost"),
+                    x509.IPAddress(ipaddress.ip_address(value)) if kind == 'IP' else x509.DNSName(value)
+                    for kind, value in san
                 ]),
                 critical=False,
             ).sign(private_key, hashes.SHA256(), default_backend())
@@ -95,22 +143,49 @@ def generate_self_signed_cert(cert_dir: str = "certs", common_name: str = "local
             with open(key_file, "wb") as f:
                 f.write(private_key.private_bytes(
                     encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.TraditionalOpenSSL,
+                    format=serialization.PrivateFormat.PKCS8,
                     encryption_algorithm=serialization.NoEncryption()
                 ))
             
-            print(f"✓ Certificate generated: {cert_file}")
-            print(f"✓ Key generated: {key_file}")
+            event_log.emit('tls_certificate', f"✓ Certificate generated: {cert_file}\n✓ Key generated: {key_file}",
+                           action='generated', key_type=key_type, tool='cryptography', cert_file=cert_file)
             return cert_file, key_file
             
         except ImportError:
-            print("cryptography library not found. Install with: pip install cryptography")
+            event_log.emit('tls_certificate', "cryptography library not found. Install with: pip install cryptography",
+                           logging.ERROR, action='failed', key_type=key_type, error='cryptography not installed')
             return None, None
         except Exception as e:
-            print(f"Error generating certificate: {e}")
+            event_log.emit('tls_certificate', f"Error generating certificate: {e}", logging.ERROR,
+                           action='failed', key_type=key_type, error=str(e))
             return None, None
 
 
+def build_ssl_context(cert_file: str, key_file: str) -> ssl.SSLContext:
+    """
+    Server SSLContext tuned for clients that reconnect constantly.
+
+    Phones polling the server open many short connections, so abbreviated
+    handshakes matter more than anything else: TLS 1.2 session IDs are kept
+    in OpenSSL's server-side session cache (on by default) and session
+    tickets are explicitly enabled, with TLS 1.3 tickets issued on every
+    full handshake. Ticket keys live in the context, so resumption works
+    for as long as the server process runs. Cipher order prefers ECDHE with
+    AES-GCM/ChaCha20, which pairs best with an ECDSA certificate.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert_file, key_file)
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    context.set_ciphers("ECDHE+AESGCM:ECDHE+CHACHA20:!aNULL")
+    return context
+
+
 if __name__ == "__main__":
-    # Auto-generate on import if running as main
-    generate_self_signed_cert()
+    parser = argparse.ArgumentParser(description="Generate a self-signed certificate for local HTTPS.")
+    parser.add_argument('--dir', default="certs", help='output directory (default: certs/)')
+    parser.add_argument('--cn', default="localhost", help='common name, e.g. the LAN IP address')
+    parser.add_argument('--key-type', choices=KEY_TYPES, default="rsa")
+    args = parser.parse_args()
+    generate_self_signed_cert(args.dir, common_name=args.cn, key_type=args.key_type)
@@ -0,0 +1,272 @@
+"""Atomic upload finalization: temp file, optional fsync (per file or grouped), rename."""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    from backend.event_log import event_log
+    from backend.scrubber import TEMP_PREFIX
+except ImportError:
+    from event_log import event_log
+    from scrubber import TEMP_PREFIX
+
+# Temp files (TEMP_PREFIX) are hidden from every listing by scrubber.is_partial_name
+
+DURABILITY_MODES = ('none', 'fsync', 'grouped')
+
+
+class PendingUpload:
+    """An upload being written to a temp file next to its final name."""
+
+    __slots__ = ('dest', 'temp', 'file', 'preallocated', 'size', 'replaced', 'error', 'done')
+
+    def __init__(self, dest: str, temp: str, file):
+        self.dest = dest
+        self.temp = temp
+        self.file = file
+        self.preallocated = False
+        self.size = 0
+        self.replaced = 0  # size of the file the rename replaced
+        self.error = None
+        self.done = None  # threading.Event while waiting for a grouped commit
+
+
+class UploadWriter:
+    """
+    Writes each upload to a hidden temp file in the destination folder and
+    renames it over the final name only once it is complete.
+
+    A crashed or failed upload therefore never leaves a truncated file under
+    a real name, and two uploads of the same name never interleave: the one
+    that finishes last wins whole. Leftover temp files are cleaned up by the
+    storage scrubber ('partial' findings).
+
+    Durability (persisted in durability_settings.json):
+        none:    rename only. Fastest; survives a crash of the server process,
+                 but after a power loss the newest uploads may be empty or gone
+        fsync:   every file's data, then its folder, is flushed to disk before
+                 the upload is acknowledged
+        grouped: as fsync, but uploads finishing within `group_window_ms` are
+                 committed together by one thread and each folder is flushed
+                 once per batch; same guarantee, fewer disk flushes, a little
+                 more latency per upload
+    When the upload size is known and at least `preallocate_min` bytes, the
+    temp file is preallocated so large files are written less fragmented.
+    """
+
+    DEFAULT_SETTINGS = {
+        'mode': 'fsync',
+        'group_window_ms': 20,
+        'group_max': 64,
+        'preallocate': True,
+        'preallocate_min': 4 * 1024 * 1024,
+    }
+
+    def __init__(self, settings_file: str = "durability_settings.json"):
+        self.settings_file = settings_file
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self._rename_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._batch = []  # type: List[PendingUpload]
+        self._committer = None
+        self.commits = 0
+        self.aborted = 0
+        self.file_syncs = 0
+        self.dir_syncs = 0
+        self.batches = 0
+        self.commit_seconds = 0.0
+        self.load_settings()
+
+    def load_settings(self):
+        """Load durability settings from persistent storage."""
+        if os.path.exists(self.settings_file):
+            try:
+                with open(self.settings_file, 'r') as f:
+                    self.settings.update(json.load(f))
+            except Exception:
+                pass
+
+    def save_settings(self):
+        """Save durability settings to persistent storage."""
+        try:
+            with open(self.settings_file, 'w') as f:
+                json.dump(self.settings, f, indent=2)
+        except Exception as e:
+            print(f"Failed to save durability settings: {e}")
+
+    def update_settings(self, changes: Dict) -> Dict:
+        """Apply admin changes live and persist them."""
+        settings = dict(self.settings)
+        if 'mode' in changes:
+            if changes['mode'] not in DURABILITY_MODES:
+                raise ValueError(f"mode must be one of {', '.join(DURABILITY_MODES)}")
+            settings['mode'] = changes['mode']
+        if 'preallocate' in changes:
+            settings['preallocate'] = bool(changes['preallocate'])
+        for key, cast in (('group_window_ms', float), ('group_max', int), ('preallocate_min', int)):
+            if key in changes:
+                settings[key] = cast(changes[key])
+                if settings[key] < (0 if key == 'group_window_ms' else 1):
+                    raise ValueError(f'{key} is out of range')
+        self.settings = settings
+        self.save_settings()
+        return self.get_status()
+
+    # ---- writing -------------------------------------------------------
+
+    def open(self, dest: str, size_hint: Optional[int] = None) -> PendingUpload:
+        """Create the temp file for `dest`; write to `.file`, then `commit` or `abort`."""
+        folder, name = os.path.split(dest)
+        # Keep the temp name within NAME_MAX even for long upload names
+        temp = os.path.join(folder, f'{TEMP_PREFIX}{secrets.token_hex(6)}-{name[-100:]}')
+        pending = PendingUpload(dest, temp, open(temp, 'xb'))
+        settings = self.settings
+        if (settings['preallocate'] and size_hint and size_hint >= settings['preallocate_min']
+                and hasattr(os, 'posix_fallocate')):
+            try:
+                os.posix_fallocate(pending.file.fileno(), 0, size_hint)
+                pending.preallocated = True
+            except OSError:
+                pass  # e.g. not supported by the filesystem, or too little space left
+        return pending
+
+    def abort(self, pending: PendingUpload):
+        """Throw away an unfinished upload."""
+        try:
+            pending.file.close()
+        except OSError:
+            pass
+        try:
+            os.remove(pending.temp)
+        except OSError:
+            pass
+        self.aborted += 1
+
+    def commit(self, pending: PendingUpload) -> PendingUpload:
+        """
+        Make the upload visible under its final name with the configured
+        durability; on return `size` and `replaced` are set. Raises OSError
+        (after removing the temp file) if the upload could not be finalized.
+        Once the rename has happened the upload counts as stored: a failure
+        to flush its folder afterwards is logged, not raised.
+        """
+        started = time.perf_counter()
+        mode = self.settings['mode']
+        try:
+            pending.size = pending.file.tell()
+            if pending.preallocated:
+                pending.file.truncate(pending.size)  # drop the unused preallocated tail
+            pending.file.flush()
+            if mode == 'grouped':
+                self._commit_grouped(pending)
+            else:
+                if mode == 'fsync':
+                    os.fsync(pending.file.fileno())
+                    self.file_syncs += 1
+                pending.file.close()
+                self._rename(pending)
+        except OSError:
+            self.abort(pending)
+            raise
+        if mode == 'fsync':
+            self._sync_dir_logged(os.path.dirname(pending.dest))
+        self.commits += 1
+        self.commit_seconds += time.perf_counter() - started
+        return pending
+
+    def _rename(self, pending: PendingUpload):
+        # Serialised so `replaced` is exact when the same name is uploaded twice at once
+        with self._rename_lock:
+            try:
+                pending.replaced = os.path.getsize(pending.dest)
+            except OSError:
+                pending.replaced = 0
+            os.replace(pending.temp, pending.dest)
+
+    def _sync_dir(self, folder: str):
+        """Persist a rename by flushing its folder (not possible on Windows)."""
+        if os.name == 'nt':
+            return
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            self.dir_syncs += 1
+        finally:
+            os.close(fd)
+
+    def _sync_dir_logged(self, folder: str):
+        """_sync_dir for folders whose uploads are already visible; failures are only logged."""
+        try:
+            self._sync_dir(folder)
+        except OSError as e:
+            event_log.emit('storage_error', f"Could not flush folder {folder}; recent uploads in it may "
+                           f"not survive a power loss: {e}", logging.WARNING, path=folder, error=str(e))
+
+    # ---- grouped commit ------------------------------------------------
+
+    def _commit_grouped(self, pending: PendingUpload):
+        pending.done = threading.Event()
+        with self._cond:
+            if self._committer is None:
+                self._committer = threading.Thread(target=self._commit_loop, name='upload-commit', daemon=True)
+                self._committer.start()
+            self._batch.append(pending)
+            self._cond.notify_all()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                while not self._batch:
+                    self._cond.wait()
+                # Give uploads finishing right now a moment to join the batch
+                deadline = time.monotonic() + self.settings['group_window_ms'] / 1000
+                while len(self._batch) < self.settings['group_max']:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                batch = self._batch[:self.settings['group_max']]
+                del self._batch[:len(batch)]
+
+            folders = set()
+            for pending in batch:
+                try:
+                    os.fsync(pending.file.fileno())
+                    self.file_syncs += 1
+                    pending.file.close()
+                    self._rename(pending)
+                    folders.add(os.path.dirname(pending.dest))
+                except OSError as e:
+                    pending.error = e
+            for folder in folders:
+                self._sync_dir_logged(folder)
+            self.batches += 1
+            for pending in batch:
+                pending.done.set()
+
+    def get_status(self) -> Dict:
+        """Settings and commit counters for the admin panel."""
+        with self._cond:
+            waiting = len(self._batch)
+        return {
+            'settings': dict(self.settings),
+            'commits': self.commits,
+            'aborted': self.aborted,
+            'file_syncs': self.file_syncs,
+            'dir_syncs': self.dir_syncs,
+            'batches': self.batches,
+            'waiting': waiting,
+            'avg_commit_ms': round(self.commit_seconds / self.commits * 1000, 2) if self.commits else None
+        }
+
+
+# Global instance used by the upload route
+upload_writer = UploadWriter()
@@ -1,11 +1,13 @@
 """QR code generation utility."""
 
 from io import BytesIO
-import qrcode
 
 
 def generate_qr_png_bytes(data: str, box_size: int = 10, border: int = 4) -> bytes:
     """Generate a QR code PNG as bytes for the provided data."""
+    # qrcode pulls in PIL; importing on first use keeps server startup fast
+    import qrcode
+
     qr = qrcode.QRCode(box_size=box_size, border=border)
     qr.add_data(data)
     qr.make(fit=True)
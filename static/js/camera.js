@@ -15,10 +15,30 @@ document.addEventListener('DOMContentLoaded', async ()=>{
   const photoCanvas = document.getElementById('photo-canvas');
   const photosGrid = document.getElementById('photos-grid');
   const fileList = document.getElementById('file-list');
+  const autoUploadToggle = document.getElementById('auto-upload-toggle');
 
   let stream = null;
   let cameraActive = false;
-  let capturedPhotos = [];
+  let capturedPhotos = [];  // {url, uploaded}
+
+  // Captures stay on the phone unless the user opts in to auto-upload
+  autoUploadToggle.checked = localStorage.getItem('cameraAutoUpload') === '1';
+  autoUploadToggle.addEventListener('change', ()=>{
+    localStorage.setItem('cameraAutoUpload', autoUploadToggle.checked ? '1' : '0');
+  });
+
+  const uploadLabel = uploadBtn.textContent;
+  const uploader = new UploadQueue({
+    url:`/api/storage/upload/${SESSION_TOKEN}`,
+    settingsUrl:'/api/storage/upload-settings',
+    onProgress: stats=>{ uploadBtn.textContent = UploadQueue.describe(stats) },
+    onFileError: (item, e)=> console.warn('Upload failed for', item.file.name, e),
+    onIdle: stats=>{
+      uploadBtn.textContent = uploadLabel;
+      if(stats.failed) alert(`${stats.failed} upload(s) failed`);
+      loadFiles();
+    }
+  });
 
   // Request permissions
   async function requestPermissions(){
@@ -60,19 +80,35 @@ document.addEventListener('DOMContentLoaded', async ()=>{
     photoCanvas.width = cameraFeed.videoWidth || 640;
     photoCanvas.height = cameraFeed.videoHeight || 480;
     ctx.drawImage(cameraFeed, 0, 0);
-    const dataUrl = photoCanvas.toDataURL('image/jpeg');
-    capturedPhotos.push(dataUrl);
+    const photo = {url: photoCanvas.toDataURL('image/jpeg'), uploaded: false};
+    capturedPhotos.push(photo);
     renderPhotos();
+    if(autoUploadToggle.checked) uploadPhoto(photo);
+  }
+
+  // Upload a capture, re-encoded at the size and quality the server advertises
+  async function uploadPhoto(photo){
+    photo.uploaded = true;
+    renderPhotos();
+    const blob = await (await fetch(photo.url)).blob();
+    const file = new File([blob], `photo-${Date.now()}.jpg`, {type:'image/jpeg'});
+    uploader.add(file, {capture:true}).catch(()=>{
+      photo.uploaded = false;
+      renderPhotos();
+    });
   }
 
   function renderPhotos(){
     if(capturedPhotos.length === 0){
       photosGrid.innerHTML = '<div style="padding:12px; color:rgba(230,238,248,0.5); font-size:13px;">No photos yet</div>';
     }else{
-      photosGrid.innerHTML = capturedPhotos.map((url, i)=>`
+      photosGrid.innerHTML = capturedPhotos.map((photo, i)=>`
         <div style="position:relative; border-radius:8px; overflow:hidden; background:#000;">
-          <img src="${url}" style="width:100%; height:120px; object-fit:cover; cursor:pointer;" onclick="downloadPhoto(${i})">
-          <button onclick="deletePhoto(${i})" style="position:absolute; top:4px; right:4px; background:rgba(0,0,0,0.7); color:#fff; border:none; border-radius:4px; padding:4px 6px; cursor:pointer; font-size:11px;">Del</button>
+          <img src="${photo.url}" style="width:100%; height:120px; object-fit:cover; cursor:pointer;" onclick="downloadPhoto(${i})">
+          <button onclick="deletePhoto(${i})" title="${photo.uploaded ? 'Remove from this page (the uploaded copy stays on the server)' : 'Delete'}" style="position:absolute; top:4px; right:4px; background:rgba(0,0,0,0.7); color:#fff; border:none; border-radius:4px; padding:4px 6px; cursor:pointer; font-size:11px;">Del</button>
+          ${photo.uploaded
+            ? '<span style="position:absolute; bottom:4px; left:4px; background:rgba(0,0,0,0.7); color:#fff; border-radius:4px; padding:2px 6px; font-size:11px;">Uploaded</span>'
+            : `<button onclick="uploadCapturedPhoto(${i})" style="position:absolute; bottom:4px; left:4px; background:rgba(0,0,0,0.7); color:#fff; border:none; border-radius:4px; padding:4px 6px; cursor:pointer; font-size:11px;">Upload</button>`}
         </div>
       `).join('');
     }
@@ -80,12 +116,20 @@ document.addEventListener('DOMContentLoaded', async ()=>{
 
   window.downloadPhoto = (idx)=>{
     const a = document.createElement('a');
-    a.href = capturedPhotos[idx];
+    a.href = capturedPhotos[idx].url;
     a.download = `photo-${Date.now()}.jpg`;
     a.click();
   };
 
+  window.uploadCapturedPhoto = (idx)=>{
+    const photo = capturedPhotos[idx];
+    if(photo && !photo.uploaded) uploadPhoto(photo);
+  };
+
   window.deletePhoto = (idx)=>{
+    // Deleting here only drops the local copy; an uploaded copy is kept on the server
+    if(capturedPhotos[idx].uploaded &&
+       !confirm('Remove this photo from this page?\n\nIt has already been uploaded: the copy on the server is NOT deleted.')) return;
     capturedPhotos.splice(idx, 1);
     renderPhotos();
   };
@@ -124,20 +168,11 @@ document.addEventListener('DOMContentLoaded', async ()=>{
     else requestPermissions();
   });
 
-  uploadBtn.addEventListener('click', async ()=>{
+  uploadBtn.addEventListener('click', ()=>{
     const files = fileInput.files;
     if(!files || files.length===0) return alert('Select files first');
-    for(let i=0; i<files.length; i++){
-      const form = new FormData();
-      form.append('file', files[i]);
-      try{
-        const res = await fetch(`/api/storage/upload/${SESSION_TOKEN}`, {method:'POST', body:form});
-        const j = await res.json();
-        if(j.error) alert('Upload error: '+j.error);
-      }catch(e){console.error(e); alert('Upload failed');}
-    }
+    for(const file of Array.from(files)) uploader.add(file).catch(()=>{});
     fileInput.value = '';
-    await loadFiles();
   });
 
   refreshFilesBtn.addEventListener('click', loadFiles);
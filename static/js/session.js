@@ -9,6 +9,19 @@ document.addEventListener('DOMContentLoaded', ()=>{
   const uploadBtn = document.getElementById('upload-btn');
   const uploadedList = document.getElementById('uploaded-list');
 
+  const uploadLabel = uploadBtn.textContent;
+  let lastUploadError = '';
+  const uploader = new UploadQueue({
+    url:`/upload/${SESSION_TOKEN}`,
+    onProgress: stats=>{ uploadBtn.textContent = UploadQueue.describe(stats) },
+    onFileError: (item, e)=>{ lastUploadError = `${item.file.name}: ${e.message}` },
+    onIdle: stats=>{
+      uploadBtn.textContent = uploadLabel;
+      if(stats.failed) alert(`${stats.failed} upload(s) failed (${lastUploadError})`);
+      pollFiles();
+    }
+  });
+
   function show(v){
     storageView.style.display = v==='storage' ? '' : 'none';
     permissionView.style.display = v==='permission' ? '' : 'none';
@@ -36,19 +49,10 @@ document.addEventListener('DOMContentLoaded', ()=>{
     }catch(e){ console.error(e) }
   }
 
-  uploadBtn.addEventListener('click', async ()=>{
+  uploadBtn.addEventListener('click', ()=>{
     const files = fileInput.files;
     if(!files || files.length===0) return alert('Select files first');
-    for(let i=0;i<files.length;i++){
-      const form = new FormData();
-      form.append('file', files[i]);
-      try{
-        const res = await fetch(`/upload/${SESSION_TOKEN}`, { method:'POST', body: form });
-        const j = await res.json();
-        if(j.error) alert('Upload error: '+j.error);
-      }catch(e){ console.error(e); alert('Upload failed') }
-    }
-    await pollFiles();
+    for(const file of Array.from(files)) uploader.add(file).catch(()=>{});
   });
 
   // start on storage view
@@ -5,6 +5,21 @@ document.addEventListener('DOMContentLoaded', async ()=>{
   const backBtn = document.getElementById('back-btn');
   const refreshBtn = document.getElementById('refresh-btn');
 
+  const uploadLabel = uploadBtn.textContent;
+  let lastUploadError = '';
+  const uploader = new UploadQueue({
+    url:`/api/storage/upload/${SESSION_TOKEN}`,
+    settingsUrl:'/api/storage/upload-settings',
+    onProgress: stats=>{ uploadBtn.textContent = UploadQueue.describe(stats) },
+    onFileError: (item, e)=>{ lastUploadError = `${item.file.name}: ${e.message}` },
+    onIdle: stats=>{
+      uploadBtn.textContent = uploadLabel;
+      if(stats.failed) alert(`${stats.failed} upload(s) failed (${lastUploadError})`);
+      loadFiles();
+      loadStats();
+    }
+  });
+
   async function loadFiles(){
     try{
       const res = await fetch(`/api/storage/list/${SESSION_TOKEN}`);
@@ -34,21 +49,11 @@ document.addEventListener('DOMContentLoaded', async ()=>{
     }catch(e){console.error(e);}
   }
 
-  uploadBtn.addEventListener('click', async ()=>{
+  uploadBtn.addEventListener('click', ()=>{
     const files = fileInput.files;
     if(!files || files.length===0) return alert('Select files first');
-    for(let i=0;i<files.length;i++){
-      const form = new FormData();
-      form.append('file', files[i]);
-      try{
-        const res = await fetch(`/api/storage/upload/${SESSION_TOKEN}`, {method:'POST', body:form});
-        const j = await res.json();
-        if(j.error) alert('Upload error: '+j.error);
-      }catch(e){console.error(e); alert('Upload failed');}
-    }
+    for(const file of Array.from(files)) uploader.add(file).catch(()=>{});
     fileInput.value = '';
-    await loadFiles();
-    await loadStats();
   });
 
   refreshBtn.addEventListener('click', ()=>{
@@ -0,0 +1,179 @@
+/**Shared upload engine: bounded parallel queue, optional client-side downscale, progress and retry*/
+(function(){
+  // Used when the server does not advertise settings (e.g. the standalone app.py)
+  const DEFAULTS = {concurrency:3, max_retries:4, downscale:false, max_dimension:2048, quality:0.85};
+  // Quota (413) and full disk (507) fail every later upload too, so they stop the queue
+  const FATAL = [413, 507];
+  const settingsCache = {};
+
+  function loadSettings(url){
+    if(!url) return Promise.resolve({...DEFAULTS});
+    if(!settingsCache[url]){
+      settingsCache[url] = fetch(url)
+        .then(res=> res.ok ? res.json() : {})
+        .then(s=> ({...DEFAULTS, ...s}))
+        .catch(()=> ({...DEFAULTS}));
+    }
+    return settingsCache[url];
+  }
+
+  function retryable(status){
+    return status === 0 || status === 408 || status === 429 || (status >= 500 && !FATAL.includes(status));
+  }
+
+  function backoff(attempt, retryAfter){
+    const seconds = parseFloat(retryAfter);
+    if(!isNaN(seconds)) return seconds * 1000;
+    // Exponential with jitter so phones retrying together do not collide again
+    return Math.min(30000, 1000 * 2 ** attempt) * (0.5 + Math.random() / 2);
+  }
+
+  const sleep = ms => new Promise(r=> setTimeout(r, ms));
+
+  // Re-encode a JPEG (or a camera capture) at the advertised size and quality;
+  // keeps the original if it is not an image we can decode or would not shrink
+  async function prepare(file, settings, force){
+    if(!(force || settings.downscale)) return file;
+    if(!/^image\/jpeg$/.test(file.type) || typeof createImageBitmap !== 'function') return file;
+    try{
+      const bitmap = await createImageBitmap(file);
+      const scale = Math.min(1, settings.max_dimension / Math.max(bitmap.width, bitmap.height));
+      const canvas = document.createElement('canvas');
+      canvas.width = Math.round(bitmap.width * scale);
+      canvas.height = Math.round(bitmap.height * scale);
+      canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+      if(bitmap.close) bitmap.close();
+      const blob = await new Promise(r=> canvas.toBlob(r, 'image/jpeg', settings.quality));
+      if(!blob || (!force && blob.size >= file.size)) return file;
+      return new File([blob], file.name, {type:'image/jpeg', lastModified:file.lastModified || Date.now()});
+    }catch(e){
+      console.warn('Downscale skipped for', file.name, e);
+      return file;
+    }
+  }
+
+  // XHR rather than fetch: only XHR reports upload progress
+  function send(url, form, onProgress){
+    return new Promise(resolve=>{
+      const xhr = new XMLHttpRequest();
+      xhr.open('POST', url);
+      xhr.upload.onprogress = e=>{ if(e.lengthComputable) onProgress(e.loaded) };
+      xhr.onload = ()=>{
+        let body = {};
+        try{ body = JSON.parse(xhr.responseText) }catch(e){}
+        resolve({status:xhr.status, body, retryAfter:xhr.getResponseHeader('Retry-After')});
+      };
+      xhr.onerror = xhr.ontimeout = ()=> resolve({status:0, body:{}, retryAfter:null});
+      xhr.send(form);
+    });
+  }
+
+  /**
+   * new UploadQueue({url, settingsUrl, onProgress, onFileDone, onFileError, onIdle})
+   *   url:         upload endpoint
+   *   settingsUrl: where concurrency/retry/downscale settings are advertised
+   *   onProgress(stats), onFileDone(item, body), onFileError(item, error), onIdle(stats)
+   * queue.add(file, {relativePath, capture}) resolves with the server's JSON
+   * or rejects with an Error carrying .status; capture:true always re-encodes.
+   */
+  class UploadQueue {
+    constructor(opts){
+      this.opts = opts;
+      this.settings = loadSettings(opts.settingsUrl);
+      this.pending = [];
+      this.active = 0;
+      this.halted = null;
+      this.resetStats();
+    }
+
+    resetStats(){
+      this.stats = {total:0, done:0, failed:0, bytesTotal:0, bytesSent:0};
+    }
+
+    add(file, options = {}){
+      if(this.active === 0 && this.pending.length === 0){
+        this.resetStats();
+        this.halted = null;
+      }
+      return new Promise((resolve, reject)=>{
+        const item = {file, options, resolve, reject, sent:0, size:file.size};
+        this.stats.total += 1;
+        this.stats.bytesTotal += file.size;
+        this.pending.push(item);
+        this.report();
+        this.pump();
+      });
+    }
+
+    async pump(){
+      const settings = await this.settings;
+      while(this.active < settings.concurrency && this.pending.length){
+        this.active += 1;
+        this.run(this.pending.shift(), settings).finally(()=>{
+          this.active -= 1;
+          this.pump();
+          if(this.active === 0 && this.pending.length === 0 && this.opts.onIdle) this.opts.onIdle({...this.stats});
+        });
+      }
+    }
+
+    async run(item, settings){
+      if(this.halted) return this.fail(item, this.halted);
+      const file = await prepare(item.file, settings, item.options.capture);
+      this.stats.bytesTotal += file.size - item.size;
+      item.size = file.size;
+
+      for(let attempt = 0; ; attempt++){
+        const form = new FormData();
+        form.append('file', file, file.name);
+        if(item.options.relativePath) form.append('relative_path', item.options.relativePath);
+        const res = await send(this.opts.url, form, loaded=>{
+          this.stats.bytesSent += loaded - item.sent;
+          item.sent = loaded;
+          this.report();
+        });
+        if(res.status >= 200 && res.status < 300 && !res.body.error){
+          this.stats.bytesSent += item.size - item.sent;
+          this.stats.done += 1;
+          this.report();
+          if(this.opts.onFileDone) this.opts.onFileDone(item, res.body);
+          return item.resolve(res.body);
+        }
+        // Progress of the failed attempt is sent again
+        this.stats.bytesSent -= item.sent;
+        item.sent = 0;
+        const error = new Error(res.body.error || (res.status ? `HTTP ${res.status}` : 'network error'));
+        error.status = res.status;
+        if(FATAL.includes(res.status)){
+          this.halted = error;
+          return this.fail(item, error);
+        }
+        if(!retryable(res.status) || attempt >= settings.max_retries) return this.fail(item, error);
+        await sleep(backoff(attempt, res.retryAfter));
+        if(this.halted) return this.fail(item, this.halted);
+      }
+    }
+
+    fail(item, error){
+      this.stats.failed += 1;
+      this.stats.bytesTotal -= item.size;
+      this.report();
+      if(this.opts.onFileError) this.opts.onFileError(item, error);
+      item.reject(error);
+    }
+
+    report(){
+      if(this.opts.onProgress) this.opts.onProgress({...this.stats, active:this.active, queued:this.pending.length});
+    }
+  }
+
+  // "Uploading 3/10 · 45%" style summary for a button or status line
+  UploadQueue.describe = stats=>{
+    const finished = stats.done + stats.failed;
+    if(finished === stats.total) return stats.failed ? `${stats.done} uploaded, ${stats.failed} failed` : `${stats.done} uploaded`;
+    const percent = stats.bytesTotal ? Math.floor(stats.bytesSent / stats.bytesTotal * 100) : 0;
+    return `Uploading ${finished + 1}/${stats.total} · ${percent}%`;
+  };
+
+  window.UploadQueue = UploadQueue;
+})();